@@ -0,0 +1,60 @@
+import functools
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cruds import car, garage, maintenance, reports
+
+# Async versions of the CRUD functions. The CRUD logic is written once against a sync Session:
+# with an AsyncSession it runs through AsyncSession.run_sync on the async driver, with a sync
+# Session it runs in the threadpool. Either way the event loop never waits on database I/O.
+
+
+async def run_db(db, fn, *args, **kwargs):
+    """Run ``fn(session, *args, **kwargs)`` without blocking the event loop."""
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+
+def _async(fn):
+    @functools.wraps(fn)
+    async def wrapper(db, *args, **kwargs):
+        return await run_db(db, fn, *args, **kwargs)
+    return wrapper
+
+
+# Cars
+create_car = _async(car.create_car)
+create_cars = _async(car.create_cars)
+get_car = _async(car.get_car)
+get_cars = _async(car.get_cars)
+search_cars = _async(car.search_cars)
+update_car = _async(car.update_car)
+delete_car = _async(car.delete_car)
+
+# Garages
+create_garage = _async(garage.create_garage)
+get_garage = _async(garage.get_garage)
+get_garages = _async(garage.get_garages)
+update_garage = _async(garage.update_garage)
+delete_garage = _async(garage.delete_garage)
+update_garage_cars = _async(garage.update_garage_cars)
+
+# Maintenance requests
+create_maintenance_request = _async(maintenance.create_maintenance_request)
+create_maintenance_requests = _async(maintenance.create_maintenance_requests)
+get_maintenance_request = _async(maintenance.get_maintenance_request)
+get_maintenance_request_row = _async(maintenance.get_maintenance_request_row)
+get_maintenance_requests = _async(maintenance.get_maintenance_requests)
+get_maintenance_request_rows = _async(maintenance.get_maintenance_request_rows)
+update_maintenance_request = _async(maintenance.update_maintenance_request)
+delete_maintenance_request = _async(maintenance.delete_maintenance_request)
+reschedule_maintenance_requests = _async(maintenance.reschedule_maintenance_requests)
+is_garage_full = _async(maintenance.is_garage_full)
+
+# Reports
+get_monthly_requests_report = _async(reports.get_monthly_requests_report)
+get_daily_availability_report = _async(reports.get_daily_availability_report)
+get_availability_matrix = _async(reports.get_availability_matrix)
+get_next_available_slots = _async(reports.get_next_available_slots)
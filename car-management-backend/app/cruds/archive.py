@@ -0,0 +1,155 @@
+import argparse
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, func, select, tuple_
+from sqlalchemy.orm import Session
+
+from app.cruds.occupancy import add_booked, prune_slots
+from app.cruds.occupancy_index import occupancy_index
+from app.cruds.report_cache import bump_report_versions, report_cache
+from app.cruds.utils import chunked, insert_ignore
+from app.models.maintenance import ArchivedMaintenanceRequest, MaintenanceRequest
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Pause between two batches, so the writes of the API get the database in between
+ARCHIVE_BATCH_PAUSE_SECONDS = 0.05
+
+
+def archive_cutoff(days: int) -> date:
+    """First day kept in maintenance_requests when requests older than ``days`` days are archived."""
+    return date.today() - timedelta(days=days)
+
+
+def archive_watermark(db: Session) -> Optional[date]:
+    """Latest scheduled date of the archive, None while it is empty. One seek of its date index."""
+    return db.scalar(select(func.max(ArchivedMaintenanceRequest.scheduled_date)))
+
+
+def reaches_archive(db: Session, start_date=None) -> bool:
+    """Whether a listing or report starting at ``start_date`` (None: the beginning) needs the archive."""
+    if start_date is not None:
+        try:
+            start_date = date.fromisoformat(str(start_date))
+        except ValueError:
+            start_date = None
+    # Only past days are ever archived
+    if start_date is not None and start_date >= date.today():
+        return False
+    watermark = archive_watermark(db)
+    return watermark is not None and (start_date is None or start_date <= watermark)
+
+
+def archive_requests(db: Session, before: date, batch_size: int = settings.archive_batch_size) -> int:
+    """
+    Move the requests scheduled before ``before`` into maintenance_requests_archive and drop their occupancy
+    counters, oldest first, committing every ``batch_size`` requests so no write lock is held for long.
+    Only the requests copied by this transaction are deleted, so several processes can run it at once and a
+    request whose id the archive already holds stays in maintenance_requests.
+    Returns the number of requests archived.
+    """
+    hot = MaintenanceRequest.__table__
+    archive = ArchivedMaintenanceRequest.__table__
+    columns = [column.name for column in archive.columns]
+
+    archived, skipped, last = 0, 0, None
+    while True:
+        # Continue after the last request seen, the skipped ones would be selected again otherwise
+        query = select(hot.c.id, hot.c.scheduled_date).where(hot.c.scheduled_date < before)
+        if last is not None:
+            query = query.where(tuple_(hot.c.scheduled_date, hot.c.id) > tuple_(*last))
+        batch = db.execute(
+            query.order_by(hot.c.scheduled_date, hot.c.id).limit(batch_size).with_for_update()
+        ).all()
+        if not batch:
+            db.rollback()
+            break
+        last = batch[-1].scheduled_date, batch[-1].id
+
+        removed = Counter()
+        for chunk in chunked(request_id for request_id, _ in batch):
+            copied = db.scalars(
+                insert_ignore(db, archive)
+                .from_select(
+                    columns,
+                    # Checked again: the INSERT opens the write transaction, a request may have been moved since
+                    select(*(hot.c[name] for name in columns)).where(hot.c.id.in_(chunk), hot.c.scheduled_date < before),
+                )
+                .returning(archive.c.id)
+            ).all()
+            skipped += len(chunk) - len(copied)
+            if copied:
+                removed.update(
+                    (garage_id, scheduled_date)
+                    for garage_id, scheduled_date in db.execute(
+                        delete(hot).where(hot.c.id.in_(copied)).returning(hot.c.garage_id, hot.c.scheduled_date)
+                    )
+                )
+        increments = {slot: -count for slot, count in removed.items()}
+        add_booked(db, increments)
+        prune_slots(db, increments)
+        garage_ids = {garage_id for garage_id, _ in increments}
+        bump_report_versions(db, garage_ids)
+        db.commit()
+        occupancy_index.apply(increments)
+        report_cache.invalidate(garage_ids)
+
+        archived += sum(removed.values())
+        if len(batch) < batch_size:
+            break
+        time.sleep(ARCHIVE_BATCH_PAUSE_SECONDS)
+    if skipped:
+        # Archived by another process meanwhile, or an id reused before maintenance_requests had AUTOINCREMENT
+        logger.warning("%d maintenance requests not archived, their id is already in the archive", skipped)
+    return archived
+
+
+def start_archiver(session_factory, days: int, interval_seconds: float) -> threading.Thread:
+    """Archive the requests older than ``days`` days now and every ``interval_seconds`` in a daemon thread."""
+
+    def run():
+        while True:
+            try:
+                with session_factory() as db:
+                    archived = archive_requests(db, archive_cutoff(days))
+                if archived:
+                    logger.info("Archived %d maintenance requests older than %d days", archived, days)
+            except Exception:
+                logger.exception("Archiving maintenance requests failed")
+            time.sleep(interval_seconds)
+
+    thread = threading.Thread(target=run, name="maintenance-archiver", daemon=True)
+    thread.start()
+    return thread
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move the maintenance requests older than a number of days to the archive.")
+    parser.add_argument(
+        "--days", type=int, default=settings.archive_after_days or None, required=not settings.archive_after_days,
+        help="archive the requests scheduled more than this many days ago (default: ARCHIVE_AFTER_DAYS)",
+    )
+    parser.add_argument("--batch-size", type=int, default=settings.archive_batch_size, help="requests moved per transaction")
+    args = parser.parse_args(argv)
+    if args.days < 1 or args.batch_size < 1:
+        parser.error("--days and --batch-size must be positive")
+
+    import app.models.car  # noqa: F401, the Garage relationships refer to Car
+    from app.models.database import SessionLocal
+
+    cutoff = archive_cutoff(args.days)
+    with SessionLocal() as db:
+        archived = archive_requests(db, cutoff, args.batch_size)
+    print(f"{archived} maintenance requests scheduled before {cutoff} archived", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,15 @@
 from datetime import datetime
+from typing import List
 
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session, selectinload
 from app.models.car import Car
+from app.models.car_garage_association import car_garage_association
 from app.models.garage import Garage
 from app.schemas.car import CarCreate, CarUpdate
-from app.cruds.utils import get_or_404, update_relationship
+from app.cruds.search import index_car, index_cars, matching_car_ids, ranked_car_ids, search_enabled, unindex_cars
+from app.cruds.utils import chunked, get_or_404, paginate, update_relationship
 
 from datetime import datetime
 
@@ -26,27 +30,122 @@ def create_car(db: Session, car):
             raise ValueError("One or more garage IDs do not exist.")
         db_car.garages.extend(garages)  # Assuming a relationship like `garages = relationship("Garage")`
 
-    # Save the car in the database
+    # Save the car in the database, along with its search index entry
     db.add(db_car)
+    db.flush()
+    index_car(db, db_car)
+    db.commit()
+    return get_car(db, db_car.id)
+
+def create_cars(db: Session, cars: List[CarCreate]):
+    """
+    Create a batch of cars in one transaction.
+    Garage IDs and license plates are validated with a few set-based queries for the whole batch;
+    invalid items are skipped and reported by their index in the batch.
+    """
+    current_year = datetime.now().year
+    garage_ids = {garage_id for car in cars for garage_id in car.garage_ids}
+    plates = {car.license_plate for car in cars}
+
+    existing_garages = set()
+    for chunk in chunked(garage_ids):
+        existing_garages.update(garage_id for (garage_id,) in db.query(Garage.id).filter(Garage.id.in_(chunk)))
+    taken_plates = set()
+    for chunk in chunked(plates):
+        taken_plates.update(plate for (plate,) in db.query(Car.license_plate).filter(Car.license_plate.in_(chunk)))
+
+    accepted, errors = [], []
+    for index, car in enumerate(cars):
+        if car.production_year > current_year:
+            errors.append({"index": index, "detail": "Production year cannot be in the future."})
+        elif not existing_garages.issuperset(car.garage_ids):
+            errors.append({"index": index, "detail": "One or more garage IDs do not exist."})
+        elif car.license_plate in taken_plates:
+            errors.append({"index": index, "detail": f"License plate {car.license_plate} already exists."})
+        else:
+            taken_plates.add(car.license_plate)
+            accepted.append(car)
+
+    if not accepted:
+        return [], errors
+
+    # One executemany INSERT, then resolve the new ids through the unique license plates
+    db.execute(insert(Car), [car.dict(exclude={"garage_ids"}) for car in accepted])
+    ids_by_plate = {}
+    for chunk in chunked(car.license_plate for car in accepted):
+        ids_by_plate.update(
+            (plate, car_id) for car_id, plate in db.query(Car.id, Car.license_plate).filter(Car.license_plate.in_(chunk))
+        )
+    car_ids = sorted(ids_by_plate.values())
+    links = [
+        {"car_id": ids_by_plate[car.license_plate], "garage_id": garage_id}
+        for car in accepted
+        for garage_id in set(car.garage_ids)
+    ]
+    if links:
+        db.execute(insert(car_garage_association), links)
+    index_cars(db, [
+        {"id": ids_by_plate[car.license_plate], "make": car.make, "model": car.model, "license_plate": car.license_plate}
+        for car in accepted
+    ])
     db.commit()
-    db.refresh(db_car)
-    return db_car
+
+    created = []
+    for chunk in chunked(car_ids):
+        created.extend(db.query(Car).options(selectinload(Car.garages)).filter(Car.id.in_(chunk)).order_by(Car.id))
+    return created, errors
+
 
 def get_car(db: Session, car_id: int):
-    return get_or_404(db, Car, car_id, "Car not found")
+    # Load the garages with the car, so the response can be built without further queries
+    car = db.query(Car).options(selectinload(Car.garages)).filter(Car.id == car_id).first()
+    if not car:
+        raise HTTPException(status_code=404, detail="Car not found")
+    return car
 
 
-def get_cars(db: Session, make: str = None, garage_id: int = None, from_year: int = None, to_year: int = None):
-    query = db.query(Car)
-    if make:
+def get_cars(
+    db: Session,
+    make: str = None,
+    garage_id: int = None,
+    from_year: int = None,
+    to_year: int = None,
+    limit: int = None,
+    after: str = None,
+):
+    # Load the garages of the whole page in one more SELECT on the association primary key; a joined eager load
+    # makes SQLite materialize the association table for the LIMIT subquery
+    query = db.query(Car).options(selectinload(Car.garages))
+    if make and search_enabled(db):
+        query = query.filter(Car.id.in_(matching_car_ids(make, "make")))
+    elif make:
         query = query.filter(Car.make.ilike(f"%{make}%"))
     if garage_id:
-        query = query.filter(Car.garages.any(Garage.id == garage_id))
+        # IN over the association table is driven by its garage_id index, EXISTS would probe it once per car
+        query = query.filter(
+            Car.id.in_(
+                select(car_garage_association.c.car_id).where(car_garage_association.c.garage_id == garage_id)
+            )
+        )
     if from_year:
         query = query.filter(Car.production_year >= from_year)
     if to_year:
         query = query.filter(Car.production_year <= to_year)
-    return query.all()
+    return paginate(query, [Car.id], limit, after)
+
+
+def search_cars(db: Session, text: str, limit: int):
+    """Full-text prefix search over make, model and license plate, best match first."""
+    if search_enabled(db):
+        car_ids = ranked_car_ids(db, text, limit)
+        cars = {car.id: car for car in db.query(Car).options(selectinload(Car.garages)).filter(Car.id.in_(car_ids))}
+        return [cars[car_id] for car_id in car_ids if car_id in cars]
+
+    pattern = f"%{text}%"
+    query = db.query(Car).options(selectinload(Car.garages)).filter(
+        Car.make.ilike(pattern) | Car.model.ilike(pattern) | Car.license_plate.ilike(pattern)
+    )
+    return query.order_by(Car.id).limit(limit).all()
 
 
 def update_car(db: Session, car_id: int, car: CarUpdate):
@@ -55,13 +154,14 @@ def update_car(db: Session, car_id: int, car: CarUpdate):
         setattr(db_car, key, value)
     if car.garage_ids:
         update_relationship(db, db_car, "garages", Garage, car.garage_ids)
+    index_car(db, db_car)
     db.commit()
-    db.refresh(db_car)
-    return db_car
+    return get_car(db, car_id)
 
 
 def delete_car(db: Session, car_id: int):
     db_car = get_or_404(db, Car, car_id, "Car not found")
     db.delete(db_car)
+    unindex_cars(db, [car_id])
     db.commit()
     return db_car
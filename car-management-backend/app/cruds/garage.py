@@ -1,8 +1,18 @@
+from typing import List
+
 from fastapi import HTTPException
+from sqlalchemy import delete, literal, select
 from sqlalchemy.orm import Session
 
-from app.cruds.utils import get_or_404
+from app.cruds.garage_cache import bump_garages_version, garage_cache, get_garage_or_404
+from app.cruds.occupancy_index import occupancy_index
+from app.cruds.report_cache import bump_report_versions, report_cache
+from app.cruds.search import garage_filter, index_garage, unindex_garage
+from app.cruds.utils import chunked, get_or_404, insert_ignore, paginate
+from app.models.car import Car
+from app.models.car_garage_association import car_garage_association
 from app.models.garage import Garage
+from app.models.occupancy import GarageOccupancy
 from app.schemas.garage import GarageCreate, GarageUpdate
 
 
@@ -11,27 +21,47 @@ def create_garage(db: Session, garage: GarageCreate):
         raise HTTPException(status_code=400, detail="Capacity must be positive.")
     db_garage = Garage(**garage.dict())
     db.add(db_garage)
+    db.flush()
+    index_garage(db, db_garage)
+    bump_garages_version(db)
     db.commit()
+    garage_cache.invalidate()
     db.refresh(db_garage)
     return db_garage
 
 
 def get_garage(db: Session, garage_id: int):
-    return get_or_404(db, Garage, garage_id, "Garage not found")
+    return get_garage_or_404(db, garage_id, "Garage not found")
+
 
+def get_garages(db: Session, city: str = None, name: str = None, limit: int = None, after: str = None):
+    """A page of garages, served from the garage cache when it holds it."""
+    return garage_cache.listing(
+        db, (city, name, limit, after), lambda: query_garages(db, city, name, limit, after)
+    )
 
-def get_garages(db: Session, city: str = None):
+
+def query_garages(db: Session, city: str = None, name: str = None, limit: int = None, after: str = None):
     query = db.query(Garage)
+    # City and name lookups go through the full-text index when there is one
     if city:
-        query = query.filter(Garage.city.ilike(f"%{city}%"))
-    return query.all()
+        query = query.filter(garage_filter(db, city, "city"))
+    if name:
+        query = query.filter(garage_filter(db, name, "name"))
+    return paginate(query, [Garage.id], limit, after)
 
 
 def update_garage(db: Session, garage_id: int, garage: GarageUpdate):
     db_garage = get_or_404(db, Garage, garage_id, "Garage not found")
     for key, value in garage.dict(exclude_unset=True).items():
         setattr(db_garage, key, value)
+    index_garage(db, db_garage)
+    bump_garages_version(db)
+    bump_report_versions(db, [garage_id])
     db.commit()
+    garage_cache.invalidate()
+    # Capacity feeds the availability reports
+    report_cache.invalidate([garage_id])
     db.refresh(db_garage)
     return db_garage
 
@@ -39,5 +69,40 @@ def update_garage(db: Session, garage_id: int, garage: GarageUpdate):
 def delete_garage(db: Session, garage_id: int):
     db_garage = get_or_404(db, Garage, garage_id, "Garage not found")
     db.delete(db_garage)
+    unindex_garage(db, garage_id)
+    # Drop the garage's occupancy counters so a reused id starts from an empty calendar
+    db.query(GarageOccupancy).filter(GarageOccupancy.garage_id == garage_id).delete(synchronize_session=False)
+    bump_garages_version(db)
+    bump_report_versions(db, [garage_id])
     db.commit()
+    garage_cache.invalidate()
+    report_cache.invalidate([garage_id])
+    occupancy_index.drop_garage(garage_id)
     return db_garage
+
+
+def update_garage_cars(db: Session, garage_id: int, attach: List[int], detach: List[int]) -> dict:
+    """
+    Attach cars to a garage and detach others, in one transaction.
+    Set-based: one INSERT ... SELECT and one DELETE per chunk of car IDs, whatever the number of cars.
+    Unknown cars and links that already exist (or do not) are skipped; the counts are of changed links.
+    """
+    if set(attach) & set(detach):
+        raise HTTPException(status_code=400, detail="A car cannot be both attached and detached.")
+    get_garage_or_404(db, garage_id, "Garage not found")
+
+    table = car_garage_association
+    detached = 0
+    for chunk in chunked(set(detach)):
+        detached += db.execute(
+            delete(table).where(table.c.garage_id == garage_id, table.c.car_id.in_(chunk))
+        ).rowcount
+    attached = 0
+    for chunk in chunked(set(attach)):
+        # Only existing cars are linked, links already present are left alone
+        cars = select(Car.id, literal(garage_id)).where(Car.id.in_(chunk))
+        attached += db.execute(
+            insert_ignore(db, table).from_select(["car_id", "garage_id"], cars)
+        ).rowcount
+    db.commit()
+    return {"garageId": garage_id, "attached": attached, "detached": detached}
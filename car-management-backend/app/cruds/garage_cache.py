@@ -0,0 +1,148 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from app.cruds.utils import chunked, insert_ignore
+from app.models.cache_version import CacheVersion
+from app.models.garage import Garage
+from app.settings import settings
+
+# Name of the garages row in cache_versions
+GARAGES_VERSION = "garages"
+
+
+class GarageSnapshot(NamedTuple):
+    """Detached copy of a garage row, safe to share between sessions and threads."""
+    id: int
+    name: str
+    location: str
+    city: str
+    capacity: int
+
+    @classmethod
+    def from_garage(cls, garage) -> "GarageSnapshot":
+        return cls(garage.id, garage.name, garage.location, garage.city, garage.capacity)
+
+
+def bump_garages_version(db: Session):
+    """Record a garage write in the current transaction, so every process drops its cached garages."""
+    db.execute(insert_ignore(db, CacheVersion).values(name=GARAGES_VERSION, version=0))
+    db.execute(
+        update(CacheVersion).where(CacheVersion.name == GARAGES_VERSION).values(version=CacheVersion.version + 1)
+    )
+
+
+class GarageCache:
+    """
+    Process-local LRU cache of garages by id, and of garage listings.
+    Writes of this process clear it right away; writes of other processes bump the version row in
+    cache_versions, which is read at most once every ``check_seconds`` to notice them.
+    """
+
+    def __init__(self, max_entries: int = settings.garage_cache_size, check_seconds: float = settings.garage_cache_check_seconds):
+        self.max_entries = max_entries
+        self.check_seconds = check_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._next_check = 0.0
+        # Bumped on every clear, so loads that raced with a write are not stored
+        self._generation = 0
+
+    def _sync(self, db: Session) -> int:
+        """Drop the entries if another process changed the garages, and return the current generation."""
+        now = time.monotonic()
+        if now >= self._next_check:
+            version = db.execute(
+                select(CacheVersion.version).where(CacheVersion.name == GARAGES_VERSION)
+            ).scalar() or 0
+            with self._lock:
+                if version != self._version:
+                    self._clear()
+                    self._version = version
+                self._next_check = now + self.check_seconds
+        return self._generation
+
+    def _get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def _put(self, key, value, generation: int):
+        with self._lock:
+            if generation != self._generation or self.max_entries <= 0:
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, db: Session, garage_id: int) -> Optional[GarageSnapshot]:
+        generation = self._sync(db)
+        found, snapshot = self._get(("garage", garage_id))
+        if found:
+            return snapshot
+        garage = db.get(Garage, garage_id)
+        snapshot = GarageSnapshot.from_garage(garage) if garage else None
+        if snapshot is not None:
+            self._put(("garage", garage_id), snapshot, generation)
+        return snapshot
+
+    def get_many(self, db: Session, garage_ids: Iterable[int]) -> Dict[int, GarageSnapshot]:
+        """The existing garages among ``garage_ids``, loading the missing ones with a few IN queries."""
+        generation = self._sync(db)
+        snapshots, missing = {}, []
+        for garage_id in set(garage_ids):
+            found, snapshot = self._get(("garage", garage_id))
+            if found:
+                snapshots[garage_id] = snapshot
+            else:
+                missing.append(garage_id)
+        for chunk in chunked(missing):
+            for garage in db.query(Garage).filter(Garage.id.in_(chunk)):
+                snapshots[garage.id] = GarageSnapshot.from_garage(garage)
+                self._put(("garage", garage.id), snapshots[garage.id], generation)
+        return snapshots
+
+    def listing(self, db: Session, key: tuple, load):
+        """A cached listing, ``load`` returns the garages of the page and its next cursor."""
+        generation = self._sync(db)
+        found, page = self._get(("listing",) + key)
+        if found:
+            return list(page[0]), page[1]
+        garages, next_cursor = load()
+        page = (tuple(GarageSnapshot.from_garage(garage) for garage in garages), next_cursor)
+        self._put(("listing",) + key, page, generation)
+        return list(page[0]), page[1]
+
+    def invalidate(self):
+        """Drop everything after a garage write of this process, and re-read the version on the next access."""
+        with self._lock:
+            self._clear()
+            self._next_check = 0.0
+
+    def _clear(self):
+        self._entries.clear()
+        self._generation += 1
+
+
+garage_cache = GarageCache()
+
+
+def get_garage_or_404(db: Session, garage_id: int, detail: str) -> GarageSnapshot:
+    """Cached counterpart of get_or_404 for garages."""
+    garage = garage_cache.get(db, garage_id)
+    if garage is None:
+        raise HTTPException(status_code=404, detail=detail)
+    return garage
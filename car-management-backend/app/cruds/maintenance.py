@@ -1,14 +1,35 @@
-from datetime import date
+import heapq
+from datetime import date, timedelta
+from typing import List
+
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
-from app.models.maintenance import MaintenanceRequest
+from sqlalchemy import bindparam, delete, insert, update
+from sqlalchemy.orm import Session, joinedload
+from app.models.maintenance import ArchivedMaintenanceRequest, MaintenanceRequest
 from app.models.car import Car
 from app.models.garage import Garage
-from app.schemas.maintenance import MaintenanceRequestCreate, MaintenanceRequestUpdate
-from app.cruds.utils import get_or_404
+from app.schemas.maintenance import MaintenanceRequestCreate, MaintenanceRequestUpdate, MaintenanceReschedule
+from app.cruds.archive import reaches_archive
+from app.cruds.occupancy import add_booked, get_booked, lock_capacities, lock_slots, prune_slots, release_slots, reserve_slots
+from app.cruds.garage_cache import garage_cache, get_garage_or_404
+from app.cruds.occupancy_index import occupancy_index
+from app.cruds.report_cache import bump_report_versions, report_cache
+from app.cruds.utils import chunked, encode_cursor, get_or_404, paginate
+from app.metrics import capacity_rejections_total
+
+
+# Days of target capacity locked at a time when spreading a reschedule, the next windows double
+RESCHEDULE_WINDOW_DAYS = 14
+# Furthest day after the target date a reschedule may spread to
+RESCHEDULE_HORIZON_DAYS = 366
 
 
 def create_maintenance_request(db: Session, maintenance_request: MaintenanceRequestCreate):
+    """
+    Book a maintenance request and return its response row.
+    Loads the car once and the garage from the garage cache; the capacity check is the guarded reservation
+    itself. That is one SELECT, the reservation upsert and the INSERT, without reading the request back.
+    """
 
     # Validate the scheduled date
     if maintenance_request.scheduled_date < date.today():
@@ -18,10 +39,12 @@ def create_maintenance_request(db: Session, maintenance_request: MaintenanceRequ
     car = get_or_404(db, Car, maintenance_request.car_id, f"Car with ID {maintenance_request.car_id} not found.")
 
     # Ensure the Garage exists
-    garage = get_or_404(db, Garage, maintenance_request.garage_id, f"Garage with ID {maintenance_request.garage_id} not found.")
+    garage = get_garage_or_404(db, maintenance_request.garage_id, f"Garage with ID {maintenance_request.garage_id} not found.")
 
-    # Check if the garage is full on the scheduled date
-    if is_garage_full(db, maintenance_request.garage_id, maintenance_request.scheduled_date):
+    # Take a slot in the same transaction as the insert; the guarded increment fails when the garage is full
+    if not reserve_slots(db, maintenance_request.garage_id, maintenance_request.scheduled_date):
+        db.rollback()
+        capacity_rejections_total.labels("reserve").inc()
         raise HTTPException(
             status_code=400,
             detail=f"Garage with ID {maintenance_request.garage_id} is at full capacity on {maintenance_request.scheduled_date}.",
@@ -38,14 +61,127 @@ def create_maintenance_request(db: Session, maintenance_request: MaintenanceRequ
     )
 
     db.add(db_request)
+    db.flush()
+    # Built before the commit expires the objects
+    row = maintenance_request_row(db_request, car, garage)
+    bump_report_versions(db, [maintenance_request.garage_id])
     db.commit()
-    db.refresh(db_request)
-    return db_request
+    report_cache.invalidate([maintenance_request.garage_id])
+    occupancy_index.apply({(maintenance_request.garage_id, maintenance_request.scheduled_date): 1})
+    return row
+
+
+def maintenance_request_row(db_request: MaintenanceRequest, car: Car, garage) -> dict:
+    """The row maintenance_rows_query projects for a request, from the objects the write path already holds."""
+    return {
+        "id": db_request.id,
+        "carId": db_request.car_id,
+        "carName": car.make if car is not None else None,
+        "serviceType": db_request.service_type,
+        "scheduledDate": db_request.scheduled_date,
+        "garageId": db_request.garage_id,
+        "garageName": garage.name if garage is not None else None,
+    }
+
+
+
+def create_maintenance_requests(db: Session, maintenance_requests: List[MaintenanceRequestCreate]):
+    """
+    Create a batch of maintenance requests in one transaction.
+    Cars, garages and per-garage-per-day capacity are checked with set-based queries for the whole
+    batch; invalid items are skipped and reported by their index in the batch.
+    """
+    today = date.today()
+    car_ids = {request.car_id for request in maintenance_requests}
+    garage_ids = {request.garage_id for request in maintenance_requests}
+
+    cars = {}
+    for chunk in chunked(car_ids):
+        for car_id, make, model in db.query(Car.id, Car.make, Car.model).filter(Car.id.in_(chunk)):
+            cars[car_id] = f"{make} {model}"
+    # The cache only provides the names, the capacities are read under the locks below
+    garage_names = {garage.id: garage.name for garage in garage_cache.get_many(db, garage_ids).values()}
+
+    # Lock the occupancy counters of every garage/day the batch touches, then read the capacities
+    slots = {
+        (request.garage_id, request.scheduled_date)
+        for request in maintenance_requests
+        if request.garage_id in garage_names and request.scheduled_date >= today
+    }
+    booked = lock_slots(db, slots)
+    capacities = lock_capacities(db, {garage_id for garage_id, _ in slots})
+    reserved = {}
+
+    rows, errors = [], []
+    for index, request in enumerate(maintenance_requests):
+        slot = (request.garage_id, request.scheduled_date)
+        if request.scheduled_date < today:
+            errors.append({"index": index, "detail": "Scheduled date cannot be in the past."})
+        elif request.car_id not in cars:
+            errors.append({"index": index, "detail": f"Car with ID {request.car_id} not found."})
+        elif request.garage_id not in capacities:
+            errors.append({"index": index, "detail": f"Garage with ID {request.garage_id} not found."})
+        elif booked.get(slot, 0) >= capacities[request.garage_id]:
+            capacity_rejections_total.labels("bulk").inc()
+            errors.append({
+                "index": index,
+                "detail": f"Garage with ID {request.garage_id} is at full capacity on {request.scheduled_date}.",
+            })
+        else:
+            booked[slot] = booked.get(slot, 0) + 1
+            reserved[slot] = reserved.get(slot, 0) + 1
+            rows.append({
+                "car_id": request.car_id,
+                "car_name": cars[request.car_id],
+                "service_type": request.service_type,
+                "scheduled_date": request.scheduled_date,
+                "garage_id": request.garage_id,
+                "garage_name": garage_names[request.garage_id],
+            })
+
+    if not rows:
+        db.rollback()
+        return [], errors
+
+    add_booked(db, reserved)
+    # The slots of rejected items keep no empty counter row
+    prune_slots(db, slots - reserved.keys())
+    # Batched multi-row INSERT ... RETURNING, only the set of new ids is needed
+    request_ids = sorted(db.scalars(insert(MaintenanceRequest).returning(MaintenanceRequest.id), rows))
+    bump_report_versions(db, (garage_id for garage_id, _ in reserved))
+    db.commit()
+    report_cache.invalidate(garage_id for garage_id, _ in reserved)
+    occupancy_index.apply(reserved)
 
+    created = []
+    for chunk in chunked(request_ids):
+        query = maintenance_rows_query(db).filter(MaintenanceRequest.id.in_(chunk)).order_by(MaintenanceRequest.id)
+        created.extend(dict(row._mapping) for row in query)
+    return created, errors
 
 
 def get_maintenance_request(db: Session, request_id: int):
-    return db.query(MaintenanceRequest).filter(MaintenanceRequest.id == request_id).first()
+    return db.get(MaintenanceRequest, request_id)
+
+
+def filter_maintenance_requests(
+    query,
+    car_id: int = None,
+    garage_id: int = None,
+    start_date: date = None,
+    end_date: date = None,
+    model=MaintenanceRequest
+):
+    """Apply the car/garage/date filters shared by the maintenance listings, of either table."""
+    if car_id:
+        query = query.filter(model.car_id == car_id)
+    if garage_id:
+        query = query.filter(model.garage_id == garage_id)
+    if start_date:
+        query = query.filter(model.scheduled_date >= start_date)
+    if end_date:
+        query = query.filter(model.scheduled_date <= end_date)
+    return query
 
 
 def get_maintenance_requests(
@@ -56,30 +192,118 @@ def get_maintenance_requests(
     end_date: date = None
 ):
     query = db.query(MaintenanceRequest)
+    requests = filter_maintenance_requests(query, car_id, garage_id, start_date, end_date).all()
+    if reaches_archive(db, start_date):
+        query = db.query(ArchivedMaintenanceRequest)
+        requests += filter_maintenance_requests(
+            query, car_id, garage_id, start_date, end_date, model=ArchivedMaintenanceRequest
+        ).all()
+    return requests
+
+
+def maintenance_rows_query(db: Session, model=MaintenanceRequest):
+    """
+    Project exactly the columns of MaintenanceRequestResponse (camelCase keys) in one
+    joined SELECT, so listings never lazy-load Car and Garage per row.
+    ``model`` is MaintenanceRequest or ArchivedMaintenanceRequest, the rows are the same.
+    """
+    return (
+        db.query(
+            model.id.label("id"),
+            model.car_id.label("carId"),
+            Car.make.label("carName"),
+            model.service_type.label("serviceType"),
+            model.scheduled_date.label("scheduledDate"),
+            model.garage_id.label("garageId"),
+            Garage.name.label("garageName"),
+        )
+        .outerjoin(Car, Car.id == model.car_id)
+        .outerjoin(Garage, Garage.id == model.garage_id)
+    )
+
+
+def _row_key(row):
+    return row.scheduledDate, row.id
+
+
+def get_maintenance_request_row(db: Session, request_id: int):
+    """Response row of a single maintenance request, or None."""
+    row = maintenance_rows_query(db).filter(MaintenanceRequest.id == request_id).first()
+    return dict(row._mapping) if row else None
 
-    # Apply filters
-    if car_id:
-        query = query.filter(MaintenanceRequest.car_id == car_id)
-    if garage_id:
-        query = query.filter(MaintenanceRequest.garage_id == garage_id)
-    if start_date:
-        query = query.filter(MaintenanceRequest.scheduled_date >= start_date)
-    if end_date:
-        query = query.filter(MaintenanceRequest.scheduled_date <= end_date)
 
-    return query.all()
+def get_maintenance_request_rows(
+    db: Session,
+    car_id: int = None,
+    garage_id: int = None,
+    start_date: date = None,
+    end_date: date = None,
+    limit: int = None,
+    after: str = None
+):
+    """
+    A page of the listing. The archive is read only when the range starts at or before its latest day:
+    the page is then the first ``limit`` rows of the pages of both tables.
+    """
+    models = [MaintenanceRequest] + ([ArchivedMaintenanceRequest] if reaches_archive(db, start_date) else [])
+    rows, more = [], False
+    for model in models:
+        query = filter_maintenance_requests(
+            maintenance_rows_query(db, model), car_id, garage_id, start_date, end_date, model=model
+        )
+        page, next_cursor = paginate(query, [model.scheduled_date, model.id], limit, after, key=_row_key)
+        rows.extend(page)
+        more = more or next_cursor is not None
+    if len(models) > 1:
+        rows.sort(key=_row_key)
+        if limit is not None and len(rows) > limit:
+            rows, more = rows[:limit], True
+    next_cursor = encode_cursor(_row_key(rows[-1])) if more else None
+    return [dict(row._mapping) for row in rows], next_cursor
+
+
+def iter_maintenance_request_rows(
+    db: Session,
+    car_id: int = None,
+    garage_id: int = None,
+    start_date: date = None,
+    end_date: date = None,
+    batch_size: int = 1000
+):
+    """Stream the listing projection in (scheduled_date, id) order without materializing the result."""
+    models = [MaintenanceRequest] + ([ArchivedMaintenanceRequest] if reaches_archive(db, start_date) else [])
+    streams = [
+        filter_maintenance_requests(maintenance_rows_query(db, model), car_id, garage_id, start_date, end_date, model=model)
+        .order_by(model.scheduled_date, model.id)
+        .yield_per(batch_size)
+        for model in models
+    ]
+    for row in heapq.merge(*streams, key=_row_key):
+        yield row._mapping
 
 
 
 def update_maintenance_request(db: Session, request_id: int, maintenance_request: MaintenanceRequestUpdate):
+    """
+    Apply the provided fields and return the response row of the request.
+    The request is loaded with its car in one SELECT; a new car is the only other lookup, the garage comes
+    from the garage cache, and moving the booking runs the guarded reservation and the release.
+    """
     # Retrieve the existing request
-    db_request = get_or_404(db, MaintenanceRequest, request_id, "Maintenance request not found.")
+    db_request = get_or_404(
+        db, MaintenanceRequest, request_id, "Maintenance request not found.", options=[joinedload(MaintenanceRequest.car)]
+    )
+    car = db_request.car
+
+    previous_slot = (db_request.garage_id, db_request.scheduled_date)
 
     # If garage_id was provided, validate the garage
     if maintenance_request.garage_id:
-        garage = get_or_404(db, Garage, maintenance_request.garage_id, "Garage not found")
+        garage = get_garage_or_404(db, maintenance_request.garage_id, "Garage not found")
         db_request.garage_id = garage.id
         db_request.garage_name = garage.name
+    else:
+        garage = garage_cache.get(db, db_request.garage_id)
 
     # If car_id was provided, validate the car
     if maintenance_request.car_id:
@@ -97,44 +321,169 @@ def update_maintenance_request(db: Session, request_id: int, maintenance_request
     if maintenance_request.service_type:
         db_request.service_type = maintenance_request.service_type
 
-    # Now ALWAYS check the capacity based on the final db_request.garage_id and db_request.scheduled_date
-    if is_garage_full(db, db_request.garage_id, db_request.scheduled_date):
+    # Moving to another garage or day takes a slot there and gives the previous one back
+    if (db_request.garage_id, db_request.scheduled_date) != previous_slot:
+        if not reserve_slots(db, db_request.garage_id, db_request.scheduled_date):
+            detail = f"Garage '{db_request.garage_name}' is at full capacity for {db_request.scheduled_date}. "
+            db.rollback()
+            capacity_rejections_total.labels("reserve").inc()
+            raise HTTPException(status_code=400, detail=detail)
+        release_slots(db, *previous_slot)
+
+    db.flush()
+    # Built before the commit expires the objects
+    row = maintenance_request_row(db_request, car, garage)
+    bump_report_versions(db, [previous_slot[0], row["garageId"]])
+    db.commit()
+    report_cache.invalidate([previous_slot[0], row["garageId"]])
+    new_slot = (row["garageId"], row["scheduledDate"])
+    if new_slot != previous_slot:
+        occupancy_index.apply({previous_slot: -1, new_slot: 1})
+    return row
+
+
+
+def reschedule_maintenance_requests(db: Session, reschedule: MaintenanceReschedule) -> dict:
+    """
+    Move every request of a garage within a date range, e.g. when the garage closes, in one transaction.
+    All of them go to the target garage on the target date, or with ``spread`` fill its free capacity day by day.
+    The capacity, read under lock, is checked for the whole batch on the locked counters; nothing moves if it
+    does not fit.
+    """
+    today = date.today()
+    end_date = reschedule.end_date or reschedule.start_date
+    target_garage_id = reschedule.target_garage_id or reschedule.garage_id
+    target_date = reschedule.target_date or (max(end_date + timedelta(days=1), today) if reschedule.spread else None)
+    if reschedule.start_date > end_date:
+        raise HTTPException(status_code=400, detail="Start date cannot be after end date.")
+    if target_date is None:
+        raise HTTPException(status_code=400, detail="A target date is required unless the requests are spread.")
+    if target_date < today:
+        raise HTTPException(status_code=400, detail="Scheduled date cannot be in the past.")
+    get_garage_or_404(db, reschedule.garage_id, f"Garage with ID {reschedule.garage_id} not found.")
+    target_garage = get_garage_or_404(db, target_garage_id, f"Garage with ID {target_garage_id} not found.")
+
+    # The first write takes SQLite's write lock before the requests are read, FOR UPDATE is a no-op there:
+    # a delete or move of one of them cannot commit in between
+    bump_report_versions(db, [reschedule.garage_id, target_garage_id])
+    requests = (
+        db.query(MaintenanceRequest.id, MaintenanceRequest.scheduled_date)
+        .filter(
+            MaintenanceRequest.garage_id == reschedule.garage_id,
+            MaintenanceRequest.scheduled_date >= reschedule.start_date,
+            MaintenanceRequest.scheduled_date <= end_date,
+        )
+        .order_by(MaintenanceRequest.scheduled_date, MaintenanceRequest.id)
+        .with_for_update()
+        .all()
+    )
+    if not requests:
+        db.rollback()
+        return {"moved": 0, "requests": []}
+
+    # Give the current slots back first, so a target overlapping the moved range counts them as free
+    increments = {}
+    for _, scheduled_date in requests:
+        slot = (reschedule.garage_id, scheduled_date)
+        increments[slot] = increments.get(slot, 0) - 1
+    add_booked(db, increments)
+    # Read in the write transaction the release opened, the cached capacity may be stale
+    capacity = lock_capacities(db, [target_garage_id]).get(target_garage_id)
+    if capacity is None:
+        db.rollback()
+        raise HTTPException(status_code=404, detail=f"Garage with ID {target_garage_id} not found.")
+
+    # Allocate the target days on their locked counters, a window of days at a time
+    placements, reserved, locked = [], {}, set()
+    window_start, window_days = target_date, RESCHEDULE_WINDOW_DAYS if reschedule.spread else 1
+    while len(placements) < len(requests) and (window_start - target_date).days < RESCHEDULE_HORIZON_DAYS:
+        window_days = min(window_days, RESCHEDULE_HORIZON_DAYS - (window_start - target_date).days)
+        days = [window_start + timedelta(days=offset) for offset in range(window_days)]
+        booked = lock_slots(db, {(target_garage_id, day) for day in days})
+        locked.update(booked)
+        for day in days:
+            free = capacity - booked.get((target_garage_id, day), 0)
+            while free > 0 and len(placements) < len(requests):
+                placements.append(day)
+                reserved[(target_garage_id, day)] = reserved.get((target_garage_id, day), 0) + 1
+                free -= 1
+        if not reschedule.spread:
+            break
+        window_start, window_days = days[-1] + timedelta(days=1), window_days * 2
+
+    if len(placements) < len(requests):
+        db.rollback()
+        capacity_rejections_total.labels("reschedule").inc()
         raise HTTPException(
             status_code=400,
-            detail=(
-                f"Garage '{db_request.garage_name}' is at full capacity for {db_request.scheduled_date}. "
-            ),
+            detail=f"Garage with ID {target_garage_id} has room for {len(placements)} of the {len(requests)} requests"
+            + (f" on {target_date}." if not reschedule.spread else f" within {RESCHEDULE_HORIZON_DAYS} days of {target_date}."),
         )
 
+    add_booked(db, reserved)
+    # Drop the counter rows left at zero: locked days that got nothing and emptied source days
+    prune_slots(db, (locked - reserved.keys()) | increments.keys())
+    table = MaintenanceRequest.__table__
+    moves = [
+        {"request_id": request_id, "garage_id": target_garage_id, "garage_name": target_garage.name, "scheduled_date": day}
+        for (request_id, _), day in zip(requests, placements)
+    ]
+    db.execute(
+        update(table)
+        .where(table.c.id == bindparam("request_id"))
+        .values(garage_id=bindparam("garage_id"), garage_name=bindparam("garage_name"), scheduled_date=bindparam("scheduled_date")),
+        moves,
+    )
     db.commit()
-    db.refresh(db_request)
-    return db_request
+
+    report_cache.invalidate([reschedule.garage_id, target_garage_id])
+    for slot, count in reserved.items():
+        increments[slot] = increments.get(slot, 0) + count
+    occupancy_index.apply(increments)
+    return {
+        "moved": len(moves),
+        "requests": [
+            {"id": move["request_id"], "garageId": move["garage_id"], "scheduledDate": move["scheduled_date"]}
+            for move in moves
+        ],
+    }
 
 
 
 def delete_maintenance_request(db: Session, request_id: int):
-    db_request = db.query(MaintenanceRequest).filter(MaintenanceRequest.id == request_id).first()
-    if db_request:
-        db.delete(db_request)
-        db.commit()
-        return db_request
-    return None
+    """
+    Delete a request and give its slot back, returning its (garage_id, scheduled_date) or None if it did not exist.
+    The DELETE opens the write transaction and returns the slot the row held at that moment: of two concurrent
+    deletes of the same request only the one that removed it releases the slot.
+    """
+    deleted = db.execute(
+        delete(MaintenanceRequest)
+        .where(MaintenanceRequest.id == request_id)
+        .returning(MaintenanceRequest.garage_id, MaintenanceRequest.scheduled_date)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if deleted is None:
+        db.rollback()
+        return None
+    garage_id, scheduled_date = deleted
+    release_slots(db, garage_id, scheduled_date)
+    bump_report_versions(db, [garage_id])
+    db.commit()
+    report_cache.invalidate([garage_id])
+    occupancy_index.apply({(garage_id, scheduled_date): -1})
+    return deleted
 
 
 def is_garage_full(db: Session, garage_id: int, scheduled_date: date) -> bool:
 
     # Retrieve the garage to check its capacity
-    garage = get_or_404(db, Garage, garage_id, f"Garage with ID {garage_id} not found.")
+    garage = get_garage_or_404(db, garage_id, f"Garage with ID {garage_id} not found.")
 
-    # Count the number of maintenance requests scheduled for the specific date
-    scheduled_requests_count = (
-        db.query(MaintenanceRequest)
-        .filter(
-            MaintenanceRequest.garage_id == garage_id,
-            MaintenanceRequest.scheduled_date == scheduled_date
-        )
-        .count()
-    )
+    # Read the booked counter of that garage and day instead of counting its requests
+    scheduled_requests_count = get_booked(db, garage_id, scheduled_date)
 
     # Check if the number of requests exceeds or matches the garage capacity
-    return scheduled_requests_count >= garage.capacity
+    is_full = scheduled_requests_count >= garage.capacity
+    if is_full:
+        capacity_rejections_total.labels("is_garage_full").inc()
+    return is_full
@@ -0,0 +1,199 @@
+import argparse
+import sys
+from datetime import date
+
+from sqlalchemy import bindparam, case, delete, func, insert, literal, select, tuple_, update
+from sqlalchemy.orm import Session
+
+from app.cruds.occupancy_index import OccupancyIndex, occupancy_index
+from app.cruds.utils import chunked, insert_ignore, upsert
+from app.models.garage import Garage
+from app.models.maintenance import MaintenanceRequest
+from app.models.occupancy import GarageOccupancy
+
+
+def _slot(garage_id: int, scheduled_date: date):
+    return (GarageOccupancy.garage_id == garage_id) & (GarageOccupancy.scheduled_date == scheduled_date)
+
+
+def _clamped(booked):
+    # Counters never go negative, even if they drifted from maintenance_requests
+    return case((booked > 0, booked), else_=0)
+
+
+def get_booked(db: Session, garage_id: int, scheduled_date: date) -> int:
+    """Number of requests booked for a garage on a day."""
+    if occupancy_index.enabled:
+        return occupancy_index.booked(db, garage_id, scheduled_date)
+    booked = db.query(GarageOccupancy.booked).filter(_slot(garage_id, scheduled_date)).scalar()
+    return booked or 0
+
+
+def get_booked_many(db: Session, slots) -> dict:
+    """Booked counts of (garage_id, scheduled_date) slots; slots without requests are left out."""
+    slots = set(slots)
+    if occupancy_index.enabled:
+        return {slot: occupancy_index.booked(db, *slot) for slot in slots}
+    if not slots:
+        return {}
+    # Garages and a date range rather than a row-value IN, which SQLite answers with a full scan
+    days = [scheduled_date for _, scheduled_date in slots]
+    booked = {}
+    for chunk in chunked({garage_id for garage_id, _ in slots}):
+        query = db.query(GarageOccupancy.garage_id, GarageOccupancy.scheduled_date, GarageOccupancy.booked).filter(
+            GarageOccupancy.garage_id.in_(chunk),
+            GarageOccupancy.scheduled_date >= min(days),
+            GarageOccupancy.scheduled_date <= max(days),
+        )
+        for garage_id, scheduled_date, count in query:
+            if (garage_id, scheduled_date) in slots:
+                booked[(garage_id, scheduled_date)] = count
+    return booked
+
+
+def reserve_slots(db: Session, garage_id: int, scheduled_date: date, count: int = 1) -> bool:
+    """
+    Atomically take ``count`` slots of a garage on a day, in the caller's transaction.
+    A single upsert guarded by the garage capacity: it creates or increments the counter, and changes
+    no row (returns False) instead of overbooking.
+    """
+    capacity = select(Garage.capacity).where(Garage.id == garage_id).scalar_subquery()
+    statement = upsert(db, GarageOccupancy).from_select(
+        ["garage_id", "scheduled_date", "booked"],
+        select(literal(garage_id), literal(scheduled_date), literal(count)).where(literal(count) <= capacity),
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[GarageOccupancy.garage_id, GarageOccupancy.scheduled_date],
+        set_={"booked": GarageOccupancy.booked + count},
+        where=GarageOccupancy.booked + count <= capacity,
+    )
+    return db.execute(statement).rowcount == 1
+
+
+def release_slots(db: Session, garage_id: int, scheduled_date: date, count: int = 1):
+    """Give back ``count`` slots of a garage on a day, in the caller's transaction."""
+    db.execute(
+        update(GarageOccupancy)
+        .where(_slot(garage_id, scheduled_date))
+        .values(booked=_clamped(GarageOccupancy.booked - count))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def lock_slots(db: Session, slots) -> dict:
+    """
+    Make sure a counter row exists for every (garage_id, scheduled_date) slot and return the booked counts.
+    Creating the rows opens the write transaction first, so the counts stay valid until the caller commits.
+    Callers prune_slots the slots they end up not booking before committing.
+    """
+    slots = set(slots)
+    if not slots:
+        return {}
+    db.execute(
+        insert_ignore(db, GarageOccupancy),
+        [{"garage_id": garage_id, "scheduled_date": scheduled_date, "booked": 0} for garage_id, scheduled_date in slots],
+    )
+    booked = {}
+    for chunk in chunked(slots):
+        query = (
+            db.query(GarageOccupancy.garage_id, GarageOccupancy.scheduled_date, GarageOccupancy.booked)
+            .filter(tuple_(GarageOccupancy.garage_id, GarageOccupancy.scheduled_date).in_(chunk))
+            .with_for_update()
+        )
+        for garage_id, scheduled_date, count in query:
+            booked[(garage_id, scheduled_date)] = count
+    return booked
+
+
+def prune_slots(db: Session, slots):
+    """
+    Delete the counter rows of (garage_id, scheduled_date) slots that are at zero, in the caller's transaction,
+    e.g. the ones lock_slots created but nothing was booked into. A missing row counts as zero.
+    """
+    slots = set(slots)
+    if not slots:
+        return
+    table = GarageOccupancy.__table__
+    db.execute(
+        delete(table).where(
+            table.c.garage_id == bindparam("slot_garage_id"),
+            table.c.scheduled_date == bindparam("slot_date"),
+            table.c.booked <= 0,
+        ),
+        [{"slot_garage_id": garage_id, "slot_date": scheduled_date} for garage_id, scheduled_date in slots],
+    )
+
+
+def lock_capacities(db: Session, garage_ids) -> dict:
+    """
+    Capacity of each existing garage, read from the garages rows in the caller's transaction. Call it after
+    lock_slots: SQLite then reads inside the write transaction, server databases keep the rows share-locked,
+    so the capacities cannot change before the bookings commit.
+    """
+    capacities = {}
+    for chunk in chunked(set(garage_ids)):
+        query = db.query(Garage.id, Garage.capacity).filter(Garage.id.in_(chunk)).with_for_update(read=True)
+        capacities.update((garage_id, capacity) for garage_id, capacity in query)
+    return capacities
+
+
+def add_booked(db: Session, increments: dict):
+    """Apply {(garage_id, scheduled_date): delta} to existing slots as one executemany UPDATE."""
+    if not increments:
+        return
+    table = GarageOccupancy.__table__
+    db.execute(
+        update(table)
+        .where(table.c.garage_id == bindparam("slot_garage_id"), table.c.scheduled_date == bindparam("slot_date"))
+        .values(booked=_clamped(table.c.booked + bindparam("delta"))),
+        [
+            {"slot_garage_id": garage_id, "slot_date": scheduled_date, "delta": delta}
+            for (garage_id, scheduled_date), delta in increments.items()
+        ],
+    )
+
+
+def rebuild_occupancy(db: Session):
+    """Recompute every counter from maintenance_requests."""
+    db.execute(delete(GarageOccupancy))
+    counts = select(
+        MaintenanceRequest.garage_id,
+        MaintenanceRequest.scheduled_date,
+        func.count(MaintenanceRequest.id),
+    ).group_by(MaintenanceRequest.garage_id, MaintenanceRequest.scheduled_date)
+    db.execute(
+        insert(GarageOccupancy).from_select(["garage_id", "scheduled_date", "booked"], counts)
+    )
+    db.commit()
+    occupancy_index.invalidate()
+
+
+def backfill_occupancy(db: Session):
+    """Populate the counters of a database whose requests predate the occupancy table."""
+    if db.query(GarageOccupancy.garage_id).first() is None and db.query(MaintenanceRequest.id).first() is not None:
+        rebuild_occupancy(db)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the occupancy counters against maintenance_requests, or rebuild them.")
+    parser.add_argument("command", choices=["check", "rebuild"])
+    args = parser.parse_args(argv)
+
+    import app.models.car  # noqa: F401, the Garage relationships refer to Car
+    from app.models.database import SessionLocal
+
+    with SessionLocal() as db:
+        if args.command == "rebuild":
+            rebuild_occupancy(db)
+        # The calendar of the in-process index, loaded from the counters
+        index = OccupancyIndex(enabled=True)
+        index.load(db)
+        mismatches = index.check(db)
+    for garage_id, day, indexed, requests in mismatches:
+        print(f"garage {garage_id} {day}: counter {indexed}, requests {requests}")
+    print(f"{len(mismatches)} mismatched garage/day counters", file=sys.stderr)
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
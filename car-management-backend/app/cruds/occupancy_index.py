@@ -0,0 +1,124 @@
+import threading
+import time
+from array import array
+from datetime import date
+from typing import Dict, List, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models.maintenance import MaintenanceRequest
+from app.models.occupancy import GarageOccupancy
+from app.settings import settings
+
+
+def _zeros(days: int) -> array:
+    return array("i", bytes(4 * days))
+
+
+class OccupancyIndex:
+    """
+    Process-local calendar of the booked counters: one array of counts per garage, indexed by the day offset
+    from the garage's first booked day. Capacity checks read one cell and range availability reads one slice.
+
+    Loaded from garage_daily_occupancy, kept current by the maintenance writes of this process and reloaded
+    every ``reload_seconds`` to pick up the writes of other processes. Bookings stay guarded by the SQL counters,
+    so a count lagging behind another process only delays what the reports show.
+    """
+
+    def __init__(self, enabled: bool = settings.occupancy_index, reload_seconds: float = settings.occupancy_index_reload_seconds):
+        self.enabled = enabled
+        self.reload_seconds = reload_seconds
+        self._calendars: Dict[int, Tuple[int, array]] = {}  # garage_id -> (ordinal of the first day, counts)
+        self._loaded = False
+        self._next_reload = 0.0
+        self._lock = threading.Lock()
+
+    def load(self, db: Session):
+        """Replace the calendars with the counters of the database."""
+        rows = db.query(GarageOccupancy.garage_id, GarageOccupancy.scheduled_date, GarageOccupancy.booked).order_by(
+            GarageOccupancy.garage_id, GarageOccupancy.scheduled_date
+        )
+        calendars = {}
+        for garage_id, scheduled_date, booked in rows:
+            self._add(calendars, garage_id, scheduled_date, booked)
+        with self._lock:
+            self._calendars = calendars
+            self._loaded = True
+            self._next_reload = time.monotonic() + self.reload_seconds
+
+    def _sync(self, db: Session):
+        if not self._loaded or time.monotonic() >= self._next_reload:
+            self.load(db)
+
+    @staticmethod
+    def _add(calendars: dict, garage_id: int, day: date, delta: int):
+        ordinal = day.toordinal()
+        first, counts = calendars.get(garage_id, (ordinal, array("i")))
+        if ordinal < first:
+            counts = _zeros(first - ordinal) + counts
+            first = ordinal
+        offset = ordinal - first
+        if offset >= len(counts):
+            counts.extend(_zeros(offset - len(counts) + 1))
+        # Like the SQL counters, never negative
+        counts[offset] = max(0, counts[offset] + delta)
+        calendars[garage_id] = (first, counts)
+
+    def apply(self, increments: dict):
+        """Apply {(garage_id, scheduled_date): delta} of a committed write of this process."""
+        if not self._loaded:
+            return
+        with self._lock:
+            for (garage_id, scheduled_date), delta in increments.items():
+                self._add(self._calendars, garage_id, scheduled_date, delta)
+
+    def drop_garage(self, garage_id: int):
+        with self._lock:
+            self._calendars.pop(garage_id, None)
+
+    def invalidate(self):
+        """Reload on the next access, e.g. after the counters were rebuilt."""
+        with self._lock:
+            self._next_reload = 0.0
+
+    def booked(self, db: Session, garage_id: int, day: date) -> int:
+        """Number of requests booked for a garage on a day."""
+        self._sync(db)
+        first, counts = self._calendars.get(garage_id, (0, array("i")))
+        offset = day.toordinal() - first
+        return counts[offset] if 0 <= offset < len(counts) else 0
+
+    def booked_range(self, db: Session, garage_id: int, start_date: date, end_date: date) -> array:
+        """Booked counts of a garage for every day from start_date to end_date, inclusive."""
+        self._sync(db)
+        start = start_date.toordinal()
+        result = _zeros(end_date.toordinal() - start + 1)
+        first, counts = self._calendars.get(garage_id, (start, array("i")))
+        low = max(start, first)
+        high = min(start + len(result), first + len(counts))
+        if low < high:
+            result[low - start:high - start] = counts[low - first:high - first]
+        return result
+
+    def check(self, db: Session) -> List[Tuple[int, date, int, int]]:
+        """(garage_id, day, indexed, requests) of every day whose count differs from maintenance_requests."""
+        requests = db.query(
+            MaintenanceRequest.garage_id, MaintenanceRequest.scheduled_date, func.count(MaintenanceRequest.id)
+        ).group_by(MaintenanceRequest.garage_id, MaintenanceRequest.scheduled_date)
+        expected = {(garage_id, day): count for garage_id, day, count in requests}
+        with self._lock:
+            indexed = {
+                (garage_id, date.fromordinal(first + offset)): count
+                for garage_id, (first, counts) in self._calendars.items()
+                for offset, count in enumerate(counts)
+                if count
+            }
+        return sorted(
+            (garage_id, day, indexed.get((garage_id, day), 0), expected.get((garage_id, day), 0))
+            for garage_id, day in expected.keys() | indexed.keys()
+            if indexed.get((garage_id, day), 0) != expected.get((garage_id, day), 0)
+        )
+
+
+occupancy_index = OccupancyIndex()
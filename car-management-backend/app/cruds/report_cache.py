@@ -0,0 +1,183 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Iterable
+
+from fastapi import Request, Response
+from sqlalchemy import bindparam, select
+from sqlalchemy.orm import Session
+
+from app.cruds.utils import upsert
+from app.models.cache_version import CacheVersion
+
+# Size and freshness bounds of the report cache
+REPORT_CACHE_MAX_ENTRIES = 512
+REPORT_CACHE_TTL_SECONDS = 30
+# How often the version rows are read to notice the writes of other processes
+REPORT_CACHE_CHECK_SECONDS = 1.0
+# Rows of cache_versions counting the maintenance writes of each garage, "report:<garage_id>"
+REPORT_VERSION_PREFIX = "report:"
+# Upper bound of their names, ";" sorts right after ":"
+REPORT_VERSION_END = "report;"
+
+
+def bump_report_versions(db: Session, garage_ids: Iterable[int]):
+    """Record a write touching the reports of the garages in the current transaction, for every process."""
+    garage_ids = set(garage_ids)
+    if not garage_ids:
+        return
+    statement = upsert(db, CacheVersion).values(name=bindparam("version_name"), version=1)
+    statement = statement.on_conflict_do_update(
+        index_elements=[CacheVersion.name], set_={"version": CacheVersion.version + 1}
+    )
+    db.execute(statement, [{"version_name": f"{REPORT_VERSION_PREFIX}{garage_id}"} for garage_id in garage_ids])
+
+
+class ReportCache:
+    """
+    Process-local LRU cache of report results, keyed by report, garages and range.
+    Entries expire after a TTL and are dropped as soon as a maintenance write of this process touches one of
+    their garages; the writes of other processes are noticed through their bump_report_versions rows, read at
+    most once every ``check_seconds``.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = REPORT_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = REPORT_CACHE_TTL_SECONDS,
+        check_seconds: float = REPORT_CACHE_CHECK_SECONDS,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.check_seconds = check_seconds
+        self._seen = None  # garage_id -> version row last read
+        self._next_check = 0.0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, etag, garage_ids, value)
+        self._keys_by_garage = {}
+        self._versions = {}  # garage_id -> number of invalidations, to detect writes during a computation
+        self._lock = threading.Lock()
+        # ETags of another process (or a previous run) never match ours
+        self._epoch = uuid.uuid4().hex[:12]
+        self._sequence = 0
+
+    def get(self, key):
+        """Return (etag, value) of a fresh entry, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[3]
+
+    def versions(self, garage_ids: Iterable[int]) -> tuple:
+        with self._lock:
+            return tuple(self._versions.get(garage_id, 0) for garage_id in garage_ids)
+
+    def put(self, key, garage_ids: tuple, value, versions: tuple) -> str:
+        """
+        Store a result computed while the garages were at ``versions``, and return its ETag.
+        Results that raced with a write on one of their garages are not stored.
+        """
+        with self._lock:
+            self._sequence += 1
+            etag = f'"{self._epoch}-{self._sequence}"'
+            if versions != tuple(self._versions.get(garage_id, 0) for garage_id in garage_ids):
+                return etag
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, etag, garage_ids, value)
+            for garage_id in garage_ids:
+                self._keys_by_garage.setdefault(garage_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+            return etag
+
+    def sync_due(self) -> bool:
+        return time.monotonic() >= self._next_check
+
+    def sync(self, db: Session):
+        """Drop the entries of the garages whose version row changed since the last read."""
+        rows = db.execute(
+            select(CacheVersion.name, CacheVersion.version).where(
+                # A range of the primary key, the rows of the other caches are skipped
+                CacheVersion.name >= REPORT_VERSION_PREFIX,
+                CacheVersion.name < REPORT_VERSION_END,
+            )
+        )
+        seen = {int(name[len(REPORT_VERSION_PREFIX):]): version for name, version in rows}
+        with self._lock:
+            if self._seen is not None:
+                self._invalidate(garage_id for garage_id, version in seen.items() if self._seen.get(garage_id) != version)
+            self._seen = seen
+            self._next_check = time.monotonic() + self.check_seconds
+
+    def invalidate(self, garage_ids: Iterable[int]):
+        """Drop every entry covering one of the garages."""
+        with self._lock:
+            self._invalidate(garage_ids)
+
+    def _invalidate(self, garage_ids: Iterable[int]):
+        for garage_id in set(garage_ids):
+            self._versions[garage_id] = self._versions.get(garage_id, 0) + 1
+            for key in list(self._keys_by_garage.get(garage_id, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_garage.clear()
+
+    def _remove(self, key):
+        _, _, garage_ids, _ = self._entries.pop(key)
+        for garage_id in garage_ids:
+            keys = self._keys_by_garage.get(garage_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_garage[garage_id]
+
+
+report_cache = ReportCache()
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match header (a list of tags, weak or strong, or "*") matches ``etag``."""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+async def cached_report(db, request: Request, response: Response, key, garage_ids: Iterable[int], compute):
+    """
+    Serve a report through the cache with ETag support, ``compute`` is an async callable producing it.
+    A matching If-None-Match on a fresh entry returns 304; the database is only read to check the versions
+    written by other processes, at most once every check_seconds.
+    """
+    # Imported here, app.cruds.aio imports the CRUD modules that import this one
+    from app.cruds.aio import run_db
+
+    if report_cache.sync_due():
+        await run_db(db, report_cache.sync)
+    garage_ids = tuple(sorted(set(garage_ids)))
+    cached = report_cache.get(key)
+    if cached is not None:
+        etag, report = cached
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag})
+    else:
+        versions = report_cache.versions(garage_ids)
+        report = await compute()
+        etag = report_cache.put(key, garage_ids, report, versions)
+    response.headers["ETag"] = etag
+    return report
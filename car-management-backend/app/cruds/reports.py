@@ -1,20 +1,31 @@
-from sqlalchemy import func
+from typing import List
+
+from sqlalchemy import extract, func
 from sqlalchemy.orm import Session
 from fastapi import HTTPException
 from datetime import datetime, timedelta
 
+from app.cruds.archive import reaches_archive
+from app.cruds.garage_cache import garage_cache
+from app.cruds.occupancy import get_booked_many
+from app.cruds.occupancy_index import occupancy_index
+from app.cruds.search import garage_filter
 from app.models.garage import Garage
-from app.models.maintenance import MaintenanceRequest
+from app.models.maintenance import ArchivedMaintenanceRequest, MaintenanceRequest
+from app.models.occupancy import GarageOccupancy
+
+# Days of the first range searched for free slots, the next ranges double
+NEXT_AVAILABLE_WINDOW_DAYS = 14
 
 
 
 def get_monthly_requests_report(
         db: Session,
-        garage_id: int,
+        garage_ids: List[int],
         start_date: datetime.date,
         end_date: datetime.date,
 ):
-    """Generate the monthly report for a given garage within a date range"""
+    """Generate the monthly report for the given garages within a date range"""
 
     # Adjust end_date to include the entire last day of the month
     end_date = datetime(end_date.year, end_date.month, 1).date()
@@ -22,31 +33,35 @@ def get_monthly_requests_report(
     next_year = end_date.year + (end_date.month // 12)
     end_date = datetime(next_year, next_month, 1).date() - timedelta(days=1)
 
-    # Query maintenance requests within the date range
-    maintenances = db.query(MaintenanceRequest).filter(
-        MaintenanceRequest.garage_id == garage_id,
-        MaintenanceRequest.scheduled_date >= start_date,
-        MaintenanceRequest.scheduled_date <= end_date,
-    ).all()
-
+    # Count the requests per year and month in the database, adding the archive when the range reaches into it
     report = {}
-    for maintenance in maintenances:
-        scheduled_date = maintenance.scheduled_date
-        if scheduled_date:
-            # Combine year and month into a single string "yyyy-mm"
-            year_month = f"{scheduled_date.year}-{str(scheduled_date.month).zfill(2)}"
-        else:
-            # Skip entries without a valid scheduled_date
-            continue
-
-        # Aggregate requests by yearMonth
-        report[year_month] = report.get(year_month, 0) + 1
-
-    # Format the response with yearMonth as a string
-    formatted_report = [
-        {"yearMonth": year_month, "requests": count}
-        for year_month, count in sorted(report.items())  # Sort by yearMonth
-    ]
+    models = [MaintenanceRequest] + ([ArchivedMaintenanceRequest] if reaches_archive(db, start_date) else [])
+    for model in models:
+        year = extract("year", model.scheduled_date)
+        month = extract("month", model.scheduled_date)
+        monthly_requests = (
+            db.query(year.label("year"), month.label("month"), func.count(model.id).label("requests"))
+            .filter(
+                model.garage_id.in_(garage_ids),
+                model.scheduled_date >= start_date,
+                model.scheduled_date <= end_date,
+            )
+            .group_by(year, month)
+            .all()
+        )
+        for row in monthly_requests:
+            key = (int(row.year), int(row.month))
+            report[key] = report.get(key, 0) + row.requests
+
+    # Format the response with yearMonth as a string, including the months without requests
+    formatted_report = []
+    current_year, current_month = start_date.year, start_date.month
+    while (current_year, current_month) <= (end_date.year, end_date.month):
+        formatted_report.append({
+            "yearMonth": f"{current_year}-{str(current_month).zfill(2)}",
+            "requests": report.get((current_year, current_month), 0),
+        })
+        current_year, current_month = current_year + current_month // 12, current_month % 12 + 1
 
     return formatted_report
 
@@ -57,7 +72,7 @@ def get_daily_availability_report(db: Session, garage_id: int, start_date: datet
     Generate the daily availability report for the given date range.
     """
     # Fetch the garage's total capacity
-    garage = db.query(Garage).filter(Garage.id == garage_id).first()
+    garage = garage_cache.get(db, garage_id)
     if not garage:
         raise HTTPException(
             status_code=404,
@@ -65,6 +80,18 @@ def get_daily_availability_report(db: Session, garage_id: int, start_date: datet
         )
     total_capacity = garage.capacity  # Use the `capacity` field from the Garage model
 
+    if occupancy_index.enabled:
+        # One slice of the garage's calendar
+        booked = occupancy_index.booked_range(db, garage_id, start_date, end_date)
+        return [
+            {
+                "date": (start_date + timedelta(days=offset)).isoformat(),
+                "requests": requests,
+                "availableCapacity": max(0, total_capacity - requests),
+            }
+            for offset, requests in enumerate(booked)
+        ]
+
     # Query maintenance requests grouped by date
     daily_requests = (
         db.query(
@@ -103,3 +130,132 @@ def get_daily_availability_report(db: Session, garage_id: int, start_date: datet
 
     return final_report
 
+
+def get_availability_matrix(db: Session, city: str, start_date: datetime.date, end_date: datetime.date):
+    """
+    Generate the garage x day availability matrix for every garage of a city, in columnar form.
+    """
+    dates = [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+    if occupancy_index.enabled:
+        # The garages of the city, then one calendar slice per garage
+        garages = db.query(Garage.id, Garage.capacity).filter(garage_filter(db, city, "city")).order_by(Garage.id).all()
+        garage_ids = [garage.id for garage in garages]
+        capacities = [garage.capacity for garage in garages]
+        requests = [occupancy_index.booked_range(db, garage_id, start_date, end_date).tolist() for garage_id in garage_ids]
+    else:
+        garage_ids, capacities, requests = requests_matrix(db, city, start_date, end_date)
+
+    return {
+        "dates": [day.isoformat() for day in dates],
+        "garageIds": garage_ids,
+        "capacities": capacities,
+        "requests": requests,
+        "availableCapacity": [
+            [max(0, capacity - count) for count in row]
+            for capacity, row in zip(capacities, requests)
+        ],
+    }
+
+
+def requests_matrix(db: Session, city: str, start_date: datetime.date, end_date: datetime.date):
+    """Garage IDs, capacities and requests per day of the garages of a city, counted in maintenance_requests."""
+    # One grouped query: every matching garage, joined to its requests per day within the range
+    cells = (
+        db.query(
+            Garage.id.label("garage_id"),
+            Garage.capacity,
+            MaintenanceRequest.scheduled_date,
+            func.count(MaintenanceRequest.id).label("requests"),
+        )
+        .outerjoin(
+            MaintenanceRequest,
+            (MaintenanceRequest.garage_id == Garage.id)
+            & (MaintenanceRequest.scheduled_date >= start_date)
+            & (MaintenanceRequest.scheduled_date <= end_date),
+        )
+        .filter(garage_filter(db, city, "city"))
+        .group_by(Garage.id, Garage.capacity, MaintenanceRequest.scheduled_date)
+        .order_by(Garage.id)
+        .all()
+    )
+
+    garage_ids, capacities, requests = [], [], []
+    for cell in cells:
+        if not garage_ids or garage_ids[-1] != cell.garage_id:
+            garage_ids.append(cell.garage_id)
+            capacities.append(cell.capacity)
+            requests.append([0] * ((end_date - start_date).days + 1))
+        # Garages without requests in the range come back as a single row with no date
+        if cell.scheduled_date is not None:
+            requests[-1][(cell.scheduled_date - start_date).days] = cell.requests
+    return garage_ids, capacities, requests
+
+
+def get_next_available_slots(db: Session, city: str, start_date: datetime.date, end_date: datetime.date, count: int):
+    """
+    The earliest ``count`` garage/day pairs with free capacity among the garages of a city, by day then garage.
+    Only the full days are read, in windows doubling from NEXT_AVAILABLE_WINDOW_DAYS since the answer is
+    usually in the first days; one pass over the days skips them, then the booked counts of the chosen
+    slots give their available capacity.
+    """
+    slots = []
+    window_start, window_days = start_date, NEXT_AVAILABLE_WINDOW_DAYS
+    while window_start <= end_date and len(slots) < count:
+        window_end = min(end_date, window_start + timedelta(days=window_days - 1))
+        garages, is_full = full_days_of_city(db, city, window_start, window_end)
+        for offset in range((window_end - window_start).days + 1):
+            for garage in garages:
+                if not is_full(garage, offset):
+                    slots.append((garage, window_start + timedelta(days=offset)))
+                    if len(slots) == count:
+                        break
+            if len(slots) == count:
+                break
+        window_start, window_days = window_end + timedelta(days=1), window_days * 2
+
+    booked = get_booked_many(db, [(garage.id, day) for garage, day in slots])
+    return [
+        {
+            "garageId": garage.id,
+            "garageName": garage.name,
+            "date": day.isoformat(),
+            "availableCapacity": max(0, garage.capacity - booked.get((garage.id, day), 0)),
+        }
+        for garage, day in slots
+    ]
+
+
+def full_days_of_city(db: Session, city: str, start_date: datetime.date, end_date: datetime.date):
+    """
+    The garages of a city by ID, and ``is_full(garage, offset)`` telling whether a garage is at full capacity
+    on the day ``offset`` days after start_date.
+    """
+    if occupancy_index.enabled:
+        garages = db.query(Garage.id, Garage.name, Garage.capacity).filter(
+            garage_filter(db, city, "city")
+        ).order_by(Garage.id).all()
+        calendars = {garage.id: occupancy_index.booked_range(db, garage.id, start_date, end_date) for garage in garages}
+        return garages, lambda garage, offset: calendars[garage.id][offset] >= garage.capacity
+
+    # One query: every garage of the city, joined to the counters of its full days within the range
+    rows = (
+        db.query(Garage.id, Garage.name, Garage.capacity, GarageOccupancy.scheduled_date)
+        .outerjoin(
+            GarageOccupancy,
+            (GarageOccupancy.garage_id == Garage.id)
+            & (GarageOccupancy.scheduled_date >= start_date)
+            & (GarageOccupancy.scheduled_date <= end_date)
+            & (GarageOccupancy.booked >= Garage.capacity),
+        )
+        .filter(garage_filter(db, city, "city"))
+        .order_by(Garage.id)
+        .all()
+    )
+    garages, full_days = [], set()
+    for row in rows:
+        if not garages or garages[-1].id != row.id:
+            garages.append(row)
+        if row.scheduled_date is not None:
+            full_days.add((row.id, (row.scheduled_date - start_date).days))
+    # A day without a counter row has nothing booked, which fills a garage without capacity
+    return garages, lambda garage, offset: garage.capacity <= 0 or (garage.id, offset) in full_days
@@ -0,0 +1,88 @@
+import re
+
+from sqlalchemy import delete, insert, select, true
+from sqlalchemy.orm import Session
+
+from app.models.garage import Garage
+from app.models.search import car_search, garage_search
+
+
+def search_enabled(db: Session) -> bool:
+    """The FTS5 indexes only exist on SQLite, other databases fall back to ILIKE filters."""
+    return db.get_bind().dialect.name == "sqlite"
+
+
+def match_expression(text: str, column: str = None) -> str:
+    """
+    Turn free text into an FTS5 query: every word must match as a prefix, optionally within one column.
+    Words are quoted, so user input can never inject FTS5 syntax.
+    """
+    words = re.findall(r"\w+", text)
+    terms = [f'"{word}"*' for word in words]
+    if column:
+        terms = [f"{column} : {term}" for term in terms]
+    return " AND ".join(terms) or '""'
+
+
+def matching_car_ids(text: str, column: str = None):
+    """Subquery of the ids of the cars matching ``text``."""
+    return select(car_search.c.rowid).where(car_search.c.car_search.match(match_expression(text, column)))
+
+
+def matching_garage_ids(text: str, column: str = None):
+    """Subquery of the ids of the garages matching ``text``."""
+    return select(garage_search.c.rowid).where(garage_search.c.garage_search.match(match_expression(text, column)))
+
+
+def garage_filter(db: Session, text: str, column: str):
+    """
+    Criterion selecting the garages whose ``column`` ("city" or "name") matches ``text``: the full-text index
+    when there is one, ILIKE otherwise. Every endpoint filtering garages uses it, so they agree on the garages.
+    """
+    if not text:
+        return true()  # Like an omitted filter of GET /garages
+    if search_enabled(db):
+        return Garage.id.in_(matching_garage_ids(text, column))
+    return getattr(Garage, column).ilike(f"%{text}%")
+
+
+def ranked_car_ids(db: Session, text: str, limit: int):
+    """Ids of the best matching cars, best match first."""
+    query = matching_car_ids(text).order_by(car_search.c.rank).limit(limit)
+    return db.scalars(query).all()
+
+
+def index_cars(db: Session, cars):
+    """Add or refresh the index entries of the cars, in the caller's transaction."""
+    if not search_enabled(db) or not cars:
+        return
+    unindex_cars(db, [car["id"] for car in cars])
+    db.execute(
+        insert(car_search),
+        [
+            {"rowid": car["id"], "make": car["make"], "model": car["model"], "license_plate": car["license_plate"]}
+            for car in cars
+        ],
+    )
+
+
+def index_car(db: Session, car):
+    index_cars(db, [{"id": car.id, "make": car.make, "model": car.model, "license_plate": car.license_plate}])
+
+
+def unindex_cars(db: Session, car_ids):
+    if search_enabled(db) and car_ids:
+        db.execute(delete(car_search).where(car_search.c.rowid.in_(car_ids)))
+
+
+def index_garage(db: Session, garage):
+    """Add or refresh the index entry of a garage, in the caller's transaction."""
+    if not search_enabled(db):
+        return
+    unindex_garage(db, garage.id)
+    db.execute(insert(garage_search).values(rowid=garage.id, name=garage.name, city=garage.city))
+
+
+def unindex_garage(db: Session, garage_id: int):
+    if search_enabled(db):
+        db.execute(delete(garage_search).where(garage_search.c.rowid == garage_id))
@@ -1,16 +1,127 @@
+import base64
+import json
+from datetime import date
+
 from fastapi import HTTPException
+from sqlalchemy import delete, insert, inspect, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
 
+# Page size bounds for the keyset-paginated list endpoints, without a limit or cursor they return MAX_PAGE_SIZE rows
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Largest number of values bound into a single IN (...) clause
+IN_CLAUSE_CHUNK = 500
+# Response header carrying the cursor of the next page, the body stays a plain list
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
 
-def get_or_404(db: Session, model, obj_id: int, detail: str):
-    """Retrieve an object or raise 404 if not found."""
-    obj = db.query(model).filter(model.id == obj_id).first()
+def get_or_404(db: Session, model, obj_id: int, detail: str, options=None):
+    """
+    Retrieve an object or raise 404 if not found.
+    Goes through the session's identity map, so an object already loaded in this request costs no query.
+    """
+    obj = db.get(model, obj_id, options=options)
     if not obj:
         raise HTTPException(status_code=404, detail=detail)
     return obj
 
 
 def update_relationship(db: Session, obj, relationship_attr, related_model, related_ids):
-    """Update many-to-many relationships for a given object."""
-    related_objects = db.query(related_model).filter(related_model.id.in_(related_ids)).all()
-    setattr(obj, relationship_attr, related_objects)
+    """
+    Update many-to-many relationships for a given object, in the caller's transaction.
+    Computes the difference with the current association rows and only deletes and inserts the changed
+    ones; the collection is never loaded. Related IDs that do not exist are skipped.
+    """
+    relationship = inspect(type(obj)).relationships[relationship_attr]
+    table = relationship.secondary
+    own_column = relationship.synchronize_pairs[0][1]
+    related_column = relationship.secondary_synchronize_pairs[0][1]
+
+    current = set(db.scalars(select(related_column).where(own_column == obj.id)))
+    wanted = set(related_ids)
+
+    removed = current - wanted
+    for chunk in chunked(removed):
+        db.execute(delete(table).where(own_column == obj.id, related_column.in_(chunk)))
+    added = []
+    for chunk in chunked(wanted - current):
+        added.extend(db.scalars(select(related_model.id).where(related_model.id.in_(chunk))))
+    if added:
+        db.execute(insert(table), [{own_column.key: obj.id, related_column.key: related_id} for related_id in added])
+
+    # The loaded collection, if any, no longer matches the association table
+    db.expire(obj, [relationship_attr])
+
+
+def encode_cursor(values) -> str:
+    """Encode the sort key of the last row of a page as an opaque cursor."""
+    raw = json.dumps([value.isoformat() if isinstance(value, date) else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str, columns) -> list:
+    """Decode a cursor produced by encode_cursor back into values for ``columns``."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("cursor does not match the sort key")
+        return [
+            date.fromisoformat(value) if column.type.python_type is date else column.type.python_type(value)
+            for column, value in zip(columns, values)
+        ]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor.")
+
+
+def paginate(query, columns, limit: int = None, after: str = None, key=None):
+    """
+    Keyset-paginate ``query`` ordered by ``columns``.
+    Returns the rows of the page and the cursor of the next page (None on the last page).
+    """
+    if after:
+        query = query.filter(tuple_(*columns) > tuple_(*decode_cursor(after, columns)))
+    query = query.order_by(*columns)
+    if limit is None:
+        return query.all(), None
+
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    key = key or (lambda row: [getattr(row, column.key) for column in columns])
+    return rows, encode_cursor(key(rows[-1]))
+
+
+def page_limit(limit: int = None, after: str = None):
+    """
+    Page size of a list endpoint: ``limit``, or DEFAULT_PAGE_SIZE when only a cursor is sent.
+    A bare request is capped at MAX_PAGE_SIZE rows, with X-Next-Cursor when there are more.
+    """
+    if limit is None:
+        return DEFAULT_PAGE_SIZE if after else MAX_PAGE_SIZE
+    return limit
+
+
+def set_next_cursor(response, next_cursor: str):
+    """Expose the next page cursor on the response, if there is one."""
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+
+def chunked(values, size: int = IN_CLAUSE_CHUNK):
+    """Split ``values`` into lists of at most ``size`` items, e.g. to bound IN (...) clauses."""
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def upsert(db: Session, model):
+    """INSERT of the session's dialect, with its ON CONFLICT clauses."""
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    return dialect.insert(model)
+
+
+def insert_ignore(db: Session, model):
+    """INSERT that silently skips rows whose primary key already exists."""
+    return upsert(db, model).on_conflict_do_nothing()
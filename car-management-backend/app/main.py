@@ -1,15 +1,61 @@
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from .routers import cars, garages, maintenance
-from app.models.database import Base, engine
+from app.models.database import Base, SessionLocal, async_engine, engine
+from app.models.migrations import autoincrement_maintenance_request_ids, create_missing_indexes
+from app.cruds.archive import start_archiver
+from app.cruds.occupancy import backfill_occupancy
+from app.cruds.occupancy_index import occupancy_index
+from app.cruds.garage_cache import garage_cache
+from app.cruds.report_cache import report_cache
+from app.cruds.utils import NEXT_CURSOR_HEADER
+from app.metrics import CONTENT_TYPE, REGISTRY, MetricsMiddleware, observe_cache, observe_pool, observe_session_checkout
+from app.profiling import SQL_HEADERS, SQLProfilingMiddleware, instrument_engine
+from app.settings import settings
+
+# Attribute the statements of both engines to the request running them
+instrument_engine(engine)
+if async_engine is not None:
+    instrument_engine(async_engine.sync_engine)
+
+# Metrics read at scrape time: pool usage, cache hit ratios, plus the session checkout wait
+observe_pool("sync", engine)
+if async_engine is not None:
+    observe_pool("async", async_engine.sync_engine)
+observe_cache("report", report_cache)
+observe_cache("garage", garage_cache)
+observe_session_checkout()
 
 # Initialize the database
 Base.metadata.create_all(bind=engine)
 
+# Add the indexes declared after the tables of an existing database were created
+create_missing_indexes(engine)
+
+# Stop SQLite from reusing the ids of deleted and archived maintenance requests
+autoincrement_maintenance_request_ids(engine)
+
+# Fill the garage/day occupancy counters of databases created before they existed, then load them into
+# the in-process calendar when it is enabled
+with SessionLocal() as db:
+    backfill_occupancy(db)
+    if occupancy_index.enabled:
+        occupancy_index.load(db)
+
+# Move the history past the retention period to the archive table, in small batches
+if settings.archive_after_days:
+    start_archiver(SessionLocal, settings.archive_after_days, settings.archive_interval_seconds)
+
 # Create the FastAPI app
 app = FastAPI()
 
+# Profile the SQL of every request: debug headers and the slow request log
+app.add_middleware(SQLProfilingMiddleware)
+
+# Count and time every request by route, for /metrics
+app.add_middleware(MetricsMiddleware)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -17,6 +63,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allow all HTTP methods
     allow_headers=["*"],  # Allow all headers
+    # Let the frontend read the pagination cursor, and the SQL summary when debugging
+    expose_headers=[NEXT_CURSOR_HEADER] + (SQL_HEADERS if settings.debug else []),
 )
 
 # Include Routers
@@ -28,3 +76,9 @@ app.include_router(maintenance.router, prefix="/maintenance", tags=["Maintenance
 @app.get("/")
 def root():
     return {"message": "Welcome to the Car Management API!"}
+
+
+# Prometheus scrape endpoint
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,278 @@
+import abc
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Latency buckets of the request histograms, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Buckets of the session checkout wait, usually far below a millisecond
+CHECKOUT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric(abc.ABC):
+    """
+    A metric family with a fixed set of label names; ``labels()`` returns the child of a label combination.
+    Children are created once and kept, so the hot path is a dict lookup and an increment under the child's own
+    lock: requests updating different routes never wait for each other. The family lock only guards creation.
+    """
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    @abc.abstractmethod
+    def _new_child(self):
+        """A child holding the value of one label combination."""
+
+    @abc.abstractmethod
+    def samples(self):
+        """(suffix, label values, extra label, value) of every sample."""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, values, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, values, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class _Value:
+    __slots__ = ("value", "_lock", "function")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+        self.function: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]):
+        """Read the value from ``function`` at scrape time."""
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def samples(self):
+        return [("", values, "", child.get()) for values, child in list(self._children.items())]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set_function(self, function: Callable[[], float]):
+        self.labels().set_function(function)
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def snapshot(self):
+        """The bucket counts and the sum, read together."""
+        with self._lock:
+            return list(self.counts), self.sum
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def samples(self):
+        samples = []
+        for values, child in list(self._children.items()):
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                samples.append(("_bucket", values, f'le="{le}"', cumulative))
+            samples.append(("_sum", values, "", total))
+            samples.append(("_count", values, "", cumulative))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+http_requests_total = REGISTRY.register(Counter(
+    "http_requests_total", "HTTP requests served, by route template and status.", ("method", "route", "status"),
+))
+http_request_duration_seconds = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Time to serve an HTTP request, by route template.", ("method", "route"),
+))
+http_requests_in_flight = REGISTRY.register(Gauge(
+    "http_requests_in_flight", "HTTP requests being served.",
+))
+db_session_checkout_seconds = REGISTRY.register(Histogram(
+    "db_session_checkout_seconds", "Wait of a session for its pooled connection.", buckets=CHECKOUT_BUCKETS,
+))
+db_pool_connections = REGISTRY.register(Gauge(
+    "db_pool_connections", "Connections of the engine pools, by state.", ("engine", "state"),
+))
+cache_requests_total = REGISTRY.register(Counter(
+    "cache_requests_total", "Lookups of the in-process caches, by result.", ("cache", "result"),
+))
+cache_hit_ratio = REGISTRY.register(Gauge(
+    "cache_hit_ratio", "Share of the lookups of an in-process cache served from it.", ("cache",),
+))
+capacity_rejections_total = REGISTRY.register(Counter(
+    "maintenance_capacity_rejections_total", "Bookings refused because the garage was full, by check.", ("check",),
+))
+
+
+def observe_pool(name: str, engine):
+    """Export the pool usage of an engine, read at scrape time."""
+    pool = engine.pool
+    if not hasattr(pool, "checkedout"):
+        return  # StaticPool/NullPool keep no usage counters
+    db_pool_connections.labels(name, "size").set_function(pool.size)
+    db_pool_connections.labels(name, "checked_out").set_function(pool.checkedout)
+    db_pool_connections.labels(name, "checked_in").set_function(pool.checkedin)
+    # Negative until the pool has opened pool_size connections
+    db_pool_connections.labels(name, "overflow").set_function(lambda: max(0, pool.overflow()))
+
+
+def observe_cache(name: str, cache):
+    """Export the hit/miss counters of a cache with ``hits`` and ``misses`` attributes, read at scrape time."""
+    cache_requests_total.labels(name, "hit").set_function(lambda: cache.hits)
+    cache_requests_total.labels(name, "miss").set_function(lambda: cache.misses)
+    cache_hit_ratio.labels(name).set_function(
+        lambda: cache.hits / (cache.hits + cache.misses) if cache.hits + cache.misses else 0.0
+    )
+
+
+def observe_session_checkout(session_class=Session):
+    """
+    Time the wait of sessions for a connection: from the first statement of a transaction until the
+    session has begun it on a pooled connection. AsyncSession runs on the same sync Session class.
+    """
+
+    @event.listens_for(session_class, "do_orm_execute")
+    def start_checkout(orm_execute_state):
+        session = orm_execute_state.session
+        if not session.in_transaction():
+            session.info["checkout_started"] = time.perf_counter()
+
+    @event.listens_for(session_class, "after_begin")
+    def end_checkout(session, transaction, connection):
+        started = session.info.pop("checkout_started", None)
+        if started is not None:
+            db_session_checkout_seconds.observe(time.perf_counter() - started)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware counting and timing every HTTP request by route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight = http_requests_in_flight.labels()
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            in_flight.dec()
+            # The template of the matched route keeps the label set bounded, unmatched paths share one label
+            route = scope.get("route")
+            route = getattr(route, "path", "unmatched")
+            http_requests_total.labels(scope["method"], route, str(status)).inc()
+            http_request_duration_seconds.labels(scope["method"], route).observe(elapsed)
@@ -0,0 +1,11 @@
+from sqlalchemy import Column, Integer, String
+
+from app.models.database import Base
+
+
+class CacheVersion(Base):
+    """ Version of a cached table, bumped by every write so that other processes drop their copies """
+    __tablename__ = "cache_versions"
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import Table, Column, Integer, ForeignKey, DateTime
+from sqlalchemy import Table, Column, Integer, ForeignKey, DateTime, Index
 
 from app.models.database import Base
 
@@ -9,4 +9,6 @@ car_garage_association = Table(
     Base.metadata,
     Column("car_id", Integer, ForeignKey("cars.id"), primary_key=True),
     Column("garage_id", Integer, ForeignKey("garages.id"), primary_key=True),
+    # The primary key leads with car_id, cars of a garage are looked up through this one
+    Index("ix_car_garage_association_garage_id_car_id", "garage_id", "car_id"),
 )
\ No newline at end of file
@@ -1,21 +1,105 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
 
-# Database URL for SQLite
-DATABASE_URL = "sqlite:///car_management.db"
+from app.settings import Settings, settings
+
+# Async driver used for each backend when no ASYNC_DATABASE_URL is configured
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+
+def engine_options(url: str, config: Settings, is_async: bool = False) -> dict:
+    """Keyword arguments of create_engine/create_async_engine for a database URL."""
+    url = make_url(url)
+    if url.get_backend_name() != "sqlite":
+        return {
+            "pool_size": config.pool_size,
+            "max_overflow": config.max_overflow,
+            "pool_timeout": config.pool_timeout,
+            "pool_pre_ping": True,
+        }
+
+    options = {"connect_args": {"check_same_thread": False}}
+    if url.database in (None, "", ":memory:"):
+        # Every session has to see the same in-memory database
+        options["poolclass"] = StaticPool
+    else:
+        # Pooled explicitly, the aiosqlite dialect would otherwise open a connection per checkout
+        options.update(
+            poolclass=AsyncAdaptedQueuePool if is_async else QueuePool,
+            pool_size=config.pool_size,
+            max_overflow=config.max_overflow,
+            pool_timeout=config.pool_timeout,
+        )
+    return options
+
+
+def apply_sqlite_pragmas(engine, config: Settings):
+    """Tune every new SQLite connection of ``engine``."""
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={config.sqlite_journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={config.sqlite_synchronous}")
+        cursor.execute(f"PRAGMA mmap_size={int(config.sqlite_mmap_size)}")
+        cursor.execute(f"PRAGMA cache_size={int(config.sqlite_cache_size)}")
+        cursor.execute(f"PRAGMA busy_timeout={int(config.sqlite_busy_timeout_ms)}")
+        cursor.close()
+
+
+def create_db_engine(config: Settings = settings):
+    """Build the sync engine described by the settings."""
+    engine = create_engine(config.database_url, **engine_options(config.database_url, config))
+    if engine.dialect.name == "sqlite":
+        apply_sqlite_pragmas(engine, config)
+    return engine
+
+
+def async_database_url(config: Settings = settings) -> str:
+    if config.async_database_url:
+        return config.async_database_url
+    url = make_url(config.database_url)
+    return str(url.set(drivername=f"{url.get_backend_name()}+{ASYNC_DRIVERS[url.get_backend_name()]}"))
+
+
+def create_async_db_engine(config: Settings = settings):
+    """Build the async engine described by the settings."""
+    url = async_database_url(config)
+    engine = create_async_engine(url, **engine_options(url, config, is_async=True))
+    if engine.dialect.name == "sqlite":
+        apply_sqlite_pragmas(engine.sync_engine, config)
+    return engine
+
+
+# Serve requests through the async driver instead of sync sessions in the threadpool
+DATABASE_ASYNC = settings.database_async
 
 # Create the engine
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_db_engine(settings)
 
 # Create a configured "SessionLocal" class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine and session factory, only built when enabled so the async driver stays optional
+async_engine = create_async_db_engine(settings) if DATABASE_ASYNC else None
+AsyncSessionLocal = (
+    async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False) if DATABASE_ASYNC else None
+)
+
 # Base class for database models
 Base = declarative_base()
 
-# Dependency for getting the database session
-def get_db():
+# Dependency for getting the database session, an AsyncSession in async mode
+async def get_db():
+    if DATABASE_ASYNC:
+        async with AsyncSessionLocal() as db:
+            yield db
+        return
+
     db = SessionLocal()
     try:
         yield db
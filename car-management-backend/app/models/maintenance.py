@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Date
+from sqlalchemy import Column, Integer, String, ForeignKey, Date, Index
 from sqlalchemy.orm import relationship
 
 from app.models.database import Base
@@ -21,3 +21,37 @@ class MaintenanceRequest(Base):
     # Relationships
     car = relationship("Car", back_populates="maintenance_requests")
     garage = relationship("Garage", back_populates="maintenance_requests")
+
+    __table_args__ = (
+        # Capacity checks, availability reports and per-garage listings
+        Index("ix_maintenance_requests_garage_id_scheduled_date", "garage_id", "scheduled_date"),
+        # Per-car listings, ordered by date
+        Index("ix_maintenance_requests_car_id_scheduled_date", "car_id", "scheduled_date"),
+        # Keyset pagination of the unfiltered listing and date-range filters
+        Index("ix_maintenance_requests_scheduled_date_id", "scheduled_date", "id"),
+        # Never hand out the id of a deleted or archived request again, archived ids must stay unique
+        {"sqlite_autoincrement": True},
+    )
+
+
+class ArchivedMaintenanceRequest(Base):
+    """
+    Maintenance request moved out of maintenance_requests by the archiver, see app/cruds/archive.py.
+    Same columns without the foreign keys, so archived history never blocks deleting a car or a garage.
+    """
+    __tablename__ = "maintenance_requests_archive"
+
+    id = Column(Integer, primary_key=True)
+    car_id = Column(Integer, nullable=False)
+    service_type = Column(String, nullable=False)
+    scheduled_date = Column(Date, nullable=False)
+    garage_id = Column(Integer, nullable=False)
+    car_name = Column(String, nullable=True)
+    garage_name = Column(String, nullable=True)
+
+    __table_args__ = (
+        Index("ix_maintenance_requests_archive_garage_id_scheduled_date", "garage_id", "scheduled_date"),
+        Index("ix_maintenance_requests_archive_car_id_scheduled_date", "car_id", "scheduled_date"),
+        # Keyset pagination, date-range filters and the watermark (MAX(scheduled_date))
+        Index("ix_maintenance_requests_archive_scheduled_date_id", "scheduled_date", "id"),
+    )
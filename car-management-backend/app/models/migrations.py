@@ -0,0 +1,66 @@
+from sqlalchemy import func, inspect, select, text
+
+from app.models.database import Base
+from app.models.maintenance import ArchivedMaintenanceRequest, MaintenanceRequest
+
+
+def create_missing_indexes(engine):
+    """
+    Create the indexes declared on the models that an existing database lacks.
+    create_all() skips tables that already exist, together with their indexes.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    created = []
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(connection)
+                    created.append(index.name)
+    return created
+
+
+def autoincrement_maintenance_request_ids(engine):
+    """
+    Rebuild a SQLite maintenance_requests table created without AUTOINCREMENT, which hands out the ids of
+    deleted and archived requests again, and start its id sequence after every id of the archive.
+    Returns whether the table was rebuilt.
+    """
+    if engine.dialect.name != "sqlite":
+        return False  # Sequences of server databases never go back
+    table = MaintenanceRequest.__table__
+    with engine.begin() as connection:
+        sql = connection.execute(
+            text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": table.name}
+        ).scalar()
+        if sql is None or "AUTOINCREMENT" in sql.upper():
+            return False
+
+        # No table references maintenance_requests, the old one can be renamed away and copied back
+        columns = ", ".join(f'"{column.name}"' for column in table.columns)
+        connection.execute(text(f'ALTER TABLE "{table.name}" RENAME TO "{table.name}_without_autoincrement"'))
+        for index in table.indexes:
+            connection.execute(text(f'DROP INDEX IF EXISTS "{index.name}"'))
+        table.create(connection)
+        connection.execute(
+            text(f'INSERT INTO "{table.name}" ({columns}) SELECT {columns} FROM "{table.name}_without_autoincrement"')
+        )
+        connection.execute(text(f'DROP TABLE "{table.name}_without_autoincrement"'))
+
+        # The copy set the sequence to the largest id left in the table, archived ids may be larger
+        archived = connection.scalar(select(func.max(ArchivedMaintenanceRequest.id)))
+        if archived:
+            sequence = connection.scalar(text("SELECT seq FROM sqlite_sequence WHERE name = :name"), {"name": table.name})
+            if sequence is None:
+                connection.execute(
+                    text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"), {"name": table.name, "seq": archived}
+                )
+            elif sequence < archived:
+                connection.execute(
+                    text("UPDATE sqlite_sequence SET seq = :seq WHERE name = :name"), {"name": table.name, "seq": archived}
+                )
+    return True
@@ -0,0 +1,12 @@
+from sqlalchemy import Column, Integer, ForeignKey, Date
+
+from app.models.database import Base
+
+
+class GarageOccupancy(Base):
+    """ Number of maintenance requests booked per garage and day """
+    __tablename__ = "garage_daily_occupancy"
+
+    garage_id = Column(Integer, ForeignKey("garages.id"), primary_key=True)
+    scheduled_date = Column(Date, primary_key=True)
+    booked = Column(Integer, default=0, nullable=False)
@@ -0,0 +1,37 @@
+from sqlalchemy import column, event, table
+
+from app.models.database import Base
+
+# FTS5 full-text indexes over the searchable columns, the rowid is the id of the car/garage
+car_search = table(
+    "car_search",
+    column("rowid"), column("make"), column("model"), column("license_plate"), column("rank"), column("car_search"),
+)
+garage_search = table(
+    "garage_search",
+    column("rowid"), column("name"), column("city"), column("rank"), column("garage_search"),
+)
+
+
+def create_search_tables(target, connection, **kw):
+    """Create the FTS5 tables next to the regular ones, and fill them for databases that predate them."""
+    if connection.dialect.name != "sqlite":
+        return
+
+    # prefix='2 3' keeps short prefix queries ("vw", "sof") on the index
+    connection.exec_driver_sql(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS car_search USING fts5(make, model, license_plate, prefix='2 3')"
+    )
+    connection.exec_driver_sql(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS garage_search USING fts5(name, city, prefix='2 3')"
+    )
+
+    if connection.exec_driver_sql("SELECT 1 FROM car_search LIMIT 1").first() is None:
+        connection.exec_driver_sql(
+            "INSERT INTO car_search (rowid, make, model, license_plate) SELECT id, make, model, license_plate FROM cars"
+        )
+    if connection.exec_driver_sql("SELECT 1 FROM garage_search LIMIT 1").first() is None:
+        connection.exec_driver_sql("INSERT INTO garage_search (rowid, name, city) SELECT id, name, city FROM garages")
+
+
+event.listen(Base.metadata, "after_create", create_search_tables)
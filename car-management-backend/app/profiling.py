@@ -0,0 +1,142 @@
+import heapq
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Response headers of the SQL summary, sent when debugging is on
+SQL_STATEMENTS_HEADER = "X-SQL-Statements"
+SQL_TIME_HEADER = "X-SQL-Time-Ms"
+SQL_REPEATED_HEADER = "X-SQL-Repeated-Statements"
+SQL_HEADERS = [SQL_STATEMENTS_HEADER, SQL_TIME_HEADER, SQL_REPEATED_HEADER]
+
+_IN_LIST = re.compile(r"\(\?(?:, \?)+\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """The statement without its layout and IN list lengths, equal for every execution of the same query."""
+    return _IN_LIST.sub("(?...)", _WHITESPACE.sub(" ", statement).strip())
+
+
+class RequestProfile:
+    """SQL executed on behalf of one request."""
+
+    __slots__ = ("statements", "db_time", "shapes", "slowest", "top")
+
+    def __init__(self, top: int):
+        self.statements = 0
+        self.db_time = 0.0
+        self.shapes = Counter()
+        self.slowest = []  # Min-heap of (duration, shape), the `top` slowest statements
+        self.top = top
+
+    def record(self, statement: str, duration: float):
+        shape = statement_shape(statement)
+        self.statements += 1
+        self.db_time += duration
+        self.shapes[shape] += 1
+        if len(self.slowest) < self.top:
+            heapq.heappush(self.slowest, (duration, shape))
+        elif duration > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (duration, shape))
+
+    def repeated(self, threshold: int):
+        """Shapes run at least ``threshold`` times, the N+1 pattern, most repeated first."""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def summary(self, repeat_threshold: int) -> dict:
+        return {
+            "statements": self.statements,
+            "dbTimeMs": round(self.db_time * 1000, 3),
+            "slowest": [
+                {"ms": round(duration * 1000, 3), "sql": shape}
+                for duration, shape in sorted(self.slowest, reverse=True)
+            ],
+            "repeated": [{"count": count, "sql": shape} for shape, count in self.repeated(repeat_threshold)],
+        }
+
+
+# Profile of the request being served; threadpool workers and AsyncSession.run_sync see it through the context
+current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("current_profile", default=None)
+
+
+def instrument_engine(engine):
+    """Record the statements of ``engine`` into the profile of the current request, if any."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        if current_profile.get() is not None:
+            conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        profile = current_profile.get()
+        if profile is not None and conn.info.get("profile_started"):
+            profile.record(statement, time.perf_counter() - conn.info["profile_started"].pop())
+
+
+class SQLProfilingMiddleware:
+    """
+    Pure ASGI middleware profiling the SQL of every HTTP request.
+    Adds the summary to the response headers when ``debug`` is on, and logs the requests slower than
+    ``slow_request_ms`` or running a statement ``repeat_threshold`` times, with their slowest and repeated statements.
+    """
+
+    def __init__(
+        self,
+        app,
+        debug: bool = settings.debug,
+        slow_request_ms: int = settings.slow_request_ms,
+        slowest_statements: int = settings.sql_slowest_statements,
+        repeat_threshold: int = settings.sql_repeat_threshold,
+    ):
+        self.app = app
+        self.debug = debug
+        self.slow_request_ms = slow_request_ms
+        self.slowest_statements = slowest_statements
+        self.repeat_threshold = repeat_threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(self.slowest_statements)
+        token = current_profile.set(profile)
+        started = time.perf_counter()
+
+        async def send_with_summary(message):
+            if message["type"] == "http.response.start" and self.debug:
+                repeated = profile.repeated(self.repeat_threshold)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (SQL_STATEMENTS_HEADER.lower().encode(), str(profile.statements).encode()),
+                    (SQL_TIME_HEADER.lower().encode(), f"{profile.db_time * 1000:.3f}".encode()),
+                    (SQL_REPEATED_HEADER.lower().encode(), str(repeated[0][1] if repeated else 0).encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_summary)
+        finally:
+            current_profile.reset(token)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            slow = bool(self.slow_request_ms) and elapsed_ms >= self.slow_request_ms
+            if slow or profile.repeated(self.repeat_threshold):
+                logger.warning(
+                    "%s %s %s took %.1f ms, SQL: %s",
+                    "Slow request" if slow else "Repeated statements in",
+                    scope["method"],
+                    scope["path"],
+                    elapsed_ms,
+                    json.dumps(profile.summary(self.repeat_threshold)),
+                )
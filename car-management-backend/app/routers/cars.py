@@ -1,21 +1,17 @@
 from typing import List, Optional
 from sqlalchemy.orm import Session
-from fastapi import APIRouter, HTTPException, Depends
-from app.models.database import SessionLocal
-from app.schemas.car import CarResponse, CarCreate, CarUpdate
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from app.models.database import get_db
+from app.schemas.car import CarBulkResponse, CarResponse, CarCreate, CarUpdate
 from app.models.car import Car  # Assuming Car is the SQLAlchemy model for cars
-from app.cruds.car import create_car, get_cars, get_car, update_car, delete_car  # CRUD methods
+from app.cruds.aio import create_car, create_cars, get_cars, get_car, search_cars, update_car, delete_car  # CRUD methods
+from app.cruds.utils import MAX_PAGE_SIZE, page_limit, set_next_cursor
+from app.schemas.garage import GarageResponse
+from app.serialization import SchemaEncoder, fast_json_response
+from app.settings import settings
 
 router = APIRouter()
 
-# Get the database session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 
 def map_car_to_response(car: Car) -> CarResponse:
     """Map SQLAlchemy Car model to CarResponse schema."""
@@ -39,43 +35,85 @@ def map_car_to_response(car: Car) -> CarResponse:
     )
 
 
+# CarResponse field map of the fast JSON mode
+encode_car = SchemaEncoder(CarResponse, garages=SchemaEncoder(GarageResponse))
+
+
+def car_response(car: Car):
+    """The response of a car, encoded straight to JSON in fast mode."""
+    if settings.fast_json:
+        return fast_json_response(encode_car(car))
+    return map_car_to_response(car)
+
+
+def cars_response(cars: List[Car], response: Response = None):
+    """The response of a list of cars, encoded straight to JSON in fast mode."""
+    if settings.fast_json:
+        return fast_json_response(encode_car.many(cars), response)
+    return [map_car_to_response(car) for car in cars]
+
+
 @router.post("/", response_model=CarResponse)
-def create_car_endpoint(car: CarCreate, db: Session = Depends(get_db)):
-    db_car = create_car(db=db, car=car)  # Call the create_car function from your CRUD module
-    return map_car_to_response(db_car)
+async def create_car_endpoint(car: CarCreate, db: Session = Depends(get_db)):
+    db_car = await create_car(db=db, car=car)  # Call the create_car function from your CRUD module
+    return car_response(db_car)
+
+
+@router.post("/bulk", response_model=CarBulkResponse)
+async def create_cars_bulk_endpoint(cars: List[CarCreate], db: Session = Depends(get_db)):
+    created, errors = await create_cars(db=db, cars=cars)
+    if settings.fast_json:
+        return fast_json_response({"created": encode_car.many(created), "errors": errors})
+    return CarBulkResponse(created=[map_car_to_response(car) for car in created], errors=errors)
 
 
 @router.get("/", response_model=List[CarResponse])
-def list_cars_endpoint(
+async def list_cars_endpoint(
+    response: Response,
     carMake: Optional[str] = None,
     garageId: Optional[int] = None,
     fromYear: Optional[int] = None,
     toYear: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
     db: Session = Depends(get_db),
 ):
-    cars = get_cars(db=db, make=carMake, garage_id=garageId, from_year=fromYear, to_year=toYear)
-    return [map_car_to_response(car) for car in cars]
+    cars, next_cursor = await get_cars(
+        db=db, make=carMake, garage_id=garageId, from_year=fromYear, to_year=toYear, limit=page_limit(limit, after), after=after
+    )
+    set_next_cursor(response, next_cursor)
+    return cars_response(cars, response)
+
+
+@router.get("/search", response_model=List[CarResponse])
+async def search_cars_endpoint(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+):
+    """Prefix search over make, model and license plate, best match first."""
+    return cars_response(await search_cars(db=db, text=q, limit=limit))
 
 
 @router.get("/{id}", response_model=CarResponse)
-def get_car_endpoint(id: int, db: Session = Depends(get_db)):
-    car = get_car(db=db, car_id=id)
+async def get_car_endpoint(id: int, db: Session = Depends(get_db)):
+    car = await get_car(db=db, car_id=id)
     if not car:
         raise HTTPException(status_code=404, detail="Car not found")
-    return map_car_to_response(car)
+    return car_response(car)
 
 
 @router.put("/{id}", response_model=CarResponse)
-def update_car_endpoint(id: int, car: CarUpdate, db: Session = Depends(get_db)):
-    updated_car = update_car(db=db, car_id=id, car=car)
+async def update_car_endpoint(id: int, car: CarUpdate, db: Session = Depends(get_db)):
+    updated_car = await update_car(db=db, car_id=id, car=car)
     if not updated_car:
         raise HTTPException(status_code=404, detail="Car not found")
-    return map_car_to_response(updated_car)
+    return car_response(updated_car)
 
 
 @router.delete("/{id}", response_model=dict)
-def delete_car_endpoint(id: int, db: Session = Depends(get_db)):
-    deleted_car = delete_car(db=db, car_id=id)
+async def delete_car_endpoint(id: int, db: Session = Depends(get_db)):
+    deleted_car = await delete_car(db=db, car_id=id)
     if not deleted_car:
         raise HTTPException(status_code=404, detail="Car not found")
     return {"message": f"Car with ID {id} deleted successfully"}
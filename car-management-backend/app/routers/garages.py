@@ -1,14 +1,20 @@
 from datetime import datetime
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 
 from sqlalchemy.orm import Session
 
-from app.cruds import garage as garage_crud
-from app.cruds.reports import get_daily_availability_report, get_monthly_requests_report
+from app.cruds import aio as garage_crud
+from app.cruds.aio import get_availability_matrix, get_daily_availability_report
+from app.cruds.report_cache import cached_report
+from app.cruds.utils import MAX_PAGE_SIZE, page_limit, set_next_cursor
 
-from app.models.database import SessionLocal
+from app.models.database import get_db
+from app.serialization import SchemaEncoder, fast_json_response
+from app.settings import settings
 from app.schemas.garage import (
+    GarageCarsUpdate,
+    GarageCarsUpdateResponse,
     GarageCreate,
     GarageResponse,
     GarageUpdate,
@@ -17,46 +23,111 @@ from app.schemas.garage import (
 
 router = APIRouter()
 
+# GarageResponse field map of the fast JSON mode
+encode_garage = SchemaEncoder(GarageResponse)
 
-# Dependency to get the database session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+
+def garage_response(garage):
+    """The response of a garage, encoded straight to JSON in fast mode."""
+    return fast_json_response(encode_garage(garage)) if settings.fast_json else garage
 
 
 @router.post("/", response_model=GarageResponse)
-def create_garage_endpoint(garage: GarageCreate, db: Session = Depends(get_db)):
+async def create_garage_endpoint(garage: GarageCreate, db: Session = Depends(get_db)):
     try:
-        return garage_crud.create_garage(db=db, garage=garage)
+        return garage_response(await garage_crud.create_garage(db=db, garage=garage))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/", response_model=List[GarageResponse])
-def list_garages_endpoint(city: Optional[str] = None, db: Session = Depends(get_db)):
-    return garage_crud.get_garages(db=db, city=city)
+async def list_garages_endpoint(
+    response: Response,
+    city: Optional[str] = None,
+    name: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    garages, next_cursor = await garage_crud.get_garages(db=db, city=city, name=name, limit=page_limit(limit, after), after=after)
+    set_next_cursor(response, next_cursor)
+    if settings.fast_json:
+        return fast_json_response(encode_garage.many(garages), response)
+    return garages
 
 @router.get("/{id:int}", response_model=GarageResponse)
-def get_garage_endpoint(id: int, db: Session = Depends(get_db)):
-    garage = garage_crud.get_garage(db=db, garage_id=id)
+async def get_garage_endpoint(id: int, db: Session = Depends(get_db)):
+    garage = await garage_crud.get_garage(db=db, garage_id=id)
     if not garage:
         raise HTTPException(status_code=404, detail="Garage not found")
-    return garage
+    return garage_response(garage)
 
 
 @router.put("/{id}", response_model=GarageResponse)
-def update_garage_endpoint(id: int, garage: GarageUpdate, db: Session = Depends(get_db)):
-    updated_garage = garage_crud.update_garage(db=db, garage_id=id, garage=garage)
+async def update_garage_endpoint(id: int, garage: GarageUpdate, db: Session = Depends(get_db)):
+    updated_garage = await garage_crud.update_garage(db=db, garage_id=id, garage=garage)
     if not updated_garage:
         raise HTTPException(status_code=404, detail="Garage not found")
-    return updated_garage
+    return garage_response(updated_garage)
+
+
+@router.post("/{id}/cars", response_model=GarageCarsUpdateResponse)
+async def update_garage_cars_endpoint(id: int, cars: GarageCarsUpdate, db: Session = Depends(get_db)):
+    """
+    Attach and detach cars of a garage in bulk, e.g. for fleet reassignments.
+    """
+    return await garage_crud.update_garage_cars(db=db, garage_id=id, attach=cars.attach, detach=cars.detach)
+
+
+# Longest range served by the availability matrix, in days
+MAX_MATRIX_DAYS = 366
+
+
+def parse_date_range(start_date: str, end_date: str):
+    """
+    Parse a `startDate`/`endDate` pair in YYYY-MM-DD format and validate that start_date <= end_date.
+    """
+    try:
+        start_date_parsed = datetime.strptime(start_date, "%Y-%m-%d").date()
+        end_date_parsed = datetime.strptime(end_date, "%Y-%m-%d").date()
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid date format. Expected YYYY-MM-DD. Error: {e}"
+        )
+
+    if start_date_parsed > end_date_parsed:
+        raise HTTPException(
+            status_code=400,
+            detail="Start date cannot be after end date."
+        )
+    return start_date_parsed, end_date_parsed
+
+
+@router.get("/availabilityMatrix")
+async def availability_matrix(
+    city: str,
+    start_date: str = Query(..., alias="startDate"),
+    end_date: str = Query(..., alias="endDate"),
+    db: Session = Depends(get_db),
+):
+    """
+    Generate the garage x day availability matrix for all garages of a city.
+    """
+    start_date_parsed, end_date_parsed = parse_date_range(start_date, end_date)
+    if (end_date_parsed - start_date_parsed).days >= MAX_MATRIX_DAYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Date range cannot be longer than {MAX_MATRIX_DAYS} days."
+        )
+
+    return await get_availability_matrix(db, city, start_date_parsed, end_date_parsed)
 
 
 @router.get("/dailyAvailabilityReport")
-def daily_availability_report(
+async def daily_availability_report(
+    request: Request,
+    response: Response,
     garage_id: str = Query(..., alias="garageId"),  # Expect `garageId` as a string from frontend
     start_date: str = Query(..., alias="startDate"),  # Expect `startDate` as a string
     end_date: str = Query(..., alias="endDate"),  # Expect `endDate` as a string
@@ -64,6 +135,7 @@ def daily_availability_report(
 ):
     """
     Generate a daily availability report for a garage.
+    Results are cached until a maintenance write touches the garage; send If-None-Match to get a 304.
     """
 
     # Step 1: Convert `garageId` to integer
@@ -75,26 +147,19 @@ def daily_availability_report(
             detail="Invalid garageId. It must be an integer."
         )
 
-    # Step 2: Parse `startDate` and `endDate`
-    try:
-        start_date_parsed = datetime.strptime(start_date, "%Y-%m-%d").date()
-        end_date_parsed = datetime.strptime(end_date, "%Y-%m-%d").date()
-    except ValueError as e:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Invalid date format. Expected YYYY-MM-DD. Error: {e}"
-        )
-
-    # Step 3: Validate that start_date <= end_date
-    if start_date_parsed > end_date_parsed:
-        raise HTTPException(
-            status_code=400,
-            detail="Start date cannot be after end date."
-        )
+    # Step 2 and 3: Parse `startDate` and `endDate` and validate that start_date <= end_date
+    start_date_parsed, end_date_parsed = parse_date_range(start_date, end_date)
 
-    # Step 4: Generate the report
+    # Step 4: Generate the report, or serve it from the report cache
     try:
-        report = get_daily_availability_report(db, garage_id, start_date_parsed, end_date_parsed)
+        report = await cached_report(
+            db,
+            request,
+            response,
+            ("dailyAvailability", garage_id, start_date_parsed, end_date_parsed),
+            [garage_id],
+            lambda: get_daily_availability_report(db, garage_id, start_date_parsed, end_date_parsed),
+        )
 
     except Exception as e:
         raise HTTPException(
@@ -105,8 +170,8 @@ def daily_availability_report(
     return report
 
 @router.delete("/{id}", response_model=dict)
-def delete_garage_endpoint(id: int, db: Session = Depends(get_db)):
-    deleted_garage = garage_crud.delete_garage(db=db, garage_id=id)
+async def delete_garage_endpoint(id: int, db: Session = Depends(get_db)):
+    deleted_garage = await garage_crud.delete_garage(db=db, garage_id=id)
     if not deleted_garage:
         raise HTTPException(status_code=404, detail="Garage not found")
     return {"message": f"Garage with ID {id} deleted successfully"}
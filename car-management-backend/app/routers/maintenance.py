@@ -1,128 +1,196 @@
-from datetime import datetime
-
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session, class_mapper
-from app.cruds.reports import get_monthly_requests_report
-from app.models.database import SessionLocal
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from app.cruds.report_cache import cached_report
+from app.models.database import SessionLocal, get_db
 from app.schemas.maintenance import (
+    MaintenanceRequestBulkResponse,
     MaintenanceRequestResponse,
     MaintenanceRequestCreate,
     MaintenanceRequestUpdate,
+    MaintenanceReschedule,
+    MaintenanceRescheduleResponse,
 )
-from app.cruds import maintenance as maintenance_crud
+from app.cruds import aio as maintenance_crud
+from app.cruds.maintenance import iter_maintenance_request_rows
+from app.cruds.utils import MAX_PAGE_SIZE, page_limit, set_next_cursor
+from app.serialization import SchemaEncoder, fast_json_response
+from app.settings import settings
 
 
 router = APIRouter()
 
-def sqlalchemy_to_dict(model_instance):
-    result = {
-        column.name: getattr(model_instance, column.name)
-        for column in class_mapper(model_instance.__class__).columns
-    }
-
-    return {
-        "id": result.get("id"),
-        "carId": result.get("car_id"),
-        "carName": model_instance.car.make if model_instance.car else None,
-        "serviceType": result.get("service_type"),
-        "scheduledDate": result.get("scheduled_date"),
-        "garageId": result.get("garage_id"),
-        "garageName": model_instance.garage.name if model_instance.garage else None,
-    }
-
-def get_db():
-    """
-    Dependency to provide a database session.
-    """
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# MaintenanceRequestResponse field map of the fast JSON mode, over the camelCase rows of the CRUD layer
+encode_request = SchemaEncoder(MaintenanceRequestResponse, from_aliases=True)
+
+
+def request_response(row):
+    """The response of a maintenance request row, encoded straight to JSON in fast mode."""
+    return fast_json_response(encode_request(row)) if settings.fast_json else row
 
 @router.post("/", response_model=MaintenanceRequestResponse)
-def create_maintenance_request(
+async def create_maintenance_request(
     request: MaintenanceRequestCreate,
     db: Session = Depends(get_db)
 ):
-
-    if maintenance_crud.is_garage_full(db, request.garage_id, request.scheduled_date):
-        raise HTTPException(
-            status_code=400,
-            detail="Garage is at capacity for the selected date."
-        )
-
-    db_maintenance_request = maintenance_crud.create_maintenance_request(
-        db=db,
-        maintenance_request=request
+    # The CRUD layer checks the capacity while taking the slot and returns the response row
+    return request_response(
+        await maintenance_crud.create_maintenance_request(db=db, maintenance_request=request)
     )
 
-    if not db_maintenance_request:
-        raise HTTPException(status_code=400, detail="Failed to create maintenance request.")
+@router.post("/bulk", response_model=MaintenanceRequestBulkResponse)
+async def create_maintenance_requests_bulk(
+    requests: list[MaintenanceRequestCreate],
+    db: Session = Depends(get_db)
+):
+    created, errors = await maintenance_crud.create_maintenance_requests(db=db, maintenance_requests=requests)
+    if settings.fast_json:
+        return fast_json_response({"created": encode_request.many(created), "errors": errors})
+    return {"created": created, "errors": errors}
 
-    return sqlalchemy_to_dict(db_maintenance_request)
+@router.post("/reschedule", response_model=MaintenanceRescheduleResponse)
+async def reschedule_maintenance_requests(reschedule: MaintenanceReschedule, db: Session = Depends(get_db)):
+    """
+    Move every request of a garage within a date range to a target garage and date, or spread them over its
+    next free days, in one transaction; nothing moves if the target lacks capacity for all of them.
+    """
+    return await maintenance_crud.reschedule_maintenance_requests(db=db, reschedule=reschedule)
 
 @router.get("/", response_model=list[MaintenanceRequestResponse])
-def list_maintenance_requests(carId: int = None, garageId: int = None, startDate: str = None, endDate: str = None,
-                              db: Session = Depends(get_db)):
-    requests = maintenance_crud.get_maintenance_requests(db=db, car_id=carId, garage_id=garageId, start_date=startDate,
-                                                         end_date=endDate)
+async def list_maintenance_requests(response: Response, carId: int = None, garageId: int = None, startDate: str = None,
+                              endDate: str = None, limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+                              after: str = None, db: Session = Depends(get_db)):
+    rows, next_cursor = await maintenance_crud.get_maintenance_request_rows(db=db, car_id=carId, garage_id=garageId,
+                                                                      start_date=startDate, end_date=endDate,
+                                                                      limit=page_limit(limit, after), after=after)
+    set_next_cursor(response, next_cursor)
+    if settings.fast_json:
+        return fast_json_response(encode_request.many(rows), response)
+    return rows
+
+
+# Days searched by nextAvailable, starting from its first candidate day
+NEXT_AVAILABLE_HORIZON_DAYS = 366
+MAX_NEXT_AVAILABLE = 100
+
+
+@router.get("/nextAvailable")
+async def next_available_slots(
+    city: str,
+    after: str = None,
+    count: int = Query(10, ge=1, le=MAX_NEXT_AVAILABLE),
+    serviceType: str = None,
+    db: Session = Depends(get_db),
+):
+    """
+    The earliest garage/date pairs with free capacity in a city, from today or the day after `after`
+    (YYYY-MM-DD), over the next year. Garages do not record the services they offer, so `serviceType`
+    does not narrow the search.
+    """
+    start_date = date.today()
+    if after:
+        try:
+            start_date = max(start_date, datetime.strptime(after, "%Y-%m-%d").date() + timedelta(days=1))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD format.")
+    end_date = start_date + timedelta(days=NEXT_AVAILABLE_HORIZON_DAYS - 1)
+    return await maintenance_crud.get_next_available_slots(db, city, start_date, end_date, count)
+
 
-    return [sqlalchemy_to_dict(request) for request in requests]
+# Rows buffered before a chunk of the export is flushed to the client: the first row goes out alone, with the
+# CSV header, then the chunks double up to EXPORT_CHUNK_ROWS
+EXPORT_CHUNK_ROWS = 500
+EXPORT_COLUMNS = ["id", "carId", "carName", "serviceType", "scheduledDate", "garageId", "garageName"]
+
+
+def export_rows(export_format: str, **filters):
+    """
+    Encode the filtered maintenance history in chunks growing from one row to EXPORT_CHUNK_ROWS, so the client
+    gets the first row as soon as it is read.
+    Owns its session because the response body is produced after the request dependencies exit.
+    """
+    db = SessionLocal()
+    try:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if export_format == "csv":
+            writer.writerow(EXPORT_COLUMNS)
+
+        buffered, chunk_rows = 0, 1
+        for row in iter_maintenance_request_rows(db, **filters):
+            if export_format == "csv":
+                writer.writerow([row[column] for column in EXPORT_COLUMNS])
+            else:
+                buffer.write(json.dumps({column: row[column] for column in EXPORT_COLUMNS}, default=str))
+                buffer.write("\n")
+            buffered += 1
+            if buffered == chunk_rows:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                buffered, chunk_rows = 0, min(chunk_rows * 2, EXPORT_CHUNK_ROWS)
+        if buffer.tell():
+            yield buffer.getvalue()
+    finally:
+        db.close()
+
+
+@router.get("/export")
+async def export_maintenance_requests(carId: int = None, garageId: int = None, startDate: str = None, endDate: str = None,
+                                format: str = Query("ndjson", pattern="^(ndjson|csv)$")):
+    """
+    Stream the maintenance history as NDJSON or CSV, with the same filters as the listing.
+    """
+    rows = export_rows(format, car_id=carId, garage_id=garageId, start_date=startDate, end_date=endDate)
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        rows,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=maintenance-history.{format}"},
+    )
 
 
 @router.get("/{id:int}", response_model=MaintenanceRequestResponse)
-def get_maintenance_request(id: int, db: Session = Depends(get_db)):
+async def get_maintenance_request(id: int, db: Session = Depends(get_db)):
 
-    db_request = maintenance_crud.get_maintenance_request(db=db, request_id=id)
+    db_request = await maintenance_crud.get_maintenance_request_row(db=db, request_id=id)
     if not db_request:
         raise HTTPException(status_code=404, detail="Maintenance request not found.")
-    return sqlalchemy_to_dict(db_request)
+    return request_response(db_request)
 
 @router.put("/{id}", response_model=MaintenanceRequestResponse)
-def update_maintenance_request(
+async def update_maintenance_request(
     id: int,
     request: MaintenanceRequestUpdate,
     db: Session = Depends(get_db)
 ):
-    existing_request = maintenance_crud.get_maintenance_request(db=db, request_id=id)
-    if not existing_request:
-        raise HTTPException(status_code=404, detail="Maintenance request not found.")
-
-    date_changed = (request.scheduled_date != existing_request.scheduled_date)
-    garage_changed = (request.garage_id != existing_request.garage_id)
-
-    if date_changed or garage_changed:
-        if maintenance_crud.is_garage_full(db, request.garage_id, request.scheduled_date):
-            raise HTTPException(
-                status_code=400,
-                detail="Garage is at capacity for the selected date."
-            )
-
-    updated_request = maintenance_crud.update_maintenance_request(
-        db=db,
-        request_id=id,
-        maintenance_request=request
+    # Omitted fields keep their value; the capacity is checked only when the booking moves
+    return request_response(
+        await maintenance_crud.update_maintenance_request(db=db, request_id=id, maintenance_request=request)
     )
-    if not updated_request:
-        raise HTTPException(status_code=404, detail="Failed to update maintenance request.")
-
-    return sqlalchemy_to_dict(updated_request)
 
 @router.delete("/{id}", response_model=dict)
-def delete_maintenance_request(id: int, db: Session = Depends(get_db)):
+async def delete_maintenance_request(id: int, db: Session = Depends(get_db)):
 
-    deleted_request = maintenance_crud.delete_maintenance_request(db=db, request_id=id)
+    deleted_request = await maintenance_crud.delete_maintenance_request(db=db, request_id=id)
     if not deleted_request:
         raise HTTPException(status_code=404, detail="Maintenance request not found.")
     return {"message": f"Maintenance request with ID {id} deleted successfully."}
 
 
 @router.get("/monthlyRequestsReport")
-def monthly_requests_report(
+async def monthly_requests_report(
     startMonth: str,
     endMonth: str,
-    garage_id: int = Query(alias="garageId"),
+    request: Request,
+    response: Response,
+    garage_ids: list[int] = Query(alias="garageId"),  # Repeat garageId to aggregate several garages
     db: Session = Depends(get_db),
 ):
 
@@ -135,7 +203,14 @@ def monthly_requests_report(
     if start_date > end_date:
         raise HTTPException(status_code=400, detail="Start month cannot be after end month.")
 
-    # Generate the report
-    report = get_monthly_requests_report(db, garage_id, start_date, end_date)
+    # Generate the report, or serve it from the report cache (304 on a matching If-None-Match)
+    report = await cached_report(
+        db,
+        request,
+        response,
+        ("monthlyRequests", tuple(sorted(set(garage_ids))), start_date, end_date),
+        garage_ids,
+        lambda: maintenance_crud.get_monthly_requests_report(db, garage_ids, start_date, end_date),
+    )
 
     return report
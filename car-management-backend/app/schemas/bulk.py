@@ -0,0 +1,6 @@
+from pydantic import BaseModel
+
+
+class BulkItemError(BaseModel):
+    index: int  # Position of the rejected item in the submitted batch
+    detail: str
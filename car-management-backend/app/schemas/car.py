@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
 from typing import List, Optional
+from app.schemas.bulk import BulkItemError
 from app.schemas.garage import GarageResponse
 
 
@@ -29,3 +30,8 @@ class CarResponse(CarBase):
     class Config:
         orm_mode = True
         allow_population_by_field_name = True  # Allow both `licensePlate` and `license_plate`
+
+
+class CarBulkResponse(BaseModel):
+    created: List[CarResponse]
+    errors: List[BulkItemError]  # Items that were rejected, by position in the batch
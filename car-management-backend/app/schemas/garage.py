@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 
 
 class GarageBase(BaseModel):
@@ -25,3 +25,17 @@ class GarageResponse(GarageBase):
 
     class Config:
         orm_mode = True
+
+
+class GarageCarsUpdate(BaseModel):
+    attach: List[int] = []  # Car IDs to link to the garage
+    detach: List[int] = []  # Car IDs to unlink from the garage
+
+
+class GarageCarsUpdateResponse(BaseModel):
+    garage_id: int = Field(..., alias="garageId")
+    attached: int  # Links created
+    detached: int  # Links removed
+
+    class Config:
+        allow_population_by_field_name = True
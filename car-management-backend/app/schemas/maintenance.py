@@ -1,6 +1,7 @@
 from datetime import date
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
+from app.schemas.bulk import BulkItemError
 
 
 class MaintenanceRequestCreate(BaseModel):
@@ -38,3 +39,34 @@ class MaintenanceRequestResponse(BaseModel):
     class Config:
         orm_mode = True
         allow_population_by_field_name = True  # Allows using both snake_case and camelCase
+
+
+class MaintenanceRequestBulkResponse(BaseModel):
+    created: List[MaintenanceRequestResponse]
+    errors: List[BulkItemError]  # Items that were rejected, by position in the batch
+
+
+class MaintenanceReschedule(BaseModel):
+    garage_id: int = Field(..., alias="garageId")
+    start_date: date = Field(..., alias="startDate")
+    end_date: Optional[date] = Field(None, alias="endDate")  # Defaults to startDate
+    target_garage_id: Optional[int] = Field(None, alias="targetGarageId")  # Defaults to garageId
+    target_date: Optional[date] = Field(None, alias="targetDate")
+    spread: bool = False  # Fill the free days from targetDate (or the day after endDate) instead of one day
+
+    class Config:
+        allow_population_by_field_name = True  # Allows using both snake_case and camelCase
+
+
+class RescheduledRequest(BaseModel):
+    id: int
+    garage_id: int = Field(..., alias="garageId")
+    scheduled_date: date = Field(..., alias="scheduledDate")
+
+    class Config:
+        allow_population_by_field_name = True  # Allows using both snake_case and camelCase
+
+
+class MaintenanceRescheduleResponse(BaseModel):
+    moved: int
+    requests: List[RescheduledRequest]
@@ -0,0 +1,260 @@
+"""
+Micro-benchmarks of the CRUD layer with a stored baseline.
+
+Every case calls a function of app/cruds against an in-memory SQLite database seeded with a synthetic fleet,
+at several data sizes, and records its median time and the SQL statements it ran. The results are compared
+with benchmarks/crud_baseline.json: a case regresses when it runs more statements than the baseline. A median
+time grown by more than the threshold is reported, and only fails the run with --check-timings.
+
+    python -m benchmarks.crud [--sizes small,medium] [--output crud.json]
+    python -m benchmarks.crud --check-timings [--threshold 0.25]
+    python -m benchmarks.crud --update-baseline
+
+Statement counts are exact; timings depend on the machine, refresh the baseline before checking them.
+"""
+import argparse
+import itertools
+import json
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.cruds import car as car_crud
+from app.cruds import garage as garage_crud
+from app.cruds import maintenance as maintenance_crud
+from app.cruds import reports
+from app.cruds.garage_cache import garage_cache
+from app.cruds.occupancy_index import occupancy_index
+from app.cruds.utils import update_relationship
+from app.models.car import Car
+from app.models.database import Base
+from app.models.garage import Garage
+from app.schemas.maintenance import MaintenanceRequestCreate, MaintenanceRequestUpdate, MaintenanceReschedule
+from benchmarks.fleet import AHEAD_DAYS, generate_fleet, seed_fleet
+
+# (garages, cars, maintenance requests)
+SIZES = {
+    "small": (10, 500, 5000),
+    "medium": (50, 5000, 50000),
+    "large": (200, 20000, 200000),
+}
+DEFAULT_SIZES = "small,medium"
+BASELINE_PATH = Path(__file__).with_name("crud_baseline.json")
+# Relative slowdown flagged as a regression, and the absolute one below which timings are noise
+DEFAULT_THRESHOLD = 0.25
+MIN_DELTA_MS = 0.1
+
+
+def cases(garages: int):
+    """(name, call(db, iteration))"""
+    today = date.today()
+    get_cars_filters = {
+        "make": {"make": "Volkswagen"},
+        "garage": {"garage_id": 1},
+        "years": {"from_year": 2005, "to_year": 2015},
+    }
+
+    def get_cars_case(filters):
+        arguments = {key: value for name in filters for key, value in get_cars_filters[name].items()}
+        return lambda db, iteration: car_crud.get_cars(db, limit=100, **arguments)
+
+    result = []
+    for count in range(len(get_cars_filters) + 1):
+        for filters in itertools.combinations(get_cars_filters, count):
+            result.append((" ".join(("get_cars",) + filters), get_cars_case(filters)))
+
+    def book(db, iteration):
+        # A free slot per iteration: every garage on the days after the seeded bookings
+        day = today + timedelta(days=AHEAD_DAYS + 1 + iteration // garages)
+        maintenance_crud.create_maintenance_request(db, MaintenanceRequestCreate(
+            carId=1, garageId=1 + iteration % garages, serviceType="Brakes", scheduledDate=day,
+        ))
+
+    def reschedule(db, iteration):
+        # Moves one request back and forth between two days after the seeded bookings
+        day = today + timedelta(days=AHEAD_DAYS + 1 + iteration % 2)
+        maintenance_crud.update_maintenance_request(db, 1, MaintenanceRequestUpdate(scheduledDate=day))
+
+    def relink(db, iteration):
+        car = db.get(Car, 1)
+        update_relationship(db, car, "garages", Garage, [1, 2] if iteration % 2 else [2, 3])
+        db.commit()
+
+    def reassign(db, iteration):
+        # Moves a fleet of 1000 cars in and out of the last garage
+        fleet = list(range(1, 1001))
+        if iteration % 2:
+            garage_crud.update_garage_cars(db, garages, attach=[], detach=fleet)
+        else:
+            garage_crud.update_garage_cars(db, garages, attach=fleet, detach=[])
+
+    def move_day(db, iteration):
+        # Moves the seeded requests of a garage's day past the seeded bookings and back
+        days = [today + timedelta(days=1), today + timedelta(days=AHEAD_DAYS + 3)]
+        maintenance_crud.reschedule_maintenance_requests(db, MaintenanceReschedule(
+            garageId=2, startDate=days[iteration % 2], targetDate=days[1 - iteration % 2],
+        ))
+
+    def indexed(call):
+        # The same call with the reads served by the in-process occupancy index
+        def run(db, iteration):
+            enabled, occupancy_index.enabled = occupancy_index.enabled, True
+            try:
+                return call(db, iteration)
+            finally:
+                occupancy_index.enabled = enabled
+        return run
+
+    def full(db, iteration):
+        return maintenance_crud.is_garage_full(db, 1, today)
+
+    def daily_report(db, iteration):
+        return reports.get_daily_availability_report(db, 1, today - timedelta(days=15), today + timedelta(days=15))
+
+    def next_available(db, iteration):
+        return reports.get_next_available_slots(db, "Sofia", today, today + timedelta(days=365), 20)
+
+    result += [
+        ("is_garage_full", full),
+        ("is_garage_full index", indexed(full)),
+        ("create_maintenance_request", book),
+        ("update_maintenance_request", reschedule),
+        ("get_monthly_requests_report", lambda db, iteration: reports.get_monthly_requests_report(
+            db, [1, 2, 3], today - timedelta(days=365), today,
+        )),
+        ("get_daily_availability_report", daily_report),
+        ("get_daily_availability_report index", indexed(daily_report)),
+        ("get_next_available_slots", next_available),
+        ("get_next_available_slots index", indexed(next_available)),
+        ("update_relationship", relink),
+        ("update_garage_cars", reassign),
+        ("reschedule_maintenance_requests", move_day),
+    ]
+    return result
+
+
+def run_size(size: str, repeat: int, warmup: int) -> dict:
+    garages, cars, requests = SIZES[size]
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+    with Session() as db:
+        seed_fleet(db, generate_fleet(garages, cars, requests))
+    # Garages and counters cached from the database of another size would be served otherwise
+    garage_cache.invalidate()
+    occupancy_index.invalidate()
+
+    statements = 0
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count(*args):
+        nonlocal statements
+        statements += 1
+
+    results = {}
+    for name, call in cases(garages):
+        timings, counts = [], []
+        for iteration in range(warmup + repeat):
+            with Session() as db:
+                before = statements
+                started = time.perf_counter()
+                call(db, iteration)
+                elapsed = time.perf_counter() - started
+            if iteration >= warmup:
+                timings.append(elapsed * 1000)
+                counts.append(statements - before)
+        results[name] = {
+            "median_ms": round(statistics.median(timings), 4),
+            "min_ms": round(min(timings), 4),
+            # The garage cache checks its version row now and then, the typical call is the one compared
+            "statements": statistics.median_low(counts),
+        }
+    engine.dispose()
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> tuple:
+    """(statement regressions, timing regressions) against the baseline, as lines."""
+    regressions, slowdowns = [], []
+    for size, cases_results in results.items():
+        for name, result in cases_results.items():
+            base = baseline.get(size, {}).get(name)
+            if base is None:
+                continue
+            if result["statements"] > base["statements"]:
+                regressions.append(f"{size} {name}: {base['statements']} -> {result['statements']} statements")
+            delta = result["median_ms"] - base["median_ms"]
+            if delta > MIN_DELTA_MS and delta > base["median_ms"] * threshold:
+                slowdowns.append(
+                    f"{size} {name}: {base['median_ms']:.3f} -> {result['median_ms']:.3f} ms "
+                    f"(+{delta / base['median_ms']:.0%})"
+                )
+    return regressions, slowdowns
+
+
+def print_table(results: dict, baseline: dict, stream=sys.stderr):
+    header = f"{'size':8} {'case':40} {'median ms':>10} {'baseline':>10} {'stmts':>6} {'base':>6}"
+    print(header, file=stream)
+    print("-" * len(header), file=stream)
+    for size, cases_results in results.items():
+        for name, result in cases_results.items():
+            base = baseline.get(size, {}).get(name, {})
+            print(
+                f"{size:8} {name:40} {result['median_ms']:>10.3f} {base.get('median_ms', float('nan')):>10.3f} "
+                f"{result['statements']:>6} {base.get('statements', '-'):>6}",
+                file=stream,
+            )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the CRUD layer with a stored baseline.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"comma separated, among {', '.join(SIZES)}")
+    parser.add_argument("--repeat", type=int, default=20, help="measured calls per case")
+    parser.add_argument("--warmup", type=int, default=3, help="unmeasured calls per case")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="relative slowdown to flag")
+    parser.add_argument(
+        "--check-timings", action="store_true", help="also fail on slowdowns, only meaningful on the baseline's machine"
+    )
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    sizes = [size.strip() for size in args.sizes.split(",") if size.strip()]
+    unknown = [size for size in sizes if size not in SIZES]
+    if unknown:
+        parser.error(f"unknown sizes: {', '.join(unknown)}")
+
+    results = {size: run_size(size, args.repeat, args.warmup) for size in sizes}
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    print_table(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+    if args.update_baseline:
+        baseline.update(results)
+        args.baseline.write_text(json.dumps(baseline, indent=2) + "\n")
+        print(f"baseline written to {args.baseline}", file=sys.stderr)
+        return 0
+
+    regressions, slowdowns = compare(results, baseline, args.threshold)
+    if args.check_timings:
+        regressions += slowdowns
+    else:
+        for line in slowdowns:
+            print(f"slower {line}", file=sys.stderr)
+    for line in regressions:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+Synthetic fleet data: garages, cars and maintenance requests with a realistic skew.
+
+- Garages are spread over a few cities, the first cities getting most of them.
+- Every car is serviced by one to three garages, and only books those.
+- Requests cluster around today: most of the history is recent, a smaller share is booked ahead,
+  and weekends are quieter. No garage is booked over capacity on any day.
+"""
+import random
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import List
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.cruds.occupancy import rebuild_occupancy
+from app.cruds.utils import chunked
+from app.models.car import Car
+from app.models.car_garage_association import car_garage_association
+from app.models.garage import Garage
+from app.models.maintenance import MaintenanceRequest
+from app.models.search import create_search_tables
+
+CITIES = ["Sofia", "Plovdiv", "Varna", "Burgas", "Ruse", "Stara Zagora", "Pleven", "Sliven"]
+MAKES = {
+    "Volkswagen": ["Golf", "Passat", "Polo", "Tiguan"],
+    "Toyota": ["Corolla", "Yaris", "RAV4", "Auris"],
+    "Ford": ["Focus", "Fiesta", "Mondeo", "Kuga"],
+    "Renault": ["Clio", "Megane", "Captur"],
+    "BMW": ["320d", "520d", "X3"],
+    "Skoda": ["Octavia", "Fabia", "Superb"],
+    "Opel": ["Astra", "Corsa", "Insignia"],
+    "Dacia": ["Sandero", "Duster", "Logan"],
+}
+SERVICE_TYPES = ["Oil change", "Brakes", "Tyres", "Inspection", "Battery", "Air conditioning", "Diagnostics"]
+
+# Requests span HISTORY_DAYS before today and AHEAD_DAYS after it
+HISTORY_DAYS = 365
+AHEAD_DAYS = 60
+WEEKEND_WEIGHT = 0.3
+
+
+@dataclass
+class Fleet:
+    today: date
+    garages: List[dict] = field(default_factory=list)
+    cars: List[dict] = field(default_factory=list)
+    associations: List[dict] = field(default_factory=list)
+    requests: List[dict] = field(default_factory=list)
+
+
+def _skewed_day(rng: random.Random, today: date) -> date:
+    """A day around today, recent days and weekdays being more likely."""
+    while True:
+        offset = round(rng.triangular(-HISTORY_DAYS, AHEAD_DAYS, AHEAD_DAYS // 4))
+        day = today + timedelta(days=offset)
+        if day.weekday() < 5 or rng.random() < WEEKEND_WEIGHT:
+            return day
+
+
+def generate_fleet(garages: int, cars: int, requests: int, seed: int = 0, today: date = None) -> Fleet:
+    """Generate the rows of a fleet, the same ones for the same arguments."""
+    rng = random.Random(seed)
+    fleet = Fleet(today=today or date.today())
+
+    city_weights = [1 / (rank + 1) for rank in range(len(CITIES))]
+    for garage_id in range(1, garages + 1):
+        city = rng.choices(CITIES, city_weights)[0]
+        fleet.garages.append({
+            "id": garage_id,
+            "name": f"{city} Service {garage_id}",
+            "location": f"{rng.randint(1, 200)} Main Street",
+            "city": city,
+            "capacity": rng.choice([2, 3, 5, 5, 8, 10, 15]),
+        })
+
+    makes = list(MAKES)
+    garages_of = {}
+    for car_id in range(1, cars + 1):
+        make = rng.choice(makes)
+        fleet.cars.append({
+            "id": car_id,
+            "make": make,
+            "model": rng.choice(MAKES[make]),
+            "production_year": rng.randint(1995, fleet.today.year),
+            "license_plate": f"CB{car_id:06d}XX",
+        })
+        garages_of[car_id] = rng.sample(range(1, garages + 1), min(garages, rng.randint(1, 3)))
+        fleet.associations.extend({"car_id": car_id, "garage_id": garage_id} for garage_id in garages_of[car_id])
+
+    capacities = {garage["id"]: garage["capacity"] for garage in fleet.garages}
+    names = {garage["id"]: garage["name"] for garage in fleet.garages}
+    booked = Counter()
+    attempts = 0
+    while len(fleet.requests) < requests and attempts < requests * 10:
+        attempts += 1
+        car = rng.choice(fleet.cars)
+        garage_id = rng.choice(garages_of[car["id"]])
+        day = _skewed_day(rng, fleet.today)
+        if booked[garage_id, day] >= capacities[garage_id]:
+            continue
+        booked[garage_id, day] += 1
+        fleet.requests.append({
+            "car_id": car["id"],
+            "garage_id": garage_id,
+            "service_type": rng.choice(SERVICE_TYPES),
+            "scheduled_date": day,
+            "car_name": f"{car['make']} {car['model']}",
+            "garage_name": names[garage_id],
+        })
+    return fleet
+
+
+def seed_fleet(db: Session, fleet: Fleet):
+    """Insert the fleet into an empty database, with its occupancy counters and search index."""
+    for model, rows in (
+        (Garage, fleet.garages),
+        (Car, fleet.cars),
+        (car_garage_association, fleet.associations),
+        (MaintenanceRequest, fleet.requests),
+    ):
+        for chunk in chunked(rows, 5000):
+            db.execute(insert(model), chunk)
+    rebuild_occupancy(db)
+    create_search_tables(None, db.connection())
+    db.commit()
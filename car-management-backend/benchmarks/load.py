@@ -0,0 +1,376 @@
+"""
+HTTP load test of the whole API.
+
+Seeds a synthetic fleet into a temporary SQLite database, serves app.main:app with uvicorn on localhost and
+drives every route from concurrent keep-alive clients for a fixed duration. Prints a summary table and writes
+per-endpoint latency percentiles, throughput and error rates as JSON, so runs can be compared over time.
+
+    python -m benchmarks.load --garages 50 --cars 5000 --requests 50000 --concurrency 16 --duration 30 \\
+        --output load.json
+
+Errors are transport failures and 5xx responses; 4xx responses (e.g. a full garage) are counted per status.
+The environment settings (DATABASE_ASYNC, SQLITE_*, DB_POOL_*) apply, DATABASE_URL is replaced.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import urlencode
+
+SEARCH_PREFIXES = ["Vo", "Toy", "Fo", "Sko", "Golf", "CB00"]
+
+
+def percentile(sorted_values, fraction: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+
+class Workload:
+    """The weighted mix of requests, and the ids created by the load itself for updates and deletes."""
+
+    def __init__(self, fleet):
+        self.fleet = fleet
+        self.today = fleet.today
+        self.garages = fleet.garages
+        self.cars = fleet.cars
+        self.garage_ids_of = defaultdict(list)
+        for row in fleet.associations:
+            self.garage_ids_of[row["car_id"]].append(row["garage_id"])
+        self.cities = sorted({garage["city"] for garage in fleet.garages})
+        self.makes = sorted({car["make"] for car in fleet.cars})
+        self.created = {"cars": deque(maxlen=10000), "garages": deque(maxlen=10000), "maintenance": deque(maxlen=10000)}
+        self._sequence = 0
+        self._lock = threading.Lock()
+        # (label, weight, builder), a builder returns (method, path, body) or None when it has nothing to act on
+        self.endpoints = [
+            ("GET /", 1, lambda rng: ("GET", "/", None)),
+            ("GET /metrics", 1, lambda rng: ("GET", "/metrics", None)),
+            ("GET /cars/", 8, self.list_cars),
+            ("GET /cars/search", 4, lambda rng: ("GET", "/cars/search?" + urlencode({"q": rng.choice(SEARCH_PREFIXES)}), None)),
+            ("GET /cars/{id}", 10, lambda rng: ("GET", f"/cars/{rng.choice(self.cars)['id']}", None)),
+            ("POST /cars/", 3, self.create_car),
+            ("POST /cars/bulk", 1, self.create_cars),
+            ("PUT /cars/{id}", 2, self.update_car),
+            ("DELETE /cars/{id}", 1, lambda rng: self.pop_created("cars", "/cars/")),
+            ("GET /garages/", 5, self.list_garages),
+            ("GET /garages/{id}", 6, lambda rng: ("GET", f"/garages/{rng.choice(self.garages)['id']}", None)),
+            ("POST /garages/", 1, self.create_garage),
+            ("PUT /garages/{id}", 1, self.update_garage),
+            ("DELETE /garages/{id}", 1, lambda rng: self.pop_created("garages", "/garages/")),
+            ("POST /garages/{id}/cars", 1, self.update_garage_cars),
+            ("GET /garages/dailyAvailabilityReport", 6, self.daily_availability_report),
+            ("GET /garages/availabilityMatrix", 3, self.availability_matrix),
+            ("GET /maintenance/", 8, self.list_maintenance),
+            ("GET /maintenance/export", 1, self.export_maintenance),
+            ("GET /maintenance/{id}", 6, lambda rng: ("GET", f"/maintenance/{rng.randint(1, max(1, len(self.fleet.requests)))}", None)),
+            ("POST /maintenance/", 6, self.create_maintenance),
+            ("POST /maintenance/bulk", 1, self.create_maintenance_bulk),
+            ("POST /maintenance/reschedule", 1, self.reschedule_maintenance),
+            ("GET /maintenance/nextAvailable", 4, self.next_available),
+            ("PUT /maintenance/{id}", 2, self.update_maintenance),
+            ("DELETE /maintenance/{id}", 2, lambda rng: self.pop_created("maintenance", "/maintenance/")),
+            ("GET /maintenance/monthlyRequestsReport", 4, self.monthly_report),
+        ]
+        self.labels = [label for label, _, _ in self.endpoints]
+        self.weights = [weight for _, weight, _ in self.endpoints]
+
+    def next_sequence(self) -> int:
+        with self._lock:
+            self._sequence += 1
+            return self._sequence
+
+    def pop_created(self, kind: str, prefix: str):
+        try:
+            return "DELETE", f"{prefix}{self.created[kind].popleft()}", None
+        except IndexError:
+            return None
+
+    def day(self, rng, low: int, high: int) -> str:
+        return (self.today + timedelta(days=rng.randint(low, high))).isoformat()
+
+    def car_body(self, rng) -> dict:
+        car = rng.choice(self.cars)
+        return {
+            "make": car["make"], "model": car["model"], "productionYear": car["production_year"],
+            "licensePlate": f"LD{os.getpid()}-{self.next_sequence()}",
+            "garageIds": rng.sample([garage["id"] for garage in self.garages], min(2, len(self.garages))),
+        }
+
+    def maintenance_body(self, rng) -> dict:
+        car = rng.choice(self.cars)
+        return {
+            "carId": car["id"], "garageId": rng.choice(self.garage_ids_of[car["id"]]),
+            "serviceType": "Oil change", "scheduledDate": self.day(rng, 1, 60),
+        }
+
+    def list_cars(self, rng):
+        params = rng.choice([
+            {}, {"carMake": rng.choice(self.makes)}, {"garageId": rng.choice(self.garages)["id"]},
+            {"fromYear": 2005, "toYear": 2015},
+        ])
+        return "GET", "/cars/?" + urlencode(params), None
+
+    def create_car(self, rng):
+        return "POST", "/cars/", self.car_body(rng)
+
+    def create_cars(self, rng):
+        return "POST", "/cars/bulk", [self.car_body(rng) for _ in range(20)]
+
+    def update_car(self, rng):
+        car = rng.choice(self.cars)
+        body = {"make": car["make"], "model": car["model"], "productionYear": car["production_year"],
+                "licensePlate": car["license_plate"], "garageIds": self.garage_ids_of[car["id"]]}
+        return "PUT", f"/cars/{car['id']}", body
+
+    def list_garages(self, rng):
+        return "GET", "/garages/?" + urlencode(rng.choice([{}, {"city": rng.choice(self.cities)}])), None
+
+    def create_garage(self, rng):
+        body = {"name": f"Load garage {os.getpid()}-{self.next_sequence()}", "location": "Ring Road",
+                "city": rng.choice(self.cities), "capacity": 5}
+        return "POST", "/garages/", body
+
+    def update_garage(self, rng):
+        garage = rng.choice(self.garages)
+        body = {key: garage[key] for key in ("name", "location", "city", "capacity")}
+        return "PUT", f"/garages/{garage['id']}", body
+
+    def update_garage_cars(self, rng):
+        # Only the garages created by the load, the seeded links choose the garages of new requests
+        try:
+            garage_id = self.created["garages"][-1]
+        except IndexError:
+            return None
+        car_ids = [car["id"] for car in rng.sample(self.cars, min(20, len(self.cars)))]
+        body = {"attach": car_ids} if rng.random() < 0.5 else {"detach": car_ids}
+        return "POST", f"/garages/{garage_id}/cars", body
+
+    def daily_availability_report(self, rng):
+        start = self.today + timedelta(days=rng.randint(-30, 30))
+        params = {"garageId": rng.choice(self.garages)["id"], "startDate": start.isoformat(),
+                  "endDate": (start + timedelta(days=30)).isoformat()}
+        return "GET", "/garages/dailyAvailabilityReport?" + urlencode(params), None
+
+    def availability_matrix(self, rng):
+        params = {"city": rng.choice(self.cities), "startDate": self.day(rng, 0, 0), "endDate": self.day(rng, 14, 14)}
+        return "GET", "/garages/availabilityMatrix?" + urlencode(params), None
+
+    def list_maintenance(self, rng):
+        params = rng.choice([
+            {}, {"garageId": rng.choice(self.garages)["id"], "startDate": self.day(rng, -90, -60),
+                 "endDate": self.day(rng, 0, 30)},
+            {"carId": rng.choice(self.cars)["id"]},
+        ])
+        return "GET", "/maintenance/?" + urlencode(params), None
+
+    def export_maintenance(self, rng):
+        params = {"garageId": rng.choice(self.garages)["id"], "format": rng.choice(["ndjson", "csv"])}
+        return "GET", "/maintenance/export?" + urlencode(params), None
+
+    def create_maintenance(self, rng):
+        return "POST", "/maintenance/", self.maintenance_body(rng)
+
+    def create_maintenance_bulk(self, rng):
+        return "POST", "/maintenance/bulk", [self.maintenance_body(rng) for _ in range(10)]
+
+    def update_maintenance(self, rng):
+        try:
+            request_id = self.created["maintenance"][-1]
+        except IndexError:
+            return None
+        return "PUT", f"/maintenance/{request_id}", self.maintenance_body(rng)
+
+    def reschedule_maintenance(self, rng):
+        # Spread one future day of a garage over its next free days, so a full garage does not reject it
+        body = {"garageId": rng.choice(self.garages)["id"], "startDate": self.day(rng, 1, 60), "spread": True}
+        return "POST", "/maintenance/reschedule", body
+
+    def next_available(self, rng):
+        params = {"city": rng.choice(self.cities), "count": 10}
+        if rng.random() < 0.5:
+            params["after"] = self.day(rng, 0, 30)
+        return "GET", "/maintenance/nextAvailable?" + urlencode(params), None
+
+    def monthly_report(self, rng):
+        start = self.today - timedelta(days=rng.randint(60, 330))
+        garage_ids = rng.sample([garage["id"] for garage in self.garages], min(3, len(self.garages)))
+        params = [("garageId", garage_id) for garage_id in garage_ids]
+        params += [("startMonth", start.strftime("%Y-%m")), ("endMonth", self.today.strftime("%Y-%m"))]
+        return "GET", "/maintenance/monthlyRequestsReport?" + urlencode(params), None
+
+    def record_created(self, label: str, body: bytes):
+        """Remember the ids created by the load, so updates and deletes never touch the seeded rows."""
+        kind = {"POST /cars/": "cars", "POST /garages/": "garages", "POST /maintenance/": "maintenance"}.get(label)
+        if kind is not None:
+            self.created[kind].append(json.loads(body)["id"])
+
+
+def worker(port: int, workload: Workload, deadline: float, seed: int, samples: list):
+    rng = random.Random(seed)
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    while time.perf_counter() < deadline:
+        label = rng.choices(workload.labels, workload.weights)[0]
+        built = workload.endpoints[workload.labels.index(label)][2](rng)
+        if built is None:
+            continue
+        method, path, body = built
+        payload = None if body is None else json.dumps(body)
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        started = time.perf_counter()
+        try:
+            connection.request(method, path, body=payload, headers=headers)
+            response = connection.getresponse()
+            content = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            status, content = None, b""
+        samples.append((label, status, time.perf_counter() - started))
+        if status == 200:
+            workload.record_created(label, content)
+    connection.close()
+
+
+def summarize(samples, elapsed: float) -> dict:
+    def stats(entries):
+        latencies = sorted(latency * 1000 for _, _, latency in entries)
+        statuses = defaultdict(int)
+        for _, status, _ in entries:
+            statuses[str(status) if status is not None else "transport"] += 1
+        errors = sum(1 for _, status, _ in entries if status is None or status >= 500)
+        return {
+            "requests": len(entries),
+            "throughput_rps": round(len(entries) / elapsed, 2) if elapsed else 0.0,
+            "errors": errors,
+            "error_rate": round(errors / len(entries), 4) if entries else 0.0,
+            "statuses": dict(sorted(statuses.items())),
+            "latency_ms": {
+                "mean": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+                "p50": round(percentile(latencies, 0.50), 3),
+                "p95": round(percentile(latencies, 0.95), 3),
+                "p99": round(percentile(latencies, 0.99), 3),
+                "max": round(latencies[-1], 3) if latencies else 0.0,
+            },
+        }
+
+    by_label = defaultdict(list)
+    for sample in samples:
+        by_label[sample[0]].append(sample)
+    return {"total": stats(samples), "endpoints": {label: stats(by_label[label]) for label in sorted(by_label)}}
+
+
+def print_table(report: dict, stream=sys.stderr):
+    header = f"{'endpoint':42} {'reqs':>7} {'rps':>8} {'err%':>6} {'p50':>8} {'p95':>8} {'p99':>8}"
+    print(header, file=stream)
+    print("-" * len(header), file=stream)
+    rows = list(report["endpoints"].items()) + [("TOTAL", report["total"])]
+    for label, stats in rows:
+        latency = stats["latency_ms"]
+        print(
+            f"{label:42} {stats['requests']:>7} {stats['throughput_rps']:>8.1f} {stats['error_rate'] * 100:>6.2f} "
+            f"{latency['p50']:>8.2f} {latency['p95']:>8.2f} {latency['p99']:>8.2f}",
+            file=stream,
+        )
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP load test of the whole API against a synthetic fleet.")
+    parser.add_argument("--garages", type=int, default=50)
+    parser.add_argument("--cars", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=50000, help="maintenance requests to seed")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds of load before measuring")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    # The database is chosen when the app is imported
+    workdir = tempfile.mkdtemp(prefix="car-management-load-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'load.db')}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+
+    import uvicorn
+
+    from app.main import app
+    from app.models.database import SessionLocal, engine
+    from app.settings import settings
+    from benchmarks.fleet import generate_fleet, seed_fleet
+
+    started = time.perf_counter()
+    fleet = generate_fleet(args.garages, args.cars, args.requests, seed=args.seed)
+    with SessionLocal() as db:
+        seed_fleet(db, fleet)
+    print(f"seeded {len(fleet.garages)} garages, {len(fleet.cars)} cars, {len(fleet.requests)} requests "
+          f"in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    workload = Workload(fleet)
+    try:
+        for phase, duration in (("warmup", args.warmup), ("measure", args.duration)):
+            samples = []
+            deadline = time.perf_counter() + duration
+            threads = [
+                threading.Thread(target=worker, args=(port, workload, deadline, args.seed * 1000 + index, samples))
+                for index in range(args.concurrency)
+            ]
+            phase_started = time.perf_counter()
+            for worker_thread in threads:
+                worker_thread.start()
+            for worker_thread in threads:
+                worker_thread.join()
+            elapsed = time.perf_counter() - phase_started
+    finally:
+        server.should_exit = True
+        thread.join()
+        engine.dispose()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {
+            "garages": args.garages, "cars": args.cars, "requests": args.requests, "concurrency": args.concurrency,
+            "duration": args.duration, "seed": args.seed, "database_async": settings.database_async,
+            "sqlite_journal_mode": settings.sqlite_journal_mode, "python": platform.python_version(),
+        },
+        "elapsed_seconds": round(elapsed, 3),
+        **summarize(samples, elapsed),
+    }
+    print_table(report)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 1 if report["total"]["requests"] == 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
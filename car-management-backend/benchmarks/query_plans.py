@@ -0,0 +1,32 @@
+"""
+EXPLAIN QUERY PLAN checks of the hot CRUD queries.
+
+The cases and their assertions (no full scan of a table, the expected indexes used) live in
+tests/test_query_plans.py; this runs them with pytest, e.g. outside of the whole test suite.
+
+    python -m benchmarks.query_plans [--verbose] [-k PATTERN]
+"""
+import argparse
+import sys
+from pathlib import Path
+
+TESTS_PATH = Path(__file__).resolve().parents[1] / "tests" / "test_query_plans.py"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--verbose", action="store_true", help="print every plan")
+    parser.add_argument("-k", dest="keyword", help="only run the cases matching this pytest expression")
+    args = parser.parse_args(argv)
+
+    import pytest
+
+    # -rP adds the "query plans" section the cases attach to their report
+    options = ["-v", "-rP"] if args.verbose else ["-q"]
+    if args.keyword:
+        options += ["-k", args.keyword]
+    return int(pytest.main(options + ["-p", "no:cacheprovider", str(TESTS_PATH)]))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
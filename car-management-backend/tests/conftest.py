@@ -0,0 +1,92 @@
+"""
+Shared fixtures. The application binds its engine when app.models.database is imported, so DATABASE_URL
+points at a throwaway SQLite file before anything imports the app; the committed database is never opened.
+"""
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+DATABASE_DIR = tempfile.mkdtemp(prefix="car-management-tests-")
+atexit.register(shutil.rmtree, DATABASE_DIR, ignore_errors=True)
+os.environ["DATABASE_URL"] = f"sqlite:///{DATABASE_DIR}/car_management.db"
+# The sync engine is the one the statement counts are taken on
+os.environ["DATABASE_ASYNC"] = "false"
+os.environ["ARCHIVE_AFTER_DAYS"] = "0"
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event, text  # noqa: E402
+
+from app.cruds.garage_cache import garage_cache  # noqa: E402
+from app.cruds.occupancy_index import occupancy_index  # noqa: E402
+from app.cruds.report_cache import report_cache  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models.database import Base, SessionLocal, engine  # noqa: E402
+from benchmarks.fleet import generate_fleet, seed_fleet  # noqa: E402
+
+# Tables filled besides the models: the search index and the AUTOINCREMENT sequences
+EXTRA_TABLES = ["car_search", "garage_search", "sqlite_sequence"]
+
+
+def empty_database():
+    """Delete every row and forget what the process-local caches hold."""
+    with engine.begin() as connection:
+        for table in reversed(Base.metadata.sorted_tables):
+            connection.execute(table.delete())
+        for name in EXTRA_TABLES:
+            connection.execute(text(f"DELETE FROM {name}"))
+    garage_cache.invalidate()
+    report_cache.clear()
+    occupancy_index.invalidate()
+
+
+@pytest.fixture(autouse=True)
+def fresh_database(monkeypatch):
+    """Every test starts from empty tables and caches, and the caches never re-check mid-test."""
+    empty_database()
+    # Checks of the version rows of other processes would land on random statements otherwise
+    monkeypatch.setattr(garage_cache, "check_seconds", 3600.0)
+    monkeypatch.setattr(report_cache, "check_seconds", 3600.0)
+    yield
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+@pytest.fixture
+def db():
+    with SessionLocal() as session:
+        yield session
+
+
+@pytest.fixture
+def statements():
+    """The SQL statements run on the application's engine, from the start of the test."""
+    executed = []
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    yield executed
+    event.remove(engine, "before_cursor_execute", record)
+
+
+@pytest.fixture
+def seed(db):
+    """Replace the database with a synthetic fleet of ``garages``, ``cars`` and ``requests``, and return it."""
+
+    def seed_fleet_of(garages: int, cars: int, requests: int, seed: int = 0):
+        empty_database()
+        fleet = generate_fleet(garages, cars, requests, seed=seed)
+        seed_fleet(db, fleet)
+        return fleet
+
+    return seed_fleet_of
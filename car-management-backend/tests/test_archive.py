@@ -0,0 +1,118 @@
+import logging
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import func, insert, select
+
+from app.cruds import archive as archive_crud
+from app.cruds import maintenance as maintenance_crud
+from app.cruds.archive import archive_requests
+from app.models.database import SessionLocal
+from app.models.maintenance import ArchivedMaintenanceRequest, MaintenanceRequest
+from app.models.occupancy import GarageOccupancy
+from app.schemas.maintenance import MaintenanceRequestUpdate
+from benchmarks.fleet import AHEAD_DAYS
+
+GARAGES, CARS, REQUESTS = 5, 200, 2000
+BATCH_SIZE = 300
+
+
+@pytest.fixture
+def fleet(seed):
+    return seed(GARAGES, CARS, REQUESTS)
+
+
+@pytest.fixture
+def cutoff():
+    return date.today() - timedelta(days=90)
+
+
+def count(db, model, *criteria):
+    return db.scalar(select(func.count()).select_from(model).where(*criteria))
+
+
+def list_all(client, **params):
+    """Every page of the maintenance request listing."""
+    rows, after = [], None
+    while True:
+        response = client.get("/maintenance/", params=dict(params, limit=1000, **({"after": after} if after else {})))
+        assert response.status_code == 200
+        rows += response.json()
+        after = response.headers.get("X-Next-Cursor")
+        if not after:
+            return rows
+
+
+def test_archive_moves_the_old_requests_and_drops_their_counters(db, fleet, cutoff):
+    old = count(db, MaintenanceRequest, MaintenanceRequest.scheduled_date < cutoff)
+    total = count(db, MaintenanceRequest)
+    assert old > BATCH_SIZE
+
+    assert archive_requests(db, cutoff, batch_size=BATCH_SIZE) == old
+
+    assert count(db, MaintenanceRequest, MaintenanceRequest.scheduled_date < cutoff) == 0
+    assert count(db, ArchivedMaintenanceRequest) == old
+    assert count(db, MaintenanceRequest) == total - old
+    assert count(db, GarageOccupancy, GarageOccupancy.scheduled_date < cutoff) == 0
+    # Nothing left to move
+    assert archive_requests(db, cutoff, batch_size=BATCH_SIZE) == 0
+
+
+def test_archive_keeps_a_request_moved_after_the_batch_was_read(db, fleet, cutoff, monkeypatch):
+    moved = db.scalar(
+        select(MaintenanceRequest.id).where(MaintenanceRequest.scheduled_date < cutoff)
+        .order_by(MaintenanceRequest.scheduled_date, MaintenanceRequest.id).limit(1)
+    )
+    new_day = date.today() + timedelta(days=AHEAD_DAYS + 5)
+    insert_ignore = archive_crud.insert_ignore
+
+    def move_then_insert_ignore(*args, **kwargs):
+        # Another process reschedules the request between the read of the batch and its copy
+        if maintenance_crud.get_maintenance_request_row(db, moved)["scheduledDate"] != new_day:
+            with SessionLocal() as other:
+                maintenance_crud.update_maintenance_request(other, moved, MaintenanceRequestUpdate(scheduledDate=new_day))
+        return insert_ignore(*args, **kwargs)
+
+    monkeypatch.setattr(archive_crud, "insert_ignore", move_then_insert_ignore)
+    archive_requests(db, cutoff, batch_size=BATCH_SIZE)
+
+    assert db.get(ArchivedMaintenanceRequest, moved) is None
+    assert maintenance_crud.get_maintenance_request_row(db, moved)["scheduledDate"] == new_day
+
+
+def test_archive_keeps_a_request_whose_id_is_already_archived(db, fleet, cutoff, caplog):
+    # An id handed out again before maintenance_requests had AUTOINCREMENT
+    reused = db.execute(
+        select(MaintenanceRequest.__table__).where(MaintenanceRequest.scheduled_date < cutoff).limit(1)
+    ).mappings().one()
+    db.execute(insert(ArchivedMaintenanceRequest), [dict(reused, service_type="Older request")])
+    db.commit()
+    old = count(db, MaintenanceRequest, MaintenanceRequest.scheduled_date < cutoff)
+
+    with caplog.at_level(logging.WARNING, logger=archive_crud.__name__):
+        assert archive_requests(db, cutoff, batch_size=BATCH_SIZE) == old - 1
+
+    assert db.get(MaintenanceRequest, reused["id"]) is not None
+    assert db.get(ArchivedMaintenanceRequest, reused["id"]).service_type == "Older request"
+    assert "1 maintenance requests not archived" in caplog.text
+
+
+def test_listings_and_reports_read_through_the_archive(client, db, fleet, cutoff):
+    today = date.today()
+    garage_ids = [garage["id"] for garage in fleet.garages[:3]]
+    report_params = {"garageId": garage_ids, "startMonth": f"{today.year - 1}-{today.month:02}", "endMonth": f"{today:%Y-%m}"}
+
+    def read_all():
+        report = client.get("/maintenance/monthlyRequestsReport", params=report_params)
+        assert report.status_code == 200
+        return (
+            list_all(client),
+            list_all(client, carId=fleet.cars[0]["id"]),
+            list_all(client, garageId=garage_ids[0], startDate=(cutoff - timedelta(days=30)).isoformat()),
+            report.json(),
+        )
+
+    before = read_all()
+    assert archive_requests(db, cutoff, batch_size=BATCH_SIZE) > 0
+
+    assert read_all() == before
@@ -0,0 +1,215 @@
+import threading
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from app.cruds import maintenance as maintenance_crud
+from app.models.maintenance import MaintenanceRequest
+from app.models.occupancy import GarageOccupancy
+
+CAPACITY = 5
+BOOKINGS = 24
+
+
+def occupancy_mismatches(db):
+    """(garage, day, booked, requests) where garage_daily_occupancy disagrees with COUNT(*)."""
+    counted = dict(
+        ((garage_id, day), count)
+        for garage_id, day, count in db.execute(
+            select(MaintenanceRequest.garage_id, MaintenanceRequest.scheduled_date, func.count())
+            .group_by(MaintenanceRequest.garage_id, MaintenanceRequest.scheduled_date)
+        )
+    )
+    booked = dict(
+        ((garage_id, day), count)
+        for garage_id, day, count in db.execute(
+            select(GarageOccupancy.garage_id, GarageOccupancy.scheduled_date, GarageOccupancy.booked)
+        )
+    )
+    return [
+        (garage_id, day, booked.get((garage_id, day)), counted.get((garage_id, day)))
+        for garage_id, day in counted.keys() | booked.keys()
+        if booked.get((garage_id, day)) != counted.get((garage_id, day))
+    ]
+
+
+def run_parallel(calls):
+    """Run the calls on their own threads, released together, and return their results in order."""
+    barrier = threading.Barrier(len(calls))
+    results = [None] * len(calls)
+
+    def run(index, call):
+        barrier.wait()
+        results[index] = call()
+
+    threads = [threading.Thread(target=run, args=(index, call)) for index, call in enumerate(calls)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+@pytest.fixture
+def garage(client):
+    return client.post("/garages/", json={"name": "Central", "location": "Main Street", "city": "Sofia", "capacity": CAPACITY}).json()
+
+
+@pytest.fixture
+def cars(client, garage):
+    body = [
+        {"make": "Skoda", "model": "Octavia", "productionYear": 2018, "licensePlate": f"CB{number:04}",
+         "garageIds": [garage["id"]]}
+        for number in range(BOOKINGS)
+    ]
+    return [car["id"] for car in client.post("/cars/bulk", json=body).json()["created"]]
+
+
+def test_parallel_bookings_never_exceed_capacity(client, db, garage, cars):
+    day = (date.today() + timedelta(days=7)).isoformat()
+
+    def book(car_id):
+        return lambda: client.post("/maintenance/", json={
+            "carId": car_id, "garageId": garage["id"], "serviceType": "Oil change", "scheduledDate": day,
+        }).status_code
+
+    statuses = run_parallel([book(car_id) for car_id in cars])
+
+    assert statuses.count(200) == CAPACITY
+    assert statuses.count(400) == BOOKINGS - CAPACITY
+    assert db.scalar(select(func.count()).select_from(MaintenanceRequest)) == CAPACITY
+    assert occupancy_mismatches(db) == []
+
+
+def test_parallel_bulk_bookings_never_exceed_capacity(client, db, garage, cars):
+    days = [(date.today() + timedelta(days=offset)).isoformat() for offset in (7, 8)]
+
+    def book_both_days(car_id):
+        # Each bulk request books both days, every day accepts CAPACITY of them
+        return lambda: client.post("/maintenance/bulk", json=[
+            {"carId": car_id, "garageId": garage["id"], "serviceType": "Brakes", "scheduledDate": day} for day in days
+        ]).json()
+
+    results = run_parallel([book_both_days(car_id) for car_id in cars])
+
+    assert sum(len(result["created"]) for result in results) == CAPACITY * len(days)
+    for day in days:
+        booked = db.scalar(
+            select(func.count()).select_from(MaintenanceRequest).where(MaintenanceRequest.scheduled_date == date.fromisoformat(day))
+        )
+        assert booked == CAPACITY
+    assert occupancy_mismatches(db) == []
+
+
+def test_parallel_deletes_release_the_slot_once(client, db, garage, cars):
+    day = (date.today() + timedelta(days=7)).isoformat()
+    booked = [
+        client.post("/maintenance/", json={
+            "carId": car_id, "garageId": garage["id"], "serviceType": "Oil change", "scheduledDate": day,
+        }).json()["id"]
+        for car_id in cars[:CAPACITY]
+    ]
+
+    statuses = run_parallel([lambda: client.delete(f"/maintenance/{booked[0]}").status_code] * 8)
+
+    assert sorted(statuses) == [200] + [404] * 7
+    assert occupancy_mismatches(db) == []
+    # Exactly one slot came back: one more booking fits, the next one does not
+    for car_id, status in zip(cars[CAPACITY:CAPACITY + 2], (200, 400)):
+        assert client.post("/maintenance/", json={
+            "carId": car_id, "garageId": garage["id"], "serviceType": "Oil change", "scheduledDate": day,
+        }).status_code == status
+
+
+def book(client, garage, car_id, day):
+    return client.post("/maintenance/", json={
+        "carId": car_id, "garageId": garage["id"], "serviceType": "Oil change", "scheduledDate": day.isoformat(),
+    })
+
+
+def booked_per_day(db):
+    return dict(db.execute(
+        select(MaintenanceRequest.scheduled_date, func.count()).group_by(MaintenanceRequest.scheduled_date)
+    ).all())
+
+
+def test_reschedule_checks_the_capacity_of_the_whole_batch(client, db, garage, cars):
+    first, second, target = (date.today() + timedelta(days=offset) for offset in (7, 8, 20))
+    for car_id, day in zip(cars, [first] * 2 + [second] * 3 + [target]):
+        assert book(client, garage, car_id, day).status_code == 200
+    before = booked_per_day(db)
+
+    # Either day alone fits in the 4 free slots of the target, both do not
+    response = client.post("/maintenance/reschedule", json={
+        "garageId": garage["id"], "startDate": first.isoformat(), "endDate": second.isoformat(), "targetDate": target.isoformat(),
+    })
+
+    assert response.status_code == 400
+    assert "room for 4 of the 5 requests" in response.json()["detail"]
+    assert booked_per_day(db) == before
+    assert occupancy_mismatches(db) == []
+
+
+def test_reschedule_spreads_over_the_free_days(client, db, garage, cars):
+    first, second, target = (date.today() + timedelta(days=offset) for offset in (7, 8, 20))
+    for car_id, day in zip(cars, [first] * CAPACITY + [second] * CAPACITY + [target] * 3):
+        assert book(client, garage, car_id, day).status_code == 200
+
+    response = client.post("/maintenance/reschedule", json={
+        "garageId": garage["id"], "startDate": first.isoformat(), "endDate": second.isoformat(),
+        "targetDate": target.isoformat(), "spread": True,
+    })
+
+    assert response.status_code == 200
+    assert response.json()["moved"] == 2 * CAPACITY
+    # The 2 free slots of the target day, then the following days in order
+    assert [request["scheduledDate"] for request in response.json()["requests"]] == (
+        [target.isoformat()] * 2 + [(target + timedelta(days=1)).isoformat()] * CAPACITY
+        + [(target + timedelta(days=2)).isoformat()] * 3
+    )
+    assert booked_per_day(db) == {target: CAPACITY, target + timedelta(days=1): CAPACITY, target + timedelta(days=2): 3}
+    assert occupancy_mismatches(db) == []
+
+
+def test_reschedule_onto_the_moved_range_counts_its_slots_as_free(client, db, garage, cars):
+    first, second = (date.today() + timedelta(days=offset) for offset in (7, 8))
+    for car_id, day in zip(cars, [first] * 3 + [second] * 2):
+        assert book(client, garage, car_id, day).status_code == 200
+
+    # The 3 requests already on the target day are among the moved ones, all 5 fit
+    response = client.post("/maintenance/reschedule", json={
+        "garageId": garage["id"], "startDate": first.isoformat(), "endDate": second.isoformat(), "targetDate": first.isoformat(),
+    })
+
+    assert response.status_code == 200
+    assert response.json()["moved"] == CAPACITY
+    assert booked_per_day(db) == {first: CAPACITY}
+    assert occupancy_mismatches(db) == []
+
+
+def test_delete_during_a_reschedule_waits_for_it(client, db, garage, cars, monkeypatch):
+    first, target = (date.today() + timedelta(days=offset) for offset in (7, 20))
+    booked = [book(client, garage, car_id, first).json()["id"] for car_id in cars[:3]]
+    deleted = []
+    delete = threading.Thread(target=lambda: deleted.append(client.delete(f"/maintenance/{booked[0]}").status_code))
+    add_booked = maintenance_crud.add_booked
+
+    def delete_then_add_booked(*args, **kwargs):
+        # Between reading the requests and moving them: the delete must not get in
+        if delete.ident is None:
+            delete.start()
+            delete.join(timeout=0.5)
+        return add_booked(*args, **kwargs)
+
+    monkeypatch.setattr(maintenance_crud, "add_booked", delete_then_add_booked)
+    response = client.post("/maintenance/reschedule", json={
+        "garageId": garage["id"], "startDate": first.isoformat(), "targetDate": target.isoformat(),
+    })
+    delete.join()
+
+    assert response.status_code == 200
+    assert response.json()["moved"] == 3
+    assert deleted == [200]
+    assert booked_per_day(db) == {target: 2}
+    assert occupancy_mismatches(db) == []
@@ -0,0 +1,119 @@
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from app.cruds import car as car_crud
+from app.cruds import maintenance as maintenance_crud
+from app.models.car import Car
+from app.models.car_garage_association import car_garage_association
+from app.models.database import SessionLocal
+from app.models.maintenance import MaintenanceRequest
+from app.models.occupancy import GarageOccupancy
+from app.schemas.car import CarCreate
+from app.schemas.maintenance import MaintenanceRequestCreate
+
+CAPACITY = 2
+
+
+@pytest.fixture
+def garage(client):
+    return client.post("/garages/", json={"name": "Central", "location": "Main Street", "city": "Sofia", "capacity": CAPACITY}).json()
+
+
+def car_body(number: int, garage_ids, year: int = 2018) -> dict:
+    return {"make": "Skoda", "model": "Octavia", "productionYear": year, "licensePlate": f"CB{number:04}", "garageIds": garage_ids}
+
+
+def request_body(car_id: int, garage_id: int, day: date) -> dict:
+    return {"carId": car_id, "garageId": garage_id, "serviceType": "Brakes", "scheduledDate": day.isoformat()}
+
+
+def count(db, table):
+    return db.scalar(select(func.count()).select_from(table))
+
+
+@pytest.fixture
+def cars(client, garage):
+    return client.post("/cars/bulk", json=[car_body(number, [garage["id"]]) for number in range(6)]).json()["created"]
+
+
+def test_bulk_cars_reject_invalid_items_by_index(client, db, garage):
+    client.post("/cars/", json=car_body(1, [garage["id"]]))
+    body = [
+        car_body(2, [garage["id"]]),
+        car_body(1, [garage["id"]]),  # Plate already taken
+        car_body(3, [garage["id"]], year=date.today().year + 1),
+        car_body(4, [garage["id"], 10 ** 6]),
+        car_body(2, [garage["id"]]),  # Plate taken earlier in the batch
+        car_body(5, []),
+    ]
+
+    response = client.post("/cars/bulk", json=body)
+
+    assert response.status_code == 200
+    assert [car["licensePlate"] for car in response.json()["created"]] == ["CB0002", "CB0005"]
+    assert [error["index"] for error in response.json()["errors"]] == [1, 2, 3, 4]
+    assert "CB0001 already exists" in response.json()["errors"][0]["detail"]
+    assert response.json()["created"][0]["garages"][0]["id"] == garage["id"]
+    assert count(db, Car) == 3
+    assert count(db, car_garage_association) == 2
+
+
+def test_bulk_cars_are_created_in_one_transaction(db, garage, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("search index unavailable")
+
+    monkeypatch.setattr(car_crud, "index_cars", fail)
+    with SessionLocal() as session, pytest.raises(RuntimeError):
+        car_crud.create_cars(session, [CarCreate(**car_body(number, [garage["id"]])) for number in range(3)])
+
+    assert count(db, Car) == 0
+    assert count(db, car_garage_association) == 0
+
+
+def test_bulk_requests_fill_the_capacity_and_reject_the_rest(client, db, garage, cars):
+    day = date.today() + timedelta(days=7)
+    body = [request_body(car["id"], garage["id"], day) for car in cars[:4]] + [
+        request_body(cars[4]["id"], garage["id"], date.today() - timedelta(days=1)),
+        request_body(10 ** 6, garage["id"], day + timedelta(days=1)),
+        request_body(cars[5]["id"], 10 ** 6, day),
+        request_body(cars[5]["id"], garage["id"], day + timedelta(days=1)),
+    ]
+
+    response = client.post("/maintenance/bulk", json=body)
+
+    assert response.status_code == 200
+    assert [request["carId"] for request in response.json()["created"]] == [cars[0]["id"], cars[1]["id"], cars[5]["id"]]
+    errors = response.json()["errors"]
+    assert [error["index"] for error in errors] == [2, 3, 4, 5, 6]
+    assert "full capacity" in errors[0]["detail"]
+    assert dict(db.execute(select(GarageOccupancy.scheduled_date, GarageOccupancy.booked)).all()) == {
+        day: CAPACITY, day + timedelta(days=1): 1,
+    }
+
+
+def test_rejected_bulk_requests_leave_no_counters(client, db, garage, cars):
+    day = date.today() + timedelta(days=7)
+    response = client.post("/maintenance/bulk", json=[request_body(10 ** 6, garage["id"], day)])
+
+    assert response.json() == {"created": [], "errors": [{"index": 0, "detail": "Car with ID 1000000 not found."}]}
+    assert count(db, MaintenanceRequest) == 0
+    assert count(db, GarageOccupancy) == 0
+    assert client.post("/maintenance/bulk", json=[]).json() == {"created": [], "errors": []}
+
+
+def test_bulk_requests_are_created_in_one_transaction(db, garage, cars, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("database went away")
+
+    # Fails after the counters and the requests are written
+    monkeypatch.setattr(maintenance_crud, "bump_report_versions", fail)
+    day = date.today() + timedelta(days=7)
+    with SessionLocal() as session, pytest.raises(RuntimeError):
+        maintenance_crud.create_maintenance_requests(session, [
+            MaintenanceRequestCreate(**request_body(car["id"], garage["id"], day)) for car in cars[:CAPACITY]
+        ])
+
+    assert count(db, MaintenanceRequest) == 0
+    assert count(db, GarageOccupancy) == 0
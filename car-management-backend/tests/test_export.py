@@ -0,0 +1,67 @@
+import csv
+import io
+import json
+from datetime import date, timedelta
+
+import pytest
+
+from app.routers.maintenance import EXPORT_CHUNK_ROWS, EXPORT_COLUMNS, export_rows
+
+GARAGES, CARS, REQUESTS = 5, 200, 2000
+
+
+@pytest.fixture
+def fleet(seed):
+    return seed(GARAGES, CARS, REQUESTS)
+
+
+def listed(client, **params):
+    """The export columns of every row of the listing, with the same filters."""
+    rows, after = [], None
+    while True:
+        response = client.get("/maintenance/", params=dict(params, limit=1000, **({"after": after} if after else {})))
+        rows += [{column: row[column] for column in EXPORT_COLUMNS} for row in response.json()]
+        after = response.headers.get("X-Next-Cursor")
+        if not after:
+            return rows
+
+
+def test_export_ndjson(client, fleet):
+    car_id = fleet.cars[0]["id"]
+    response = client.get("/maintenance/export", params={"carId": car_id})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert rows and rows == listed(client, carId=car_id)
+
+
+def test_export_csv(client, fleet):
+    params = {"garageId": 2, "startDate": (date.today() - timedelta(days=60)).isoformat(), "endDate": date.today().isoformat()}
+    response = client.get("/maintenance/export", params=dict(params, format="csv"))
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert "filename=maintenance-history.csv" in response.headers["content-disposition"]
+    header, *rows = csv.reader(io.StringIO(response.text))
+    assert header == EXPORT_COLUMNS
+    assert rows and rows == [[str(row[column]) for column in EXPORT_COLUMNS] for row in listed(client, **params)]
+
+
+def test_export_without_rows(client, fleet):
+    assert client.get("/maintenance/export", params={"carId": 10 ** 6, "format": "csv"}).text.splitlines() == [",".join(EXPORT_COLUMNS)]
+    assert client.get("/maintenance/export", params={"carId": 10 ** 6}).text == ""
+
+
+def test_export_streams_the_first_row_at_once(fleet):
+    chunks = list(export_rows("csv"))
+
+    # The header and the first row, then chunks doubling up to EXPORT_CHUNK_ROWS
+    lines = [chunk.count("\n") for chunk in chunks]
+    assert lines[:3] == [2, 2, 4]
+    assert max(lines) == EXPORT_CHUNK_ROWS
+    assert sum(lines) == 1 + REQUESTS
+
+
+def test_export_rejects_an_unknown_format(client):
+    assert client.get("/maintenance/export", params={"format": "xml"}).status_code == 422
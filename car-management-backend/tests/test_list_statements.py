@@ -0,0 +1,48 @@
+"""
+The list endpoints run the same number of statements whatever the number of rows they return: related rows are
+loaded with one IN query per page, never one query per row. Both fleets stay below the IN batch size of 500.
+"""
+from datetime import date, timedelta
+
+import pytest
+
+SMALL = (3, 40, 300)
+LARGE = (8, 450, 4000)
+
+
+def list_urls():
+    today = date.today()
+    return [
+        "/cars/",
+        "/cars/?limit=20",
+        "/cars/?garageId=1",
+        "/cars/?carMake=Volkswagen&fromYear=2005&toYear=2015",
+        "/cars/search?q=Vo",
+        "/garages/",
+        "/garages/?city=Sofia",
+        "/maintenance/",
+        "/maintenance/?limit=20",
+        "/maintenance/?carId=1",
+        f"/maintenance/?garageId=1&startDate={today - timedelta(days=90)}&endDate={today + timedelta(days=30)}",
+        "/maintenance/export?garageId=1&format=csv",
+    ]
+
+
+def statements_per_request(client, statements, url: str):
+    """Statements run by a cold request for ``url``, with the number of rows it returned."""
+    start = len(statements)
+    response = client.get(url)
+    assert response.status_code == 200
+    rows = response.text.count("\n") if "export" in url else len(response.json())
+    return len(statements) - start, rows
+
+
+@pytest.mark.parametrize("url", list_urls())
+def test_list_statements_do_not_grow_with_rows(client, seed, statements, url):
+    seed(*SMALL)
+    small, small_rows = statements_per_request(client, statements, url)
+    seed(*LARGE)
+    large, large_rows = statements_per_request(client, statements, url)
+
+    assert small_rows and large_rows
+    assert large == small
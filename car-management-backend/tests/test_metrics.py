@@ -0,0 +1,108 @@
+import re
+import threading
+
+import pytest
+
+from app.metrics import CONTENT_TYPE, Counter, Gauge, Histogram, Metric
+
+SAMPLE = re.compile(r"^(\w+)(?:\{(.*)\})? (\S+)$")
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse(text: str) -> dict:
+    """{(name, {label: value} as a sorted tuple): value} of every sample, the way a scraper reads them."""
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        name, labels, value = SAMPLE.match(line).groups()
+        samples[(name, tuple(sorted(LABEL.findall(labels or ""))))] = float(value)
+    return samples
+
+
+def scrape(client) -> dict:
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == CONTENT_TYPE
+    return parse(response.text)
+
+
+def test_exposition_format():
+    jobs = Counter("jobs_total", "Jobs run.", ("queue",))
+    jobs.labels('mail "urgent"').inc(2)
+    jobs.labels("reports").inc()
+    size = Gauge("queue_size", "Jobs waiting.")
+    size.set_function(lambda: 7)
+    latency = Histogram("job_seconds", "Job duration.", buckets=(1.0, 0.1))
+    for value in (0.05, 0.5, 5):
+        latency.observe(value)
+
+    assert jobs.render().splitlines() == [
+        "# HELP jobs_total Jobs run.",
+        "# TYPE jobs_total counter",
+        'jobs_total{queue="mail \\"urgent\\""} 2',
+        'jobs_total{queue="reports"} 1',
+    ]
+    assert size.render().splitlines()[-1] == "queue_size 7"
+    assert latency.render().splitlines()[1:] == [
+        "# TYPE job_seconds histogram",
+        'job_seconds_bucket{le="0.1"} 1',
+        'job_seconds_bucket{le="1"} 2',
+        'job_seconds_bucket{le="+Inf"} 3',
+        "job_seconds_sum 5.55",
+        "job_seconds_count 3",
+    ]
+
+
+def test_a_metric_type_implements_its_children_and_samples():
+    class Incomplete(Metric):
+        type = "counter"
+
+    with pytest.raises(TypeError):
+        Incomplete("incomplete_total", "Not a metric.")
+
+
+def test_children_count_every_increment_across_threads():
+    requests = Counter("requests_total", "Requests.", ("route",))
+    latency = Histogram("request_seconds", "Request duration.", ("route",))
+
+    def serve(route):
+        for _ in range(2000):
+            requests.labels(route).inc()
+            latency.labels(route).observe(0.01)
+
+    threads = [threading.Thread(target=serve, args=(f"/route/{number % 4}",)) for number in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    samples = parse(requests.render() + "\n" + latency.render())
+    for number in range(4):
+        labels = (("route", f"/route/{number}"),)
+        assert samples[("requests_total", labels)] == 4000
+        assert samples[("request_seconds_count", labels)] == 4000
+
+
+def test_requests_are_counted_by_route_template(client):
+    garage = client.post("/garages/", json={"name": "Central", "location": "Main Street", "city": "Sofia", "capacity": 3}).json()
+    before = scrape(client)
+
+    assert client.get(f"/garages/{garage['id']}").status_code == 200
+    assert client.get(f"/garages/{garage['id'] + 1}").status_code == 404
+    assert client.get("/no/such/path").status_code == 404
+    after = scrape(client)
+
+    def delta(name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        return after.get(key, 0) - before.get(key, 0)
+
+    # Both garage ids share the template of the route
+    assert delta("http_requests_total", method="GET", route="/garages/{id:int}", status="200") == 1
+    assert delta("http_requests_total", method="GET", route="/garages/{id:int}", status="404") == 1
+    assert delta("http_request_duration_seconds_count", method="GET", route="/garages/{id:int}") == 2
+    assert delta("http_requests_total", method="GET", route="unmatched", status="404") == 1
+    # A scrape is counted once its response is sent: the first one shows in the second, which is in flight
+    assert delta("http_requests_total", method="GET", route="/metrics", status="200") == 1
+    assert after[("http_requests_in_flight", ())] == 1
+    assert not [key for key in after if "/no/such/path" in str(key)]
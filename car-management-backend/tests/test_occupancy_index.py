@@ -0,0 +1,114 @@
+from collections import Counter
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from app.cruds import occupancy
+from app.cruds.archive import archive_requests
+from app.cruds.occupancy_index import OccupancyIndex, occupancy_index
+from app.cruds.report_cache import report_cache
+from app.models.occupancy import GarageOccupancy
+
+GARAGES, CARS, REQUESTS = 4, 120, 1500
+
+
+@pytest.fixture
+def fleet(seed):
+    return seed(GARAGES, CARS, REQUESTS)
+
+
+@pytest.fixture
+def indexed(monkeypatch):
+    """The application's index, enabled and reloading only when told to."""
+    monkeypatch.setattr(occupancy_index, "enabled", True)
+    monkeypatch.setattr(occupancy_index, "reload_seconds", 3600.0)
+    return occupancy_index
+
+
+def test_index_counts_match_the_requests(db, fleet):
+    index = OccupancyIndex(enabled=True)
+    counted = Counter((request["garage_id"], request["scheduled_date"]) for request in fleet.requests)
+    first = min(day for _, day in counted)
+    last = max(day for _, day in counted)
+
+    for garage in fleet.garages:
+        # Past both ends of the calendar, and across them
+        start, end = first - timedelta(days=20), last + timedelta(days=20)
+        days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+        assert index.booked_range(db, garage["id"], start, end).tolist() == [counted[(garage["id"], day)] for day in days]
+        assert index.booked(db, garage["id"], last) == counted[(garage["id"], last)]
+    assert index.booked(db, 10 ** 6, first) == 0
+    assert index.check(db) == []
+
+
+def test_index_follows_the_writes_of_this_process(client, db, fleet, indexed):
+    day = date.today() + timedelta(days=200)
+    car_id, garage_id = fleet.associations[0]["car_id"], fleet.associations[0]["garage_id"]
+    body = {"carId": car_id, "garageId": garage_id, "serviceType": "Brakes", "scheduledDate": day.isoformat()}
+    assert indexed.booked(db, garage_id, day) == 0
+
+    created = client.post("/maintenance/", json=body).json()
+    client.post("/maintenance/bulk", json=[body, dict(body, scheduledDate=(day + timedelta(days=1)).isoformat())])
+    client.put(f"/maintenance/{created['id']}", json={"scheduledDate": (day + timedelta(days=2)).isoformat()})
+    client.post("/maintenance/reschedule", json={
+        "garageId": garage_id, "startDate": day.isoformat(), "endDate": (day + timedelta(days=1)).isoformat(),
+        "targetDate": (day + timedelta(days=3)).isoformat(),
+    })
+    client.delete(f"/maintenance/{created['id']}")
+    archive_requests(db, date.today() - timedelta(days=90))
+
+    assert indexed.booked_range(db, garage_id, day, day + timedelta(days=3)).tolist() == [0, 0, 0, 2]
+    assert indexed.check(db) == []
+
+
+def test_index_reloads_the_writes_of_other_processes(client, db, fleet, indexed, monkeypatch):
+    day = date.today() + timedelta(days=200)
+    link = fleet.associations[0]
+    indexed.booked(db, link["garage_id"], day)
+
+    # Another process books: the counters change, the index of this one is not told
+    with monkeypatch.context() as other_process:
+        other_process.setattr(indexed, "apply", lambda increments: None)
+        assert client.post("/maintenance/", json={
+            "carId": link["car_id"], "garageId": link["garage_id"], "serviceType": "Brakes", "scheduledDate": day.isoformat(),
+        }).status_code == 200
+
+    assert indexed.booked(db, link["garage_id"], day) == 0
+    assert indexed.check(db) == [(link["garage_id"], day, 0, 1)]
+    # Until the reload is due
+    monkeypatch.setattr(indexed, "_next_reload", 0.0)
+    assert indexed.booked(db, link["garage_id"], day) == 1
+    assert indexed.check(db) == []
+
+
+def test_reports_agree_with_and_without_the_index(client, monkeypatch, fleet):
+    params = {"garageId": fleet.garages[0]["id"], "startDate": (date.today() - timedelta(days=30)).isoformat(),
+              "endDate": (date.today() + timedelta(days=30)).isoformat()}
+
+    def daily_report(enabled):
+        monkeypatch.setattr(occupancy_index, "enabled", enabled)
+        # The report cached from the other path would be served otherwise
+        report_cache.clear()
+        return client.get("/garages/dailyAvailabilityReport", params=params).json()
+
+    assert daily_report(True) == daily_report(False)
+
+
+def test_check_and_rebuild_commands(db, fleet, capsys):
+    assert occupancy.main(["check"]) == 0
+    garage_id, day = fleet.requests[0]["garage_id"], fleet.requests[0]["scheduled_date"]
+    db.execute(
+        update(GarageOccupancy).where(GarageOccupancy.garage_id == garage_id, GarageOccupancy.scheduled_date == day)
+        .values(booked=GarageOccupancy.booked + 2)
+    )
+    db.commit()
+    capsys.readouterr()
+
+    assert occupancy.main(["check"]) == 1
+    output = capsys.readouterr()
+    assert f"garage {garage_id} {day}: counter" in output.out
+    assert "1 mismatched garage/day counters" in output.err
+
+    assert occupancy.main(["rebuild"]) == 0
+    assert occupancy.main(["check"]) == 0
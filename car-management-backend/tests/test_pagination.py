@@ -0,0 +1,39 @@
+import pytest
+
+from app.cruds.utils import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+GARAGES, CARS, REQUESTS = 5, 1200, 2500
+
+
+@pytest.fixture
+def fleet(seed):
+    return seed(GARAGES, CARS, REQUESTS)
+
+
+@pytest.mark.parametrize("url, total", [("/cars/", CARS), ("/maintenance/", REQUESTS)])
+def test_a_bare_list_request_is_capped(client, fleet, url, total):
+    response = client.get(url)
+
+    assert response.status_code == 200
+    assert len(response.json()) == MAX_PAGE_SIZE
+    # The cursor alone continues with pages of the default size, until the last one
+    ids = [row["id"] for row in response.json()]
+    after = response.headers["X-Next-Cursor"]
+    while after:
+        response = client.get(url, params={"after": after})
+        assert len(response.json()) <= DEFAULT_PAGE_SIZE
+        ids += [row["id"] for row in response.json()]
+        after = response.headers.get("X-Next-Cursor")
+    assert len(ids) == len(set(ids)) == total
+
+
+def test_a_short_list_has_no_cursor(client, fleet):
+    response = client.get("/garages/")
+
+    assert len(response.json()) == GARAGES
+    assert "X-Next-Cursor" not in response.headers
+
+
+@pytest.mark.parametrize("limit", [0, MAX_PAGE_SIZE + 1])
+def test_the_limit_is_bounded(client, limit):
+    assert client.get("/maintenance/", params={"limit": limit}).status_code == 422
@@ -0,0 +1,67 @@
+"""
+The SQL summary of the profiling middleware with debugging on: the statement count in X-SQL-Statements agrees
+with the statements run on the engine, and a statement repeated per row is flagged and logged as N+1.
+"""
+import logging
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app import profiling
+from app.models.car import Car
+from app.models.database import get_db
+from app.profiling import SQL_REPEATED_HEADER, SQL_STATEMENTS_HEADER, SQL_TIME_HEADER, SQLProfilingMiddleware
+from app.routers import cars, garages, maintenance
+
+REPEAT_THRESHOLD = 5
+
+
+@pytest.fixture
+def debug_client():
+    """The API routers behind a profiling middleware with debugging on, and a route running one query per car."""
+    app = FastAPI()
+    app.add_middleware(SQLProfilingMiddleware, debug=True, slow_request_ms=0, repeat_threshold=REPEAT_THRESHOLD)
+    app.include_router(cars.router, prefix="/cars")
+    app.include_router(garages.router, prefix="/garages")
+    app.include_router(maintenance.router, prefix="/maintenance")
+
+    @app.get("/car-makes")
+    def car_makes(db: Session = Depends(get_db)):
+        ids = db.scalars(select(Car.id).order_by(Car.id).limit(10)).all()
+        return [db.scalar(select(Car.make).where(Car.id == car_id)) for car_id in ids]
+
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("url", ["/cars/?limit=20", "/garages/?city=Sofia", "/maintenance/?carId=1"])
+def test_statement_header_counts_the_statements_of_the_request(debug_client, seed, statements, caplog, url):
+    seed(3, 40, 300)
+    start = len(statements)
+
+    with caplog.at_level(logging.WARNING, logger=profiling.__name__):
+        response = debug_client.get(url)
+
+    assert response.status_code == 200
+    assert int(response.headers[SQL_STATEMENTS_HEADER]) == len(statements) - start > 0
+    assert float(response.headers[SQL_TIME_HEADER]) >= 0
+    assert response.headers[SQL_REPEATED_HEADER] == "0"
+    assert caplog.records == []
+
+
+def test_repeated_statements_are_flagged(debug_client, seed, caplog):
+    seed(3, 40, 300)
+
+    with caplog.at_level(logging.WARNING, logger=profiling.__name__):
+        response = debug_client.get("/car-makes")
+
+    assert response.status_code == 200
+    # The id query, then one query per car
+    assert response.headers[SQL_STATEMENTS_HEADER] == "11"
+    assert response.headers[SQL_REPEATED_HEADER] == "10"
+    [record] = caplog.records
+    assert record.getMessage().startswith("Repeated statements in GET /car-makes")
+    assert '"count": 10' in record.getMessage()
+
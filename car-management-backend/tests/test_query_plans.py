@@ -0,0 +1,174 @@
+"""
+EXPLAIN QUERY PLAN checks of the hot CRUD queries.
+
+Every case calls a CRUD function against a seeded SQLite database, captures the statements it runs and asserts
+that none of their plans falls back to a full scan of a table, and that the expected indexes drive them. Walks in
+index order are accepted, that is how keyset pages are read. python -m benchmarks.query_plans runs this module.
+"""
+import re
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from app.cruds import car as car_crud
+from app.cruds import garage as garage_crud
+from app.cruds import maintenance as maintenance_crud
+from app.cruds import reports
+from app.cruds.archive import archive_requests
+from app.cruds.utils import encode_cursor
+from app.models.database import Base, engine
+from app.schemas.maintenance import MaintenanceRequestCreate, MaintenanceRequestUpdate
+from benchmarks.fleet import AHEAD_DAYS
+
+GARAGES = 20
+CARS = 1000
+REQUESTS = 8000
+
+# "SCAN cars" reads the whole table, "SCAN cars USING INDEX ..." walks an index in order.
+# Aliases of a table ("garages_1") count as the table.
+FULL_SCAN = re.compile(r"^SCAN (\w+?)(?:_\d+)?$")
+
+# Indexes of the maintenance requests and of their archive
+BY_GARAGE_DATE = "ix_maintenance_requests_garage_id_scheduled_date"
+BY_CAR_DATE = "ix_maintenance_requests_car_id_scheduled_date"
+BY_DATE = "ix_maintenance_requests_scheduled_date_id"
+ARCHIVE_BY_GARAGE_DATE = "ix_maintenance_requests_archive_garage_id_scheduled_date"
+ARCHIVE_BY_CAR_DATE = "ix_maintenance_requests_archive_car_id_scheduled_date"
+ARCHIVE_BY_DATE = "ix_maintenance_requests_archive_scheduled_date_id"
+OCCUPANCY_KEY = "sqlite_autoindex_garage_daily_occupancy_1"
+CARS_OF_GARAGE = "ix_car_garage_association_garage_id_car_id"
+GARAGES_OF_CAR = "sqlite_autoindex_car_garage_association_1"
+
+
+def cases():
+    """(name, call, indexes the plans must use, whether the oldest history is archived first)"""
+    today = date.today()
+    day = today + timedelta(days=7)
+    free_day = today + timedelta(days=AHEAD_DAYS + 10)
+    rows_after = encode_cursor([today - timedelta(days=30), 1000])
+    return [
+        ("is_garage_full", lambda db: maintenance_crud.is_garage_full(db, 3, day), [OCCUPANCY_KEY], False),
+        ("create_maintenance_request", lambda db: maintenance_crud.create_maintenance_request(
+            db, MaintenanceRequestCreate(carId=5, garageId=3, serviceType="Brakes", scheduledDate=free_day)
+        ), [], False),
+        ("update_maintenance_request", lambda db: maintenance_crud.update_maintenance_request(
+            db, 1, MaintenanceRequestUpdate(scheduledDate=free_day + timedelta(days=1))
+        ), [OCCUPANCY_KEY], False),
+        ("get_car", lambda db: car_crud.get_car(db, 42), [GARAGES_OF_CAR], False),
+        ("get_cars", lambda db: car_crud.get_cars(db, limit=100, after=encode_cursor([500])), [GARAGES_OF_CAR], False),
+        ("get_cars make", lambda db: car_crud.get_cars(db, make="Volkswagen", limit=100), [GARAGES_OF_CAR], False),
+        ("get_cars garage", lambda db: car_crud.get_cars(db, garage_id=7, limit=100), [CARS_OF_GARAGE], False),
+        ("get_cars years", lambda db: car_crud.get_cars(
+            db, from_year=2000, to_year=2010, limit=100, after=encode_cursor([500])
+        ), [GARAGES_OF_CAR], False),
+        ("search_cars", lambda db: car_crud.search_cars(db, "CB0001", 20), [], False),
+        ("get_garages city", lambda db: garage_crud.get_garages(db, city="Sofia", limit=100), [], False),
+        ("update_garage_cars", lambda db: garage_crud.update_garage_cars(
+            db, 7, attach=list(range(1, 200)), detach=list(range(200, 400))
+        ), [CARS_OF_GARAGE], False),
+        ("get_maintenance_request_rows", lambda db: maintenance_crud.get_maintenance_request_rows(
+            db, limit=100, after=rows_after
+        ), [BY_DATE], False),
+        ("get_maintenance_request_rows garage+range", lambda db: maintenance_crud.get_maintenance_request_rows(
+            db, garage_id=3, start_date=day, end_date=day + timedelta(30), limit=100
+        ), [BY_GARAGE_DATE], False),
+        ("get_maintenance_request_rows car", lambda db: maintenance_crud.get_maintenance_request_rows(
+            db, car_id=42, limit=100
+        ), [BY_CAR_DATE], False),
+        ("get_maintenance_request_rows range", lambda db: maintenance_crud.get_maintenance_request_rows(
+            db, start_date=day, end_date=day + timedelta(7), limit=100
+        ), [BY_DATE], False),
+        ("get_maintenance_requests garage+range", lambda db: maintenance_crud.get_maintenance_requests(
+            db, garage_id=3, start_date=day, end_date=day + timedelta(30)
+        ), [BY_GARAGE_DATE], False),
+        ("monthly_requests_report", lambda db: reports.get_monthly_requests_report(
+            db, [1, 2, 3], today - timedelta(days=90), today
+        ), [BY_GARAGE_DATE], False),
+        ("daily_availability_report", lambda db: reports.get_daily_availability_report(
+            db, 3, day, day + timedelta(30)
+        ), [BY_GARAGE_DATE], False),
+        ("availability_matrix", lambda db: reports.get_availability_matrix(
+            db, "Sofia", day, day + timedelta(30)
+        ), [BY_GARAGE_DATE], False),
+        ("next_available_slots", lambda db: reports.get_next_available_slots(
+            db, "Sofia", today, today + timedelta(365), 20
+        ), [OCCUPANCY_KEY], False),
+        ("archive_requests", lambda db: archive_requests(db, today - timedelta(days=180), batch_size=2000), [BY_DATE], False),
+        ("get_maintenance_request_rows archive", lambda db: maintenance_crud.get_maintenance_request_rows(
+            db, garage_id=3, start_date=today - timedelta(days=240), limit=100
+        ), [BY_GARAGE_DATE, ARCHIVE_BY_GARAGE_DATE, ARCHIVE_BY_DATE], True),
+        ("get_maintenance_request_rows car archive", lambda db: maintenance_crud.get_maintenance_request_rows(
+            db, car_id=42, limit=100
+        ), [BY_CAR_DATE, ARCHIVE_BY_CAR_DATE, ARCHIVE_BY_DATE], True),
+        ("monthly_requests_report archive", lambda db: reports.get_monthly_requests_report(
+            db, [1, 2, 3], today - timedelta(days=365), today
+        ), [BY_GARAGE_DATE, ARCHIVE_BY_GARAGE_DATE], True),
+    ]
+
+
+def plan(statement, parameters):
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        return [row[3] for row in cursor.fetchall()]
+    finally:
+        connection.close()
+
+
+def format_plans(captured) -> str:
+    return "\n".join(
+        f"{' '.join(statement.split())[:160]}\n" + "".join(f"    {detail}\n" for detail in details)
+        for statement, details in captured
+    )
+
+
+@pytest.fixture
+def plans_of(request):
+    """
+    Run a call and return (statement, plan) of the SELECT, UPDATE and DELETE statements it ran.
+    The plans are attached to the test report, pytest -rP shows them for the passing cases.
+    """
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().split(None, 1)[0].upper() in ("SELECT", "UPDATE", "DELETE"):
+            captured.append((statement, parameters))
+
+    def run(call):
+        event.listen(engine, "before_cursor_execute", capture)
+        try:
+            call()
+        finally:
+            event.remove(engine, "before_cursor_execute", capture)
+        result = [(statement, plan(statement, parameters)) for statement, parameters in captured]
+        request.node.add_report_section("call", "query plans", format_plans(result))
+        return result
+
+    return run
+
+
+@pytest.mark.parametrize("name, call, indexes, archived", cases(), ids=[case[0] for case in cases()])
+def test_query_plan(seed, db, plans_of, name, call, indexes, archived):
+    seed(GARAGES, CARS, REQUESTS)
+    if archived:
+        # The listings and reports reaching back past the archive read both tables
+        archive_requests(db, date.today() - timedelta(days=180), batch_size=2000)
+
+    captured = plans_of(lambda: call(db))
+
+    assert captured, "no statement captured"
+    tables = set(Base.metadata.tables)
+    scans = [
+        (match.group(1), " ".join(statement.split()))
+        for statement, details in captured
+        for match in map(FULL_SCAN.match, details)
+        if match and match.group(1) in tables
+    ]
+    assert scans == [], format_plans(captured)
+    details = [detail for _, statement_details in captured for detail in statement_details]
+    for index in indexes:
+        assert any(
+            re.search(rf"USING (COVERING )?INDEX {index}\b", detail) for detail in details
+        ), f"{index} unused\n{format_plans(captured)}"
@@ -0,0 +1,125 @@
+from datetime import date, timedelta
+
+import pytest
+
+from app.cruds import maintenance as maintenance_crud
+from app.cruds.report_cache import ReportCache, etag_matches, report_cache
+from app.models.database import SessionLocal
+from app.schemas.maintenance import MaintenanceRequestCreate
+from benchmarks.fleet import AHEAD_DAYS
+
+GARAGES, CARS, REQUESTS = 3, 40, 300
+
+
+@pytest.fixture
+def fleet(seed):
+    return seed(GARAGES, CARS, REQUESTS)
+
+
+@pytest.fixture
+def free_day():
+    return date.today() + timedelta(days=AHEAD_DAYS + 1)
+
+
+def report_params(garage_id: int, day: date) -> dict:
+    return {"garageId": garage_id, "startMonth": f"{day:%Y-%m}", "endMonth": f"{day:%Y-%m}"}
+
+
+def get_report(client, params, etag=None):
+    return client.get("/maintenance/monthlyRequestsReport", params=params, headers={"If-None-Match": etag} if etag else {})
+
+
+def book(db, fleet, garage_id: int, day: date):
+    car_id = next(link["car_id"] for link in fleet.associations if link["garage_id"] == garage_id)
+    return maintenance_crud.create_maintenance_request(
+        db, MaintenanceRequestCreate(carId=car_id, garageId=garage_id, serviceType="Brakes", scheduledDate=day)
+    )
+
+
+def test_a_matching_etag_is_answered_with_304_without_sql(client, fleet, free_day, statements):
+    params = report_params(1, free_day)
+    first = get_report(client, params)
+    etag = first.headers["ETag"]
+
+    start = len(statements)
+    for header in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+        response = get_report(client, params, header)
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
+        assert response.content == b""
+    assert statements[start:] == []
+
+    response = get_report(client, params, '"other"')
+    assert response.status_code == 200
+    assert response.json() == first.json()
+
+
+def test_a_write_of_this_process_invalidates_the_reports_of_its_garage(client, db, fleet, free_day):
+    params = report_params(1, free_day)
+    first = get_report(client, params)
+    etag = first.headers["ETag"]
+    other_etag = get_report(client, report_params(2, free_day)).headers["ETag"]
+
+    book(db, fleet, 1, free_day)
+
+    response = get_report(client, params, etag)
+    assert response.status_code == 200
+    assert response.json() == [{"yearMonth": f"{free_day:%Y-%m}", "requests": first.json()[0]["requests"] + 1}]
+    assert response.headers["ETag"] != etag
+    # The reports of the other garages are kept
+    assert get_report(client, report_params(2, free_day), other_etag).status_code == 304
+
+
+def test_a_write_of_another_process_is_noticed_at_the_next_check(client, fleet, free_day, monkeypatch):
+    params = report_params(1, free_day)
+    first = get_report(client, params)
+    etag = first.headers["ETag"]
+
+    # Another process writes: the version rows change, the cache of this one is not told
+    with monkeypatch.context() as other_process, SessionLocal() as other_db:
+        other_process.setattr(report_cache, "invalidate", lambda garage_ids: None)
+        book(other_db, fleet, 1, free_day)
+
+    # Served from the cache until the version rows are read again
+    assert get_report(client, params, etag).status_code == 304
+    monkeypatch.setattr(report_cache, "_next_check", 0.0)
+
+    response = get_report(client, params, etag)
+    assert response.status_code == 200
+    assert response.json()[0]["requests"] == first.json()[0]["requests"] + 1
+
+
+def test_a_result_computed_during_a_write_is_not_stored():
+    cache = ReportCache()
+    versions = cache.versions((1,))
+    cache.invalidate([1])
+
+    etag = cache.put("report", (1,), ["stale"], versions)
+
+    assert etag
+    assert cache.get("report") is None
+
+
+def test_entries_expire_and_the_least_recent_is_evicted(monkeypatch):
+    cache = ReportCache(max_entries=2, ttl_seconds=30)
+    for key in ("a", "b"):
+        cache.put(key, (1,), key, cache.versions((1,)))
+    cache.get("a")
+    cache.put("c", (2,), "c", cache.versions((2,)))
+
+    assert cache.get("b") is None
+    assert cache.get("a")[1] == "a"
+    assert cache.get("c")[1] == "c"
+
+    expired = ReportCache(ttl_seconds=-1)
+    expired.put("a", (1,), "a", expired.versions((1,)))
+    assert expired.get("a") is None
+
+
+def test_etag_matching():
+    assert etag_matches('"x-1"', '"x-1"')
+    assert etag_matches('W/"x-1"', '"x-1"')
+    assert etag_matches('"x-2", "x-1"', '"x-1"')
+    assert etag_matches("*", '"x-1"')
+    assert not etag_matches('"x-2"', '"x-1"')
+    assert not etag_matches(None, '"x-1"')
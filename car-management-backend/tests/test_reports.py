@@ -0,0 +1,95 @@
+from collections import Counter
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from app.cruds.occupancy_index import occupancy_index
+from app.models.garage import Garage
+
+GARAGES, CARS, REQUESTS = 5, 200, 2000
+
+
+@pytest.fixture
+def fleet(seed):
+    return seed(GARAGES, CARS, REQUESTS)
+
+
+def matrix(client, monkeypatch, city: str, start: date, end: date, indexed: bool = False):
+    monkeypatch.setattr(occupancy_index, "enabled", indexed)
+    response = client.get("/garages/availabilityMatrix", params={"city": city, "startDate": start.isoformat(), "endDate": end.isoformat()})
+    assert response.status_code == 200
+    return response.json()
+
+
+def next_available(client, monkeypatch, indexed: bool):
+    monkeypatch.setattr(occupancy_index, "enabled", indexed)
+    response = client.get("/maintenance/nextAvailable", params={"city": "Sofia", "count": 100})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_next_available_agrees_with_the_occupancy_index(client, db, monkeypatch, fleet):
+    # The API refuses a capacity of 0, rows written before the check may still hold one
+    closed = next(garage["id"] for garage in fleet.garages if garage["city"] == "Sofia")
+    db.execute(update(Garage).where(Garage.id == closed).values(capacity=0))
+    db.commit()
+
+    slots = next_available(client, monkeypatch, indexed=False)
+
+    assert slots == next_available(client, monkeypatch, indexed=True)
+    # Neither full days nor a garage without capacity are offered
+    assert all(slot["availableCapacity"] > 0 for slot in slots)
+    assert closed not in {slot["garageId"] for slot in slots}
+
+
+def test_availability_matrix_counts_the_requests_of_every_garage_of_the_city(client, monkeypatch, fleet):
+    start = date.today() - timedelta(days=10)
+    end = start + timedelta(days=30)
+    sofia = [garage for garage in fleet.garages if garage["city"] == "Sofia"]
+    counted = Counter(
+        (request["garage_id"], request["scheduled_date"]) for request in fleet.requests if start <= request["scheduled_date"] <= end
+    )
+
+    result = matrix(client, monkeypatch, "Sofia", start, end)
+
+    days = [start + timedelta(days=offset) for offset in range(31)]
+    assert result["dates"] == [day.isoformat() for day in days]
+    assert result["garageIds"] == [garage["id"] for garage in sofia]
+    assert result["capacities"] == [garage["capacity"] for garage in sofia]
+    assert result["requests"] == [[counted[(garage["id"], day)] for day in days] for garage in sofia]
+    assert result["availableCapacity"] == [
+        [max(0, garage["capacity"] - counted[(garage["id"], day)]) for day in days] for garage in sofia
+    ]
+    # A row of the matrix is the daily report of its garage
+    for garage_id, requests, available in zip(result["garageIds"], result["requests"], result["availableCapacity"]):
+        report = client.get("/garages/dailyAvailabilityReport", params={
+            "garageId": garage_id, "startDate": start.isoformat(), "endDate": end.isoformat(),
+        }).json()
+        assert [day["requests"] for day in report] == requests
+        assert [day["availableCapacity"] for day in report] == available
+
+
+def test_availability_matrix_agrees_with_the_occupancy_index(client, monkeypatch, fleet):
+    start, end = date.today(), date.today() + timedelta(days=60)
+    assert matrix(client, monkeypatch, "Sofia", start, end, indexed=True) == matrix(client, monkeypatch, "Sofia", start, end)
+
+
+def test_availability_matrix_matches_the_city_by_word_prefix(client, monkeypatch, fleet):
+    day = date.today()
+    garage = client.post("/garages/", json={"name": "New", "location": "Side Street", "city": "Stara Zagora", "capacity": 4}).json()
+
+    result = matrix(client, monkeypatch, "zag", day, day)
+
+    assert result["garageIds"][-1] == garage["id"]
+    assert result["requests"][-1] == [0]
+    assert result["availableCapacity"][-1] == [4]
+    assert matrix(client, monkeypatch, "Atlantis", day, day) == {
+        "dates": [day.isoformat()], "garageIds": [], "capacities": [], "requests": [], "availableCapacity": [],
+    }
+
+
+@pytest.mark.parametrize("start, end", [("2026-01-10", "2026-01-01"), ("2026-01-01", "2027-01-02"), ("2026-1-1x", "2026-01-02")])
+def test_availability_matrix_rejects_invalid_ranges(client, start, end):
+    response = client.get("/garages/availabilityMatrix", params={"city": "Sofia", "startDate": start, "endDate": end})
+    assert response.status_code == 400
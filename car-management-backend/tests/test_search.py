@@ -0,0 +1,94 @@
+import pytest
+
+from app.cruds.search import match_expression
+
+CARS = [
+    ("Volkswagen", "Golf", "CB0001AB"),
+    ("Volkswagen", "Passat", "CB0002AB"),
+    ("Toyota", "Corolla", "PB1234CT"),
+    ("Ford", "Focus", "CA7777KK"),
+]
+
+
+@pytest.fixture
+def garages(client):
+    return [
+        client.post("/garages/", json={"name": name, "location": "Main Street", "city": city, "capacity": 3}).json()
+        for name, city in [("Central Service", "Sofia"), ("Sea Garden Motors", "Varna"), ("South Park Service", "Sofia")]
+    ]
+
+
+@pytest.fixture
+def cars(client, garages):
+    body = [
+        {"make": make, "model": model, "productionYear": 2018, "licensePlate": plate, "garageIds": [garages[0]["id"]]}
+        for make, model, plate in CARS
+    ]
+    return client.post("/cars/bulk", json=body).json()["created"]
+
+
+def search(client, q: str):
+    response = client.get("/cars/search", params={"q": q})
+    assert response.status_code == 200
+    return [car["licensePlate"] for car in response.json()]
+
+
+def test_match_expression_quotes_every_word():
+    assert match_expression("golf cb0") == '"golf"* AND "cb0"*'
+    assert match_expression("Sof", "city") == 'city : "Sof"*'
+    # FTS5 operators and quotes are words or dropped, never syntax
+    assert match_expression('golf" OR NEAR(x') == '"golf"* AND "OR"* AND "NEAR"* AND "x"*'
+    assert match_expression("!?") == '""'
+
+
+@pytest.mark.parametrize("q, plates", [
+    ("gol", ["CB0001AB"]),
+    ("COROLLA", ["PB1234CT"]),
+    ("pb12", ["PB1234CT"]),
+    ("volks pas", ["CB0002AB"]),
+    ("olf", []),
+    ('Golf" OR "Focus', []),
+    ("*", []),
+])
+def test_search_cars_by_word_prefix(client, cars, q, plates):
+    assert search(client, q) == plates
+
+
+def test_search_cars_ranks_and_limits(client, cars):
+    assert sorted(search(client, "cb")) == ["CB0001AB", "CB0002AB"]
+    assert len(client.get("/cars/search", params={"q": "cb", "limit": 1}).json()) == 1
+    assert client.get("/cars/search", params={"q": ""}).status_code == 422
+
+
+def test_search_index_follows_the_writes(client, cars, garages):
+    golf = cars[0]
+    update = {"make": "Volkswagen", "model": "Tiguan", "productionYear": 2018, "licensePlate": golf["licensePlate"],
+              "garageIds": [garages[0]["id"]]}
+    assert client.put(f"/cars/{golf['id']}", json=update).status_code == 200
+    assert search(client, "golf") == []
+    assert search(client, "tig") == [golf["licensePlate"]]
+
+    assert client.delete(f"/cars/{golf['id']}").status_code == 200
+    assert search(client, "tig") == []
+
+
+def test_car_make_filter_matches_a_prefix(client, cars):
+    response = client.get("/cars/", params={"carMake": "volks"})
+    assert sorted(car["licensePlate"] for car in response.json()) == ["CB0001AB", "CB0002AB"]
+
+
+def test_garage_filters_match_words_of_their_column(client, garages):
+    def names(**params):
+        return [garage["name"] for garage in client.get("/garages/", params=params).json()]
+
+    assert names(city="sof") == ["Central Service", "South Park Service"]
+    assert names(name="serv") == ["Central Service", "South Park Service"]
+    # "Sea" is a word of a name, not of a city
+    assert names(city="sea") == []
+    assert names(city="Sofia", name="south") == ["South Park Service"]
+
+    central = garages[0]
+    update = {"name": "Central Service", "location": "Main Street", "city": "Plovdiv", "capacity": 3}
+    assert client.put(f"/garages/{central['id']}", json=update).status_code == 200
+    assert names(city="sof") == ["South Park Service"]
+    assert names(city="plov") == ["Central Service"]
@@ -0,0 +1,195 @@
+"""
+Exact number of SQL statements per CRUD operation, on a warm garage cache. A change in one of these counts is
+a change of the access pattern: update the expectation deliberately, never loosen it to a bound.
+"""
+from datetime import date, timedelta
+
+import pytest
+
+from app.cruds import car as car_crud
+from app.cruds import garage as garage_crud
+from app.cruds import maintenance as maintenance_crud
+from app.cruds import reports
+from app.cruds.utils import encode_cursor, update_relationship
+from app.models.car import Car
+from app.models.garage import Garage
+from app.schemas.car import CarCreate, CarUpdate
+from app.schemas.garage import GarageCreate, GarageUpdate
+from app.schemas.maintenance import MaintenanceRequestCreate, MaintenanceRequestUpdate, MaintenanceReschedule
+from benchmarks.fleet import AHEAD_DAYS
+
+GARAGES, CARS, REQUESTS = 5, 200, 2000
+
+
+def executed(statements, call):
+    """Run ``call`` and return the statements it ran."""
+    start = len(statements)
+    call()
+    return statements[start:]
+
+
+@pytest.fixture
+def fleet(seed, db):
+    fleet = seed(GARAGES, CARS, REQUESTS)
+    # Warm the garage cache, the first access of a garage adds a SELECT
+    garage_crud.get_garages(db)
+    for garage in fleet.garages:
+        garage_crud.get_garage(db, garage["id"])
+    return fleet
+
+
+@pytest.fixture
+def free_day():
+    # After the seeded bookings, every garage is free
+    return date.today() + timedelta(days=AHEAD_DAYS + 1)
+
+
+def car_body(number: int, garage_ids) -> dict:
+    return {"make": "Skoda", "model": "Fabia", "productionYear": 2019, "licensePlate": f"SC{number:04}", "garageIds": garage_ids}
+
+
+# Reads
+
+
+@pytest.mark.parametrize("filters", [
+    {}, {"make": "Volkswagen"}, {"garage_id": 1}, {"from_year": 2005, "to_year": 2015},
+    {"make": "Volkswagen", "garage_id": 1, "from_year": 2005, "to_year": 2015},
+])
+def test_get_cars(fleet, db, statements, filters):
+    # The page, then the garages of all its cars at once
+    assert len(executed(statements, lambda: car_crud.get_cars(db, limit=100, **filters))) == 2
+
+
+def test_get_cars_next_page(fleet, db, statements):
+    assert len(executed(statements, lambda: car_crud.get_cars(db, limit=100, after=encode_cursor([50])))) == 2
+
+
+def test_get_car(fleet, db, statements):
+    assert len(executed(statements, lambda: car_crud.get_car(db, 1))) == 2
+
+
+def test_search_cars(fleet, db, statements):
+    # The ranked ids from the search index, the cars, their garages
+    assert len(executed(statements, lambda: car_crud.search_cars(db, "Golf", 20))) == 3
+
+
+def test_get_garages_is_cached(fleet, db, statements):
+    assert executed(statements, lambda: garage_crud.get_garages(db)) == []
+    assert executed(statements, lambda: garage_crud.get_garage(db, 1)) == []
+
+
+def test_get_maintenance_request_rows(fleet, db, statements):
+    today = date.today()
+    assert len(executed(statements, lambda: maintenance_crud.get_maintenance_request_rows(
+        db, garage_id=1, start_date=today, end_date=today + timedelta(days=30), limit=100
+    ))) == 1
+    # From the beginning, the empty archive is checked first
+    assert len(executed(statements, lambda: maintenance_crud.get_maintenance_request_rows(db, car_id=1))) == 2
+
+
+def test_get_maintenance_request_row(fleet, db, statements):
+    assert len(executed(statements, lambda: maintenance_crud.get_maintenance_request_row(db, 1))) == 1
+
+
+def test_is_garage_full(fleet, db, statements):
+    assert len(executed(statements, lambda: maintenance_crud.is_garage_full(db, 1, date.today()))) == 1
+
+
+def test_reports(fleet, db, statements):
+    today = date.today()
+    assert len(executed(statements, lambda: reports.get_monthly_requests_report(
+        db, [1, 2, 3], today - timedelta(days=365), today
+    ))) == 2
+    assert len(executed(statements, lambda: reports.get_daily_availability_report(
+        db, 1, today - timedelta(days=15), today + timedelta(days=15)
+    ))) == 1
+    assert len(executed(statements, lambda: reports.get_availability_matrix(db, "Sofia", today, today + timedelta(days=14)))) == 1
+    assert len(executed(statements, lambda: reports.get_next_available_slots(
+        db, "Sofia", today, today + timedelta(days=365), 20
+    ))) == 2
+
+
+# Writes
+
+
+def test_create_car(fleet, db, statements):
+    # Garages, car, links and search index written, then the car read back with its garages
+    assert len(executed(statements, lambda: car_crud.create_car(db, CarCreate(**car_body(1, [1, 2]))))) == 8
+
+
+def test_create_cars(fleet, db, statements):
+    cars = [CarCreate(**car_body(number, [1, 2])) for number in range(50)]
+    # One statement per step for the whole batch
+    assert len(executed(statements, lambda: car_crud.create_cars(db, cars))) == 9
+
+
+def test_update_car(fleet, db, statements):
+    update = CarUpdate(make="Skoda", model="Fabia", productionYear=2019, licensePlate="SC9999", garageIds=[2, 3])
+    assert len(executed(statements, lambda: car_crud.update_car(db, 1, update))) == 10
+
+
+def test_delete_car(fleet, db, statements):
+    car = car_crud.create_car(db, CarCreate(**car_body(1, [1, 2])))
+    assert len(executed(statements, lambda: car_crud.delete_car(db, car.id))) == 4
+
+
+def test_garage_writes(fleet, db, statements):
+    body = {"name": "Ring Road", "location": "1 Ring Road", "city": "Sofia", "capacity": 4}
+    garage = None
+
+    def create():
+        nonlocal garage
+        garage = garage_crud.create_garage(db, GarageCreate(**body))
+
+    assert len(executed(statements, create)) == 6
+    assert len(executed(statements, lambda: garage_crud.update_garage(db, garage.id, GarageUpdate(**dict(body, capacity=6))))) == 7
+    assert len(executed(statements, lambda: garage_crud.delete_garage(db, garage.id))) == 8
+
+
+def test_update_garage_cars(fleet, db, statements):
+    cars = list(range(1, 101))
+    # One INSERT ... SELECT or one DELETE, whatever the number of cars
+    assert len(executed(statements, lambda: garage_crud.update_garage_cars(db, 1, attach=cars, detach=[]))) == 1
+    assert len(executed(statements, lambda: garage_crud.update_garage_cars(db, 1, attach=[], detach=cars))) == 1
+
+
+def test_update_relationship(fleet, db, statements):
+    def relink():
+        update_relationship(db, db.get(Car, 1), "garages", Garage, [2, 3])
+        db.commit()
+
+    assert len(executed(statements, relink)) == 5
+
+
+def test_create_maintenance_request(fleet, db, statements, free_day):
+    request = MaintenanceRequestCreate(carId=1, garageId=1, serviceType="Brakes", scheduledDate=free_day)
+    # The car, the guarded reservation, the INSERT and the report version
+    assert len(executed(statements, lambda: maintenance_crud.create_maintenance_request(db, request))) == 4
+
+
+def test_create_maintenance_requests(fleet, db, statements, free_day):
+    requests = [
+        MaintenanceRequestCreate(carId=car_id, garageId=1 + car_id % GARAGES, serviceType="Brakes", scheduledDate=free_day)
+        for car_id in range(1, 21)
+    ]
+    assert len(executed(statements, lambda: maintenance_crud.create_maintenance_requests(db, requests))) == 8
+
+
+def test_update_maintenance_request(fleet, db, statements, free_day):
+    update = MaintenanceRequestUpdate(scheduledDate=free_day)
+    assert len(executed(statements, lambda: maintenance_crud.update_maintenance_request(db, 1, update))) == 5
+
+
+def test_reschedule_maintenance_requests(fleet, db, statements, free_day):
+    day = min(
+        request["scheduled_date"] for request in fleet.requests
+        if request["garage_id"] == 2 and request["scheduled_date"] > date.today()
+    )
+    reschedule = MaintenanceReschedule(garageId=2, startDate=day, targetDate=free_day)
+    # The same statements whatever the number of requests moved
+    assert len(executed(statements, lambda: maintenance_crud.reschedule_maintenance_requests(db, reschedule))) == 9
+
+
+def test_delete_maintenance_request(fleet, db, statements):
+    # DELETE ... RETURNING, the slot release and the report version
+    assert len(executed(statements, lambda: maintenance_crud.delete_maintenance_request(db, 1))) == 3